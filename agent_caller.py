@@ -1,6 +1,10 @@
 import streamlit as st
-from agent_caller import call_agent
-from firebase_admin import firestore
+from utils.providers import call_agent, call_agents_batch  # re-exported for existing callers
+from utils.response_cache import call_agent_cached
+from utils.admission import ServerBusy, set_caller
+from utils.log_writer import log_event
+from utils.logger import new_request_id
+from config import RESPONSE_CACHE_ROLES, RESPONSE_CACHE_TEMPERATURE
 from datetime import datetime
 
 AGENT_PRESETS = {
@@ -10,26 +14,39 @@ AGENT_PRESETS = {
     "Translator": "Translate the following input to Spanish, but keep any technical terms in English."
 }
 
-st.sidebar.markdown("---")
-agent_role = st.sidebar.selectbox("Select Agent Role", list(AGENT_PRESETS.keys()))
 
-user_input = st.text_area("Enter your prompt here:")
+def render_agent_page():
+    st.sidebar.markdown("---")
+    agent_role = st.sidebar.selectbox("Select Agent Role", list(AGENT_PRESETS.keys()))
 
-if st.button("Submit"):
-    system_prompt = AGENT_PRESETS.get(agent_role, "")
-    full_prompt = f"{system_prompt}\n\n{user_input}" if system_prompt else user_input
-    response = call_agent(provider="OpenAI", prompt=full_prompt, model="gpt-4", api_key="your_api_key", temperature=0.7, top_p=1, tools=None, stream=False)
-    st.write(response)
-    try:
-        db = firestore.client()
+    user_input = st.text_area("Enter your prompt here:")
+
+    if st.button("Submit"):
+        request_id = new_request_id()
         user_email = st.session_state.get("user", {}).get("email", "anonymous")
-        db.collection("ai_logs").add({
+        from utils.auth import user_role  # imported late: auth pulls in firebase_admin
+        set_caller(user_email, user_role(user_email))  # queue this page's model calls as the user's
+        system_prompt = AGENT_PRESETS.get(agent_role, "")
+        # Cached roles run deterministically so a stored answer is one the model would give again.
+        temperature = RESPONSE_CACHE_TEMPERATURE if agent_role in RESPONSE_CACHE_ROLES else 0.7
+        # Render tokens as they arrive; write_stream returns the full text for logging.
+        try:
+            response = st.write_stream(call_agent_cached(role=agent_role, system_prompt=system_prompt, prompt=user_input, provider="OpenAI", model="gpt-4", api_key="your_api_key", temperature=temperature, top_p=1, tools=None, stream=True))
+        except ServerBusy as e:
+            st.warning(f"⏳ The assistant is busy, retry in {e.retry_after} s.")
+            return
+        # Queued for a batched background write; never stalls the page.
+        log_event("ai_logs", {
             "user": user_email,
             "prompt": user_input,
             "role": agent_role,
             "model": "gpt-4",
             "response_length": len(response) if response else 0,
+            "request_id": request_id,
             "timestamp": datetime.utcnow().isoformat()
         })
-    except Exception as e:
-        st.warning(f"Logging failed: {e}")
\ No newline at end of file
+
+
+# Streamlit runs pages as __main__; importing call_agent from here must not render the page.
+if __name__ == "__main__":
+    render_agent_page()
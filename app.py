@@ -3,7 +3,8 @@
 import streamlit as st
 import pyrebase
 from firebase_admin import firestore
-from utils.firebase_config import db
+from utils.firebase_config import db  # initializes the Firebase app
+from utils.log_writer import log_event
 
 # Firebase Web config (replace with your actual credentials)
 firebase_config = {
@@ -36,14 +37,10 @@ if "user" not in st.session_state:
 user_email = st.session_state["user"]["email"]
 st.sidebar.success(f"👋 Logged in as {user_email}")
 
-try:
-    doc_ref = db.collection("user_sessions").document(user_email).collection("sessions").document()
-    doc_ref.set({
-        "agent": agent_role,
-        "prompt": user_input,
-        "response": response,
-        "model": st.session_state["model"],
-        "timestamp": firestore.SERVER_TIMESTAMP
-    })
-except Exception as e:
-    st.warning(f"⚠️ Firestore logging failed: {e}")
\ No newline at end of file
+log_event(f"user_sessions/{user_email}/sessions", {
+    "agent": agent_role,
+    "prompt": user_input,
+    "response": response,
+    "model": st.session_state["model"],
+    "timestamp": firestore.SERVER_TIMESTAMP
+})
\ No newline at end of file
@@ -0,0 +1,240 @@
+# config.py
+
+import os
+
+# Tool chains for core/agents/chained_agent.py, declared as dependency graphs:
+# each step maps to the steps whose results it needs. Steps with no
+# dependencies start immediately and run concurrently; the rest start as soon
+# as their inputs are ready. A plain list is still accepted and runs as a
+# sequential pipeline, each step feeding the next.
+CHAINS = {
+    "troubleshoot": {
+        "retrieval": [],
+        "code": [],
+        "model": ["retrieval", "code"],
+    },
+    "docs": {
+        "retrieval": [],
+        "model": ["retrieval"],
+    },
+    "code_review": {
+        "code": [],
+        "model": ["code"],
+    },
+}
+
+# Per-step time limits in seconds, counted from when the step starts running;
+# a step that overruns cancels the chain. A step still waiting for a free
+# chain thread after CHAIN_QUEUE_TIMEOUT seconds cancels it too.
+STEP_TIMEOUTS = {
+    "retrieval": 15,
+    "code": 30,
+    "model": 120,
+}
+CHAIN_QUEUE_TIMEOUT = 30
+
+# Cross-request cache for step results, keyed by tool, normalized input and
+# the configuration that affects the result. Tools without a TTL (seconds)
+# are never cached. Set STEP_CACHE_PATH to back the cache with SQLite.
+STEP_CACHE_TTLS = {
+    "retrieval": 600,
+    "code": 3600,
+}
+STEP_CACHE_SIZE = 1024
+STEP_CACHE_PATH = os.getenv("STEP_CACHE_PATH")
+
+# Per-provider limits for utils/providers.py: pooled connections / concurrent
+# requests, request starts per minute (0 = unlimited) and read timeout.
+PROVIDER_LIMITS = {
+    "OpenAI": {"concurrency": 32, "requests_per_minute": 500, "timeout": 120},
+    "Gemini": {"concurrency": 16, "requests_per_minute": 300, "timeout": 120},
+    "HuggingFace": {"concurrency": 8, "requests_per_minute": 60, "timeout": 180},
+    "Custom": {"concurrency": 8, "requests_per_minute": 0, "timeout": 180},
+    "default": {"concurrency": 8, "requests_per_minute": 0, "timeout": 120},
+}
+
+# Response cache in front of call_agent for preset roles (agent_caller.py).
+# Only roles listed here use it, and only for requests without tools or
+# images at or below the role's max_temperature. `similarity` is the cosine
+# threshold for reusing the answer to a near-identical prompt; None limits
+# the role to exact matches. Translator is exact-only: prompts that differ
+# in a number or a negation embed almost identically but translate
+# differently. The agent page calls these roles at RESPONSE_CACHE_TEMPERATURE
+# so their answers are reproducible enough to reuse.
+RESPONSE_CACHE_ROLES = {
+    "Translator": {"max_temperature": 0.2, "similarity": None},
+    "Trainer": {"max_temperature": 0.2, "similarity": 0.95},
+    "MaintenanceBot": {"max_temperature": 0.2, "similarity": None},
+}
+RESPONSE_CACHE_TEMPERATURE = 0.0
+RESPONSE_CACHE_TTL = 6 * 3600
+RESPONSE_CACHE_MAX_ENTRIES = 2000
+
+# Write-behind logging of ai_logs / user_sessions (utils/log_writer.py).
+# Records are committed in Firestore batches of up to LOG_BATCH_SIZE (the
+# Firestore limit is 500) or every LOG_FLUSH_SECONDS, whichever comes first.
+# Batches that still fail after retries are spilled to LOG_SPILL_PATH and
+# replayed once Firestore is reachable again.
+LOG_BATCH_SIZE = 500
+LOG_FLUSH_SECONDS = 2.0
+LOG_MAX_RETRIES = 4
+LOG_QUEUE_SIZE = 10000
+LOG_SPILL_PATH = os.getenv("LOG_SPILL_PATH", "logs/firestore_spill.jsonl")
+
+# Columnar copy of ai_logs for reports (tools/export_logs.py, utils/reports.py):
+# Parquet files partitioned by day under ANALYTICS_PATH, plus the export
+# watermark. The export reads Firestore EXPORT_PAGE_SIZE documents at a time.
+ANALYTICS_PATH = os.getenv("ANALYTICS_PATH", "analytics/ai_logs")
+EXPORT_PAGE_SIZE = 1000
+
+# Secrets fetched by utils/secrets.load_secrets() when no keys are given:
+# the environment variable names the app reads. Values are cached in process
+# for SECRET_TTL seconds, then refreshed in the background while the cached
+# value keeps being served. Keys Secret Manager doesn't have are recorded in
+# SECRET_MISSING_PATH (names only) and read from the environment / .env
+# without another RPC for SECRET_MISSING_RECHECK seconds. A refresh that
+# fails for any other reason keeps the cached value and is retried after
+# SECRET_RETRY_SECONDS, doubling on each failure up to SECRET_TTL.
+SECRET_MANIFEST = [
+    "OPENAI_API_KEY",
+    "GEMINI_API_KEY",
+    "HUGGINGFACE_TOKEN",
+    "CUSTOM_API_KEY",
+    "FIREBASE_KEY_JSON",
+]
+SECRET_TTL = 15 * 60
+SECRET_FETCH_WORKERS = 8
+SECRET_MISSING_PATH = os.getenv("SECRET_MISSING_PATH", ".cache/secrets_missing.json")
+SECRET_MISSING_RECHECK = 24 * 3600
+SECRET_RETRY_SECONDS = 5
+
+# Conversation memory (utils/memory_store.py). Each session keeps at most
+# MEMORY_MAX_TURNS turns; once they exceed MEMORY_TOKEN_BUDGET tokens, the
+# oldest are folded into a rolling summary of up to MEMORY_SUMMARY_TOKENS,
+# always keeping the last MEMORY_KEEP_TURNS verbatim. MEMORY_BACKEND is
+# "memory", "file" (JSON under MEMORY_PATH) or "firestore". Summaries are
+# written by MEMORY_SUMMARY_PROVIDER/MODEL when set, else extractively.
+MEMORY_TOKEN_BUDGET = 3000
+MEMORY_SUMMARY_TOKENS = 500
+MEMORY_MAX_TURNS = 64
+MEMORY_KEEP_TURNS = 4
+MEMORY_MAX_SESSIONS = 1000
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "memory")
+MEMORY_PATH = os.getenv("MEMORY_PATH", ".cache/memory")
+MEMORY_SUMMARY_PROVIDER = os.getenv("MEMORY_SUMMARY_PROVIDER", "")
+MEMORY_SUMMARY_MODEL = os.getenv("MEMORY_SUMMARY_MODEL", "")
+
+# Context packing for the chained_agent model step (utils/context_packer.py).
+# Retrieval fetches RETRIEVAL_CANDIDATES chunks; the packer drops chunks at
+# least CONTEXT_DEDUP_THRESHOLD similar (word-shingle Jaccard) to one already
+# kept, then fills the model's budget: CONTEXT_BUDGET_FRACTION of its context
+# window (model_selector.MODEL_CONTEXT_TOKENS), capped at CONTEXT_MAX_TOKENS,
+# minus the prompt and conversation history. Sources earlier in
+# CONTEXT_SOURCES are packed first; chunks within a source go best score first.
+RETRIEVAL_CANDIDATES = 12
+CONTEXT_DEDUP_THRESHOLD = 0.85
+CONTEXT_BUDGET_FRACTION = 0.5
+CONTEXT_MAX_TOKENS = 6000
+CONTEXT_SOURCES = {
+    "code": "Code Analysis",
+    "retrieval": "Relevant Docs",
+}
+
+# Code execution for the chained_agent "code" step (tools/code_interpreter.py).
+# Off unless CODE_EXECUTION=1, and then only ```python fenced blocks in the
+# prompt are run. Workers are fresh interpreters with an empty environment, a
+# temporary working directory and no network; they refuse to start where
+# Linux user namespaces are unavailable, or within CODE_WORKER_START_TIMEOUT
+# seconds. CODE_WORKERS warm workers are kept; each runs a single task and
+# is replaced in the background, so no state passes between users. A task gets
+# CODE_TASK_CPU_SECONDS of CPU, CODE_TASK_WALL_SECONDS of wall-clock time and
+# CODE_TASK_MEMORY_MB of memory above the worker's baseline; output beyond
+# CODE_OUTPUT_LIMIT characters is cut. Up to CODE_QUEUE_SIZE tasks wait for a
+# worker, each at most CODE_QUEUE_TIMEOUT seconds; beyond that calls are
+# rejected as busy.
+CODE_EXECUTION_ENABLED = os.getenv("CODE_EXECUTION", "0") == "1"
+CODE_WORKERS = 2
+CODE_WORKER_START_TIMEOUT = 10
+CODE_TASK_CPU_SECONDS = 5
+CODE_TASK_WALL_SECONDS = 10
+CODE_TASK_MEMORY_MB = 256
+CODE_OUTPUT_LIMIT = 16000
+CODE_QUEUE_SIZE = 16
+CODE_QUEUE_TIMEOUT = 10
+CODE_PRELOAD_MODULES = ["collections", "datetime", "json", "math", "re", "statistics"]
+
+# Tracing (utils/logger.py). Off unless TRACE_ENABLED=1; when off, spans cost
+# a flag check. Spans go to a rotating JSONL file at TRACE_PATH and into
+# in-process latency histograms of the last TRACE_WINDOW samples per span
+# name, which are also served as JSON on TRACE_METRICS_PORT when it is set.
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0") == "1"
+TRACE_PATH = os.getenv("TRACE_PATH", "logs/trace.jsonl")
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUPS = 5
+TRACE_WINDOW = 2048
+TRACE_METRICS_PORT = int(os.getenv("TRACE_METRICS_PORT", "0"))
+
+# Offline benchmark (python -m tools.bench): stub providers with the given
+# latencies, synthetic corpora of BENCH_SIZES vectors of BENCH_DIM, and the
+# chain run with each of BENCH_SESSIONS concurrent sessions; admission
+# control is exercised with BENCH_ADMISSION_SLOTS in-flight calls. Results
+# are written to BENCH_RESULTS_PATH/<commit>.json.
+BENCH_RESULTS_PATH = "bench_results"
+BENCH_SIZES = [1_000, 10_000, 50_000]
+BENCH_DIM = 1536
+BENCH_INDEX_KIND = "flat"
+BENCH_QUERIES = 200
+BENCH_THREADS = 8
+BENCH_SESSIONS = [1, 4, 16]
+BENCH_CHAIN_REQUESTS = 5
+BENCH_EMBED_LATENCY_MS = 20.0
+BENCH_LLM_LATENCY_MS = 300.0
+BENCH_ADMISSION_SLOTS = 4
+
+# Start-up (utils/startup.py). tools/serve.py runs the STARTUP_TASKS prewarm
+# steps (Firebase app, Firestore client, FAISS index, provider pools with a
+# connection open to each STARTUP_PROVIDERS host, tokenizer, code workers,
+# log writer, and imports of STARTUP_PRELOAD_MODULES) before Streamlit binds
+# its port, so Cloud Run routes no traffic to a cold instance. Readiness or
+# the first rendered page slower than its target is reported; past
+# STARTUP_READY_TARGET_MS the server starts anyway while unfinished tasks
+# complete in the background.
+STARTUP_TASKS = os.getenv("STARTUP_TASKS", "secrets,firebase,firestore,modules,retriever,providers,tokenizer,"
+                                            "code_pool,log_writer").split(",")
+STARTUP_PRELOAD_MODULES = ["utils.dashboard_data", "utils.providers", "tools.retrieval", "core.agents.chained_agent"]
+STARTUP_PROVIDERS = ["OpenAI", "Gemini"]
+STARTUP_WORKERS = 8
+STARTUP_READY_TARGET_MS = 15000
+STARTUP_FIRST_RESPONSE_TARGET_MS = 2000
+
+# Admission control for model calls (utils/admission.py). At most
+# ADMISSION_MAX_IN_FLIGHT calls run at once across all sessions; the rest
+# queue fairly, with roles sharing slots by ADMISSION_ROLE_WEIGHTS and users
+# within a role sharing equally. A call is refused as busy when its user has
+# ADMISSION_USER_QUEUE calls waiting or it would wait more than
+# ADMISSION_MAX_WAIT seconds. Emails in ADMIN_EMAIL_DOMAINS have the admin role.
+ADMISSION_MAX_IN_FLIGHT = 24
+ADMISSION_MAX_WAIT = 20.0
+ADMISSION_USER_QUEUE = 4
+ADMISSION_ROLE_WEIGHTS = {"tech": 2, "admin": 1}
+ADMISSION_DEFAULT_ROLE = "tech"
+
+# Threads shared by every chain in the process for running independent steps,
+# enough for each of the chains admission control lets run at once to have
+# all three of its steps (retrieval, code, model) running.
+CHAIN_WORKERS = 3 * ADMISSION_MAX_IN_FLIGHT
+ADMISSION_INITIAL_SERVICE_SECONDS = 5.0
+ADMIN_EMAIL_DOMAINS = ["@gringosgambit.com"]
+
+# Sharded retrieval (tools/shards.py). With RETRIEVAL_SHARDS=1 retrieval
+# (tools/retrieval.py) searches the shard directories under SHARD_ROOT (per
+# tenant or hash-split) from SHARD_WORKERS processes instead of the single
+# live index. A user sees the shared shards plus those of the tenant in their
+# `tenant` ID token claim. A worker that has not answered within
+# SHARD_SEARCH_TIMEOUT seconds is left out of the result. Added or removed
+# shards are picked up every SHARD_RESCAN_SECONDS, by a background rescan.
+SHARDS_ENABLED = os.getenv("RETRIEVAL_SHARDS", "0") == "1"
+SHARD_ROOT = os.getenv("SHARD_ROOT", "tools/vector_index/shards")
+SHARD_WORKERS = min(8, os.cpu_count() or 1)
+SHARD_SEARCH_TIMEOUT = 10.0
+SHARD_RESCAN_SECONDS = 30
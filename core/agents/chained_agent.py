@@ -1,40 +1,258 @@
 # chained_agent.py
 
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 from agent_caller import call_agent
-from tools.retrieval import run_retrieval
+from tools.retrieval import retrieval_version, retrieve_hits
+from tools.shards import current_tenant
 from tools.code_interpreter import run_code_tool
-from config import CHAINS, TOOL_SCORES
+from utils.context_packer import RETRIEVAL_SEPARATOR, pack_context
+from utils.logger import bind_context, new_request_id, span
+from utils.memory_store import get_memory
+from utils.tokens import count_tokens
+from utils.step_cache import StepCache, step_key
+from config import (CHAINS, CHAIN_QUEUE_TIMEOUT, CHAIN_WORKERS, CONTEXT_SOURCES, RETRIEVAL_CANDIDATES, STEP_CACHE_PATH,
+                    STEP_CACHE_SIZE, STEP_CACHE_TTLS, STEP_TIMEOUTS)
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = get_script_run_ctx = None
+
+# Shared by all chains so concurrent sessions don't each spin up threads.
+_executor = ThreadPoolExecutor(max_workers=CHAIN_WORKERS, thread_name_prefix="chain-step")
+_step_cache = StepCache(STEP_CACHE_TTLS, STEP_CACHE_SIZE, STEP_CACHE_PATH)
+# Steps left running after their chain gave up: "abandoned" counts them all,
+# "running" those still holding a pool thread.
+_abandoned = {"abandoned": 0, "running": 0}
+_abandoned_lock = threading.Lock()
+
+
+class ChainStepTimeout(TimeoutError):
+    """Raised when a chain step overruns its time limit."""
+
+
+def build_graph(chain):
+    """
+    Normalizes a chain declaration to {step: [dependencies]}.
+
+    A dict is taken as-is; a list becomes a sequential pipeline in which each
+    step depends on the one before it.
+    """
+    if isinstance(chain, dict):
+        graph = {step: list(deps) for step, deps in chain.items()}
+    else:
+        graph = {step: ([chain[i - 1]] if i else []) for i, step in enumerate(chain)}
+
+    for step, deps in graph.items():
+        unknown = [dep for dep in deps if dep not in graph]
+        if unknown:
+            raise ValueError(f"Step '{step}' depends on unknown step(s): {', '.join(unknown)}")
+    return graph
+
+
+def run_graph(graph, run_step, timeouts=None, queue_timeout=CHAIN_QUEUE_TIMEOUT):
+    """
+    Runs the steps of `graph` on the shared pool as their dependencies finish.
+
+    `run_step(step, results, deadline)` is called with the results gathered
+    so far and the `time.monotonic()` time its timeout expires (None without
+    one). Independent steps run concurrently, so the chain takes as long as
+    its critical path. A step's timeout counts from when a pool thread starts
+    it, so time spent queued behind other sessions' steps is bounded
+    separately by `queue_timeout`. If a step fails or exceeds either limit,
+    steps not yet started are cancelled and the error is raised.
+
+    A thread cannot be interrupted, so steps already running are abandoned:
+    their results are discarded and they are counted in `chain_stats()`.
+    Steps should pass `deadline` on to whatever they block on (`call_agent`
+    and the code pool accept one) so an abandoned step stops soon after.
+
+    Returns:
+        dict: {step: result} for every step.
+    """
+    timeouts = timeouts or {}
+    results = {}
+    running = {}  # future -> (step, time submitted)
+    started = {}  # step -> time a pool thread picked it up
+    pending = dict(graph)
+    ctx = get_script_run_ctx() if get_script_run_ctx else None
+
+    def submit(step):
+        def task():
+            started[step] = time.monotonic()
+            if ctx is not None:
+                add_script_run_ctx(ctx=ctx)  # let steps use st.* from the pool thread
+            timeout = timeouts.get(step)
+            return run_step(step, dict(results), started[step] + timeout if timeout else None)
+
+        running[_executor.submit(bind_context(task))] = (step, time.monotonic())
+
+    def next_deadline(step, submitted):
+        timeout = timeouts.get(step)
+        if step in started:
+            return started[step] + timeout if timeout else None
+        # Not started yet: it cannot time out before submitted + timeout, so
+        # waking then is early enough to check it once it has started.
+        return min(submitted + queue_timeout, submitted + timeout if timeout else math.inf)
+
+    try:
+        while pending or running:
+            for step, deps in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    del pending[step]
+                    submit(step)
+            if not running:
+                raise ValueError(f"Chain has a dependency cycle among: {', '.join(pending)}")
+
+            deadlines = [deadline for deadline in (next_deadline(*entry) for entry in running.values()) if deadline]
+            wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            done, _ = wait(running, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                step, _ = running.pop(future)
+                results[step] = future.result()
+
+            now = time.monotonic()
+            for future, (step, submitted) in running.items():
+                if future.done():
+                    continue
+                if step not in started:
+                    if now >= submitted + queue_timeout:
+                        raise ChainStepTimeout(f"Chain step '{step}' waited over {queue_timeout}s for a worker")
+                elif timeouts.get(step) and now >= started[step] + timeouts[step]:
+                    raise ChainStepTimeout(f"Chain step '{step}' exceeded {timeouts[step]}s")
+    finally:
+        for future in running:
+            if not future.cancel() and not future.done():
+                _abandon(future)
+
+    return results
+
+
+def _abandon(future):
+    with _abandoned_lock:
+        _abandoned["abandoned"] += 1
+        _abandoned["running"] += 1
+    future.add_done_callback(_abandoned_step_done)
+
+
+def _abandoned_step_done(_future):
+    with _abandoned_lock:
+        _abandoned["running"] -= 1
+
+
+def _stream_into(memory, key, chunks, on_complete=None):
+    """Passes `chunks` through, storing the joined text in memory[key] once the stream ends."""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    memory[key] = "".join(parts)
+    if on_complete:
+        on_complete(memory[key])
+
+
+def _as_text(value):
+    """A step result as text; retrieval hits become one "---"-separated block."""
+    if isinstance(value, list):
+        return RETRIEVAL_SEPARATOR.join(item[0] if isinstance(item, (list, tuple)) else str(item)
+                                        for item in value)
+    return value
+
+
+def step_cache_stats():
+    """Per-tool hit/miss counts of the shared step cache."""
+    return _step_cache.stats()
+
+
+def chain_stats():
+    """Steps abandoned by timed-out or failed chains, and how many still run."""
+    with _abandoned_lock:
+        return dict(_abandoned)
+
+
+def _step_config(tool, tenant=None):
+    """Configuration that changes a step's result and so belongs in its cache key."""
+    if tool == "retrieval":
+        tenant = current_tenant() if tenant is None else tenant
+        return tenant, retrieval_version(tenant)
+    return ()
 
 
 def chained_agent(prompt, model, provider, api_key, mode="default", secrets=None, memory=None,
-                  temperature=0.7, top_p=1.0, tools=None, stream=False, image=None):
+                  temperature=0.7, top_p=1.0, tools=None, stream=False, image=None, step_timeouts=None,
+                  bypass_cache=False, session_id=None, request_id=None, tenant=None):
     """
     Orchestrates a multi-step toolchain based on mode or config.
     Supports chaining, scoring, and shared memory state.
+
+    Chains are dependency graphs (see config.CHAINS): retrieval and code
+    analysis run concurrently and the model step starts once both are done.
+    `step_timeouts` overrides config.STEP_TIMEOUTS per step. Retrieval and
+    code results are shared across requests through the step cache unless
+    `bypass_cache` is set.
+
+    With `stream=True` the model step's text deltas are returned as a
+    generator (for `st.write_stream`) as soon as its inputs are ready;
+    memory["model"] holds the full text once the stream is consumed.
+
+    The model step's context is packed to the model's token budget (see
+    utils/context_packer); memory["context_report"] records the tokens each
+    source contributed.
+
+    With a `session_id`, the model step sees that session's conversation
+    memory (utils/memory_store) and the exchange is recorded into it.
+
+    Spans for each step carry `request_id` (a fresh one if not given), so a
+    chain's trace records can be tied to the page's logs.
+
+    `tenant` selects which retrieval shards the retrieval step searches
+    when sharding is enabled (tools/shards.py); by default the signed-in
+    user's.
     """
-    memory = memory or {}  # Persistent memory store between steps
+    new_request_id(request_id)
+    memory = {} if memory is None else memory  # Persistent memory store between steps
+    conversation = get_memory(session_id, model) if session_id else None
+
+    def remember(response):
+        if conversation is not None and isinstance(response, str):
+            conversation.add_exchange(prompt, response)
+
+    def cached_step_result(tool, input_text, context_memory, deadline=None):
+        if bypass_cache or not _step_cache.caches(tool):
+            return step_result(tool, input_text, context_memory, deadline)
+        key = step_key(tool, input_text, _step_config(tool, tenant))
+        hit, value = _step_cache.get(tool, key)
+        if hit:
+            return value
+        value = step_result(tool, input_text, context_memory, deadline)
+        _step_cache.put(tool, key, value)
+        return value
 
-    def step_result(tool, input_text):
+    def step_result(tool, input_text, context_memory, deadline=None):
         if tool == "retrieval":
-            result = run_retrieval(input_text)
-            memory["retrieval"] = result
-            return result
+            return retrieve_hits(input_text, RETRIEVAL_CANDIDATES, tenant=tenant)
 
         elif tool == "code":
-            result = run_code_tool(input_text)
-            memory["code"] = result
-            return result
+            return run_code_tool(input_text, deadline)
 
         elif tool == "model":
-            # Adjust prompt based on previous context
-            context = ""
-            if "retrieval" in memory:
-                context += f"\n\nRelevant Docs:\n{memory['retrieval']}"
-            if "code" in memory:
-                context += f"\n\nCode Analysis:\n{memory['code']}"
-            full_prompt = f"{input_text}{context}"
-
-            result = call_agent(
+            # Adjust prompt based on previous context, within the model's budget
+            history = conversation.context_window() if conversation is not None else ""
+            packed = pack_context(
+                {source: context_memory[source] for source in CONTEXT_SOURCES if source in context_memory},
+                model, reserved_tokens=count_tokens(input_text, model) + count_tokens(history, model),
+            )
+            memory["context_report"] = packed.report()
+            full_prompt = f"{input_text}{packed.text}"
+            if history:
+                full_prompt = f"{history}\n\nUser: {full_prompt}"
+
+            return call_agent(
                 prompt=full_prompt,
                 model=model,
                 provider=provider,
@@ -46,28 +264,42 @@ def chained_agent(prompt, model, provider, api_key, mode="default", secrets=None
                 stream=stream,
                 image=image,
                 memory_enabled=True,
-                chaining_enabled=False  # prevent recursion
+                chaining_enabled=False,  # prevent recursion
+                deadline=deadline,
             )
-            memory["model"] = result
-            return result
 
         else:
             raise ValueError(f"Unknown tool: {tool}")
 
     # Use pre-defined chain logic
     if mode in CHAINS:
-        chain = CHAINS[mode]
-        current_input = prompt
+        graph = build_graph(CHAINS[mode])
+
+        def run_step(step, results, deadline):
+            deps = graph[step]
+            # A step with a single upstream step consumes its output, as in a
+            # sequential pipeline; otherwise it works from the original prompt.
+            input_text = _as_text(results[deps[0]]) if len(deps) == 1 and step != "model" else prompt
+            with span("chain.step", step=step, mode=mode):
+                return cached_step_result(step, input_text, {**memory, **results}, deadline)
 
-        for step_tool in chain:
-            current_input = step_result(step_tool, current_input)
+        results = run_graph(graph, run_step, {**STEP_TIMEOUTS, **(step_timeouts or {})})
+        if stream and "model" in results and not isinstance(results["model"], str):
+            chunks = results.pop("model")
+            memory.update({step: _as_text(value) for step, value in results.items()})
+            return _stream_into(memory, "model", chunks, on_complete=remember)
+        memory.update({step: _as_text(value) for step, value in results.items()})
+        if "model" in results:
+            remember(results["model"])
 
-        return memory.get("model", current_input)
+        sinks = [step for step in graph if not any(step in deps for deps in graph.values())]
+        return memory.get("model", _as_text(results[sinks[-1]]) if sinks else prompt)
 
     else:
         # Default to single model call if no chain matched
-        return call_agent(
-            prompt=prompt,
+        history = conversation.context_window() if conversation is not None else ""
+        response = call_agent(
+            prompt=f"{history}\n\nUser: {prompt}" if history else prompt,
             model=model,
             provider=provider,
             api_key=api_key,
@@ -77,4 +309,8 @@ def chained_agent(prompt, model, provider, api_key, mode="default", secrets=None
             tools=tools,
             stream=stream,
             image=image
-        )
\ No newline at end of file
+        )
+        if stream and conversation is not None:
+            return _stream_into(memory, "model", response, on_complete=remember)
+        remember(response)
+        return response
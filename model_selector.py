@@ -1,4 +1,5 @@
 import streamlit as st
+from utils.model_router import router
 
 
 # Preset models for each provider
@@ -22,6 +23,32 @@ MODEL_PRESETS = {
 }
 
 
+# Capability tiers for routing: 1 = fast and cheap, 2 = general purpose,
+# 3 = strongest reasoning. Unlisted models count as tier 1.
+MODEL_TIERS = {
+    "gpt-4-0125-preview": 3,
+    "gpt-3.5-turbo": 1,
+    "gemini-pro": 2,
+    "gemini-1.5-pro": 3,
+    "gemini-1.5-flash": 2,
+    "mistralai/Mistral-7B-Instruct-v0.2": 1,
+    "meta-llama/Llama-2-13b-chat-hf": 1,
+}
+
+
+# Context window in tokens, used to size prompt context (utils/context_packer.py).
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4-0125-preview": 128000,
+    "gpt-3.5-turbo": 16385,
+    "gemini-pro": 32760,
+    "gemini-1.5-pro": 1048576,
+    "gemini-1.5-flash": 1048576,
+    "mistralai/Mistral-7B-Instruct-v0.2": 32768,
+    "meta-llama/Llama-2-13b-chat-hf": 4096,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+
+
 def get_provider():
     return st.session_state.get("provider", "OpenAI")
 
@@ -36,16 +63,42 @@ def get_api_key(provider, state=None):
     return state.get(key_name, "")
 
 
+def get_context_tokens(model_id):
+    """Context window of `model_id`, or a conservative default for unknown models."""
+    return MODEL_CONTEXT_TOKENS.get(model_id, DEFAULT_CONTEXT_TOKENS)
+
+
 def get_model_description(provider, model_id):
     """Return model description if known."""
     return MODEL_PRESETS.get(provider, {}).get(model_id, "🔍 Custom or unknown model.")
 
 
+def candidate_models(provider, min_tier=1):
+    """Preset models for `provider` at or above a capability tier."""
+    return [m for m in MODEL_PRESETS.get(provider, {}) if MODEL_TIERS.get(m, 1) >= min_tier]
+
+
+def choose_model(provider, min_tier=1, preferred=None):
+    """Fastest healthy model meeting `min_tier`, per the live router stats."""
+    ranked = router.rank(provider, candidate_models(provider, min_tier), preferred=preferred)
+    return ranked[0] if ranked else None
+
+
 def get_fallback_model(provider, failed_model):
-    models = list(MODEL_PRESETS.get(provider, {}).keys())
-    if failed_model in models:
-        models.remove(failed_model)
-    return models[0] if models else None
+    """Fastest healthy alternative of at least the failed model's tier,
+    else any healthy alternative, else the first other preset."""
+    others = [m for m in MODEL_PRESETS.get(provider, {}) if m != failed_model]
+    tier = MODEL_TIERS.get(failed_model, 1)
+    for pool in ([m for m in others if MODEL_TIERS.get(m, 1) >= tier], others):
+        ranked = router.rank(provider, pool)
+        if ranked:
+            return ranked[0]
+    return others[0] if others else None
+
+
+def router_stats():
+    """Live latency, error-rate and circuit state per (provider, model)."""
+    return router.snapshot()
 
 
 def render_model_selector(provider):
@@ -54,5 +107,9 @@ def render_model_selector(provider):
     labeled_options = [f"{model} – {desc}" for model, desc in model_descriptions.items()]
     selected_label = st.selectbox("Choose model:", labeled_options)
     selected_model = selected_label.split(" – ")[0]
+    live = router.snapshot().get(provider, {}).get(selected_model)
+    if live and live["samples"]:
+        st.caption(f"p50 {live['p50_ms']} ms · p95 {live['p95_ms']} ms · "
+                   f"errors {live['error_rate']:.0%} · circuit {live['circuit']}")
     st.session_state["model"] = selected_model
     return selected_model
\ No newline at end of file
@@ -0,0 +1,68 @@
+import streamlit as st
+import altair as alt
+
+from tools.export_logs import export_new_logs
+from utils.auth import require_user, user_role
+from utils.reports import activity, dataset_version, load_logs, response_length_histogram, \
+    response_length_quantiles, usage_by
+
+# Every user's email and usage is on this page, and exporting reads all of
+# ai_logs: admins only, as on the home dashboard.
+user = require_user()
+if user_role(user["email"]) != "admin":
+    st.error("⛔ Reports & Analytics is only available to admins.")
+    st.stop()
+
+st.title("📊 Reports & Analytics")
+
+
+@st.cache_data(show_spinner=False)
+def _logs(version, start, end):
+    # `version` only keys the cache, so new exports invalidate it.
+    return load_logs(start=start, end=end)
+
+
+col1, col2 = st.columns(2)
+with col1:
+    start = st.date_input("From", value=None)
+with col2:
+    end = st.date_input("To", value=None)
+
+if st.button("🔄 Pull new logs from Firestore"):
+    with st.spinner("Exporting..."):
+        count = export_new_logs()
+    st.success(f"Exported {count} new log entries.")
+
+df = _logs(dataset_version(), start, end)
+if df.empty:
+    st.info("No exported logs yet. Pull new logs from Firestore to build the report data.")
+    st.stop()
+
+m1, m2, m3 = st.columns(3)
+m1.metric("Requests", len(df))
+m2.metric("Users", df["user"].nunique())
+m3.metric("Models", df["model"].nunique())
+
+st.markdown("#### Usage by model")
+st.dataframe(usage_by(df, "model"))
+st.markdown("#### Usage by role")
+st.dataframe(usage_by(df, "role"))
+st.markdown("#### Top users")
+st.dataframe(usage_by(df, "user").head(25))
+
+st.markdown("#### Response length")
+st.dataframe(response_length_quantiles(df, by="model"))
+histogram = response_length_histogram(df)
+st.altair_chart(
+    alt.Chart(histogram).mark_bar().encode(
+        x=alt.X("start", bin="binned", title="Response length"), x2="end", y="count"
+    ),
+    use_container_width=True
+)
+
+st.markdown("#### Daily activity by role")
+daily = activity(df, freq="D", by="role").reset_index().melt("timestamp", var_name="role", value_name="requests")
+st.altair_chart(
+    alt.Chart(daily).mark_line().encode(x="timestamp", y="requests", color="role"),
+    use_container_width=True
+)
@@ -0,0 +1,187 @@
+# tests/test_admission.py
+#
+# Drives utils/admission.AdmissionController directly with threads (or
+# coroutines, for the async path) standing in for model calls: no provider,
+# Streamlit or Firebase is involved.
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.admission import AdmissionController, ServerBusy
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.005)
+
+
+def _queue_call(controller, user, admitted, role="tech"):
+    """Starts a thread that waits for a slot and appends `user` once admitted."""
+    def call():
+        try:
+            controller.acquire(user, role)
+        except ServerBusy:
+            return
+        admitted.append(user)
+
+    thread = threading.Thread(target=call, daemon=True)
+    thread.start()
+    return thread
+
+
+def _queued(controller):
+    return controller.snapshot()["queued"]
+
+
+def test_light_user_is_not_stuck_behind_heavy_user():
+    controller = AdmissionController(max_in_flight=1, max_wait=10, user_queue=10, initial_service_seconds=0.01)
+    controller.acquire("heavy", "tech")  # the heavy user's first call holds the only slot
+    admitted = []
+    for _ in range(3):
+        _queue_call(controller, "heavy", admitted)
+    _wait_until(lambda: _queued(controller) == 3)
+    _queue_call(controller, "light", admitted)
+    _wait_until(lambda: _queued(controller) == 4)
+
+    for served in range(1, 5):
+        controller.release(0.01)
+        _wait_until(lambda: len(admitted) == served)
+    controller.release(0.01)
+
+    # The light user's only call goes second, not after all of heavy's backlog.
+    assert admitted == ["heavy", "light", "heavy", "heavy"]
+    assert controller.snapshot()["in_flight"] == 0
+
+
+def test_roles_share_slots_by_weight():
+    controller = AdmissionController(max_in_flight=1, max_wait=10, user_queue=10, initial_service_seconds=0.01,
+                                     role_weights={"tech": 2, "admin": 1})
+    controller.acquire("holder", "tech")
+    admitted = []
+    for _ in range(4):
+        _queue_call(controller, "admin-user", admitted, role="admin")
+    _wait_until(lambda: _queued(controller) == 4)
+    for _ in range(4):
+        _queue_call(controller, "tech-user", admitted, role="tech")
+    _wait_until(lambda: _queued(controller) == 8)
+
+    for served in range(1, 7):
+        controller.release(0.01)
+        _wait_until(lambda: len(admitted) == served)
+
+    # Technicians weigh 2 : 1, so they get about two of every three slots.
+    assert admitted.count("tech-user") == 4 and admitted.count("admin-user") == 2
+    for _ in range(3):
+        controller.release(0.01)
+
+
+def test_user_queue_cap_sheds_extra_calls():
+    controller = AdmissionController(max_in_flight=1, max_wait=10, user_queue=2, initial_service_seconds=0.01)
+    controller.acquire("other", "tech")
+    admitted = []
+    for _ in range(2):
+        _queue_call(controller, "u", admitted)
+    _wait_until(lambda: _queued(controller) == 2)
+
+    started = time.monotonic()
+    with pytest.raises(ServerBusy) as busy:
+        controller.acquire("u", "tech")
+    assert time.monotonic() - started < 0.5  # refused at once, not after queueing
+    assert "too many of your requests queued" in str(busy.value)
+    assert busy.value.retry_after >= 1
+    assert controller.stats["shed"] == 1
+
+    # Another user is still let into the queue.
+    _queue_call(controller, "v", admitted)
+    _wait_until(lambda: _queued(controller) == 3)
+    for served in range(1, 4):
+        controller.release(0.01)
+        _wait_until(lambda: len(admitted) == served)
+    controller.release(0.01)
+    assert sorted(admitted) == ["u", "u", "v"]
+
+
+def test_estimated_wait_beyond_deadline_is_shed():
+    controller = AdmissionController(max_in_flight=1, max_wait=1, user_queue=10, initial_service_seconds=5)
+    controller.acquire("holder", "tech")
+    with pytest.raises(ServerBusy) as busy:
+        controller.acquire("u", "tech")
+    assert "queue full" in str(busy.value)
+    assert busy.value.retry_after >= 5
+    assert _queued(controller) == 0
+    controller.release()
+
+
+def test_call_queued_past_max_wait_times_out():
+    controller = AdmissionController(max_in_flight=1, max_wait=0.2, user_queue=10, initial_service_seconds=0.01)
+    controller.acquire("holder", "tech")
+
+    started = time.monotonic()
+    with pytest.raises(ServerBusy) as busy:
+        controller.acquire("u", "tech")
+    assert 0.2 <= time.monotonic() - started < 1.0
+    assert "timed out in queue" in str(busy.value)
+    assert controller.stats["timed_out"] == 1
+
+    # The timed-out waiter left the queue, so releasing frees the slot.
+    snapshot = controller.snapshot()
+    assert snapshot["queued"] == 0 and snapshot["queue_depth"] == {}
+    controller.release()
+    assert controller.snapshot()["in_flight"] == 0
+
+
+def test_nested_admission_passes_through():
+    controller = AdmissionController(max_in_flight=1, max_wait=0.2, user_queue=10, initial_service_seconds=0.01)
+    with controller.admit("u", "tech"):
+        with controller.admit("u", "tech"):  # would time out if it queued for the held slot
+            assert controller.snapshot()["in_flight"] == 1
+    assert controller.snapshot()["in_flight"] == 0
+
+
+def test_batch_larger_than_user_queue_waits_instead_of_shedding():
+    controller = AdmissionController(max_in_flight=3, max_wait=0.05, user_queue=2, initial_service_seconds=5)
+    running = []
+    peak = []
+
+    async def item(i):
+        async with controller.admit_async("batcher", "tech", shed=False):
+            running.append(i)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(i)
+        return i
+
+    async def batch():
+        return await asyncio.gather(*(item(i) for i in range(20)))
+
+    # 20 items against 3 slots, a 2-call user queue and an estimate far past
+    # max_wait: every item would be shed or time out if the batch could shed.
+    assert asyncio.run(batch()) == list(range(20))
+    assert max(peak) == 3
+    assert controller.stats["shed"] == 0 and controller.stats["timed_out"] == 0
+    snapshot = controller.snapshot()
+    assert snapshot["in_flight"] == 0 and snapshot["queued"] == 0
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    controller = AdmissionController(max_in_flight=1, max_wait=10, user_queue=10, initial_service_seconds=0.01)
+    controller.acquire("holder", "tech")
+
+    async def cancel_waiter():
+        waiting = asyncio.ensure_future(controller.acquire_async("u", "tech"))
+        await asyncio.sleep(0.02)
+        assert _queued(controller) == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(cancel_waiter())
+    assert _queued(controller) == 0
+    controller.release()
+    assert controller.snapshot()["in_flight"] == 0
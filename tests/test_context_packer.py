@@ -0,0 +1,83 @@
+# tests/test_context_packer.py
+#
+# Packs hand-made step results with utils/context_packer. Assertions are made
+# in terms of utils/tokens counts, so they hold with tiktoken or with the
+# character-based estimate used when no tokenizer is installed.
+
+from config import CONTEXT_BUDGET_FRACTION, CONTEXT_MAX_TOKENS
+from utils.context_packer import MIN_TRUNCATED_TOKENS, context_budget, pack_context
+from utils.tokens import count_tokens
+
+
+def _text(tag, words=40):
+    return " ".join(f"{tag}{i}" for i in range(words))
+
+
+def test_everything_fits_in_source_and_score_order():
+    sources = {
+        "retrieval": [[_text("low"), 0.2], [_text("high"), 0.9]],
+        "code": "print('hi') returns hi",
+    }
+    packed = pack_context(sources, None, budget=10_000)
+
+    text = packed.text
+    assert text.index("Code Analysis:") < text.index("Relevant Docs:")
+    assert text.index("high0") < text.index("low0")
+    assert packed.chunks_by_source == {"retrieval": 2, "code": 1}
+    assert packed.dropped == {"retrieval": 0, "code": 0}
+
+
+def test_lowest_scored_chunks_are_dropped_to_fit_the_budget():
+    chunks = [[_text(f"doc{n}x"), 1.0 - n / 10] for n in range(6)]
+    one_chunk = count_tokens(chunks[0][0])
+    budget = 3 * one_chunk + MIN_TRUNCATED_TOKENS // 2
+
+    packed = pack_context({"retrieval": chunks}, None, budget=budget)
+    report = packed.report()
+    assert report["tokens"] <= budget
+    assert report["chunks_by_source"]["retrieval"] + report["dropped"]["retrieval"] == 6
+    assert report["dropped"]["retrieval"] >= 3
+    assert "doc0x0" in packed.text and "doc5x0" not in packed.text
+
+
+def test_oversized_chunk_is_truncated_when_enough_room_remains():
+    big = _text("big", words=2000)
+    budget = 4 * MIN_TRUNCATED_TOKENS
+
+    packed = pack_context({"retrieval": [[big, 1.0]]}, None, budget=budget)
+    assert packed.chunks_by_source == {"retrieval": 1}
+    assert packed.report()["tokens"] <= budget
+    assert "big0" in packed.text and "big1999" not in packed.text
+
+
+def test_near_duplicates_are_removed_across_sources():
+    shared = _text("same", words=60)
+    sources = {
+        "code": shared,
+        "retrieval": [[shared + " tail", 0.9], [_text("other"), 0.5]],
+    }
+    packed = pack_context(sources, None, budget=10_000)
+    assert packed.duplicates == 1
+    assert packed.chunks_by_source == {"code": 1, "retrieval": 1}
+    assert packed.text.count("same0") == 1
+
+
+def test_retrieval_block_is_split_on_its_separator():
+    block = "\n---\n".join([_text("first"), _text("second"), "  "])
+    packed = pack_context({"retrieval": block}, None, budget=10_000)
+    assert packed.chunks_by_source == {"retrieval": 2}
+    assert packed.text.index("first0") < packed.text.index("second0")
+
+
+def test_empty_budget_keeps_nothing():
+    packed = pack_context({"retrieval": [[_text("a"), 1.0]]}, None, budget=0)
+    assert packed.text == ""
+    assert packed.report()["tokens"] == 0 and packed.dropped == {"retrieval": 1}
+
+
+def test_budget_follows_model_window_and_reserved_tokens():
+    small = context_budget("meta-llama/Llama-2-13b-chat-hf")
+    assert small == int(4096 * CONTEXT_BUDGET_FRACTION)
+    assert context_budget("meta-llama/Llama-2-13b-chat-hf", reserved_tokens=500) == small - 500
+    assert context_budget("gemini-1.5-pro") == CONTEXT_MAX_TOKENS
+    assert context_budget("meta-llama/Llama-2-13b-chat-hf", reserved_tokens=10_000) == 0
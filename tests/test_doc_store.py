@@ -0,0 +1,88 @@
+# tests/test_doc_store.py
+#
+# Exercises tools/doc_store on temporary files: the append-only writer, the
+# tombstones it leaves for deleted ids, and the rewrite that compacts them away.
+
+import os
+
+import numpy as np
+
+from tools.doc_store import RECORD_DTYPE, DocStore, DocStoreWriter, read_records, write_doc_store
+
+
+def _paths(tmp_path):
+    return str(tmp_path / "docs.bin"), str(tmp_path / "docs.idx")
+
+
+def test_fresh_store_maps_ids_to_positions(tmp_path):
+    data_path, index_path = _paths(tmp_path)
+    write_doc_store(["pump manual", "", "vfd fault codes ✓"], data_path, index_path)
+
+    docs = DocStore(data_path, index_path)
+    assert len(docs) == 3
+    assert [docs.get(i) for i in range(3)] == ["pump manual", "", "vfd fault codes ✓"]
+    assert docs.get(3) is None and docs.get(-1) is None
+
+
+def test_tombstone_hides_deleted_ids(tmp_path):
+    data_path, index_path = _paths(tmp_path)
+    write_doc_store(["a", "b", "c"], data_path, index_path)
+    with DocStoreWriter(data_path, index_path) as writer:
+        writer.append(np.array([3, 4]), ["d", "e"])
+        writer.delete(np.array([1, 3]))
+
+    docs = DocStore(data_path, index_path)
+    assert len(docs) == 3
+    assert [docs.get(i) for i in range(5)] == ["a", None, "c", None, "e"]
+    # Deleted texts stay in the data file until the store is rewritten.
+    assert os.path.getsize(data_path) == len("abcde")
+
+
+def test_next_id_never_reuses_deleted_ids(tmp_path):
+    data_path, index_path = _paths(tmp_path)
+    write_doc_store(["a", "b"], data_path, index_path)
+    with DocStoreWriter(data_path, index_path) as writer:
+        writer.delete(np.array([1]))
+        assert writer.next_id() == 2
+
+
+def test_reader_keeps_its_snapshot_while_writer_appends(tmp_path):
+    data_path, index_path = _paths(tmp_path)
+    write_doc_store(["a"], data_path, index_path)
+    docs = DocStore(data_path, index_path)
+    with DocStoreWriter(data_path, index_path) as writer:
+        writer.append(np.array([1]), ["b"])
+        writer.delete(np.array([0]))
+
+    assert docs.get(0) == "a" and docs.get(1) is None
+    reopened = DocStore(data_path, index_path)
+    assert reopened.get(0) is None and reopened.get(1) == "b"
+
+
+def test_torn_record_is_ignored_then_truncated(tmp_path):
+    data_path, index_path = _paths(tmp_path)
+    write_doc_store(["a", "b"], data_path, index_path)
+    with open(index_path, "ab") as f:
+        f.write(b"\x07" * (RECORD_DTYPE.itemsize // 2))  # a writer crashed mid-record
+
+    assert len(DocStore(data_path, index_path)) == 2
+    with DocStoreWriter(data_path, index_path) as writer:
+        writer.append(np.array([2]), ["c"])
+    assert os.path.getsize(index_path) == 3 * RECORD_DTYPE.itemsize
+    assert DocStore(data_path, index_path).get(2) == "c"
+
+
+def test_rewrite_compacts_tombstones(tmp_path):
+    data_path, index_path = _paths(tmp_path)
+    write_doc_store(["keep", "drop", "also keep"], data_path, index_path)
+    with DocStoreWriter(data_path, index_path) as writer:
+        writer.delete(np.array([1]))
+    docs = DocStore(data_path, index_path)
+    live = [docs.get(i) for i in range(3) if docs.get(i) is not None]
+
+    write_doc_store(live, data_path, index_path)
+    records = read_records(index_path)
+    assert (records["length"] >= 0).all()
+    assert os.path.getsize(data_path) == len("keepalso keep")
+    compacted = DocStore(data_path, index_path)
+    assert [compacted.get(i) for i in range(2)] == ["keep", "also keep"]
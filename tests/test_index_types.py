@@ -0,0 +1,35 @@
+# tests/test_index_types.py
+#
+# Round-trips small random indexes through tools/index_types conversions.
+
+import faiss
+import numpy as np
+import pytest
+
+from tools.index_types import build_index, convert_index, extract_vectors
+
+
+def _corpus(n=400, d=8):
+    vectors = np.random.default_rng(0).random((n, d), dtype="float32")
+    ids = np.arange(n, dtype="int64") * 7 + 3  # sparse, like ids left by deletes
+    return vectors, ids
+
+
+@pytest.mark.parametrize("kind", ["flat", "ivf_flat", "hnsw"])
+def test_extract_keeps_ids(kind):
+    vectors, ids = _corpus()
+    index = build_index(kind, vectors, ids, nlist=4)
+    got_vectors, got_ids = extract_vectors(index)
+    assert np.array_equal(got_ids, ids)
+    assert np.allclose(got_vectors, vectors)
+
+
+def test_convert_round_trip_through_ivf(tmp_path):
+    vectors, ids = _corpus()
+    path = str(tmp_path / "faiss.index")
+    faiss.write_index(build_index("hnsw", vectors, ids), path)
+
+    convert_index(path, path, "ivf_flat", nlist=4)
+    convert_index(path, path, "flat")
+    _, found = faiss.read_index(path).search(vectors[:5], 1)
+    assert found[:, 0].tolist() == ids[:5].tolist()
@@ -0,0 +1,122 @@
+# tests/test_ingest.py
+#
+# Runs tools/ingest.Ingestor against a store in a temporary directory with a
+# deterministic stand-in for the embedding call, so no provider is contacted.
+
+import zlib
+
+import faiss
+import numpy as np
+import pytest
+
+import tools.ingest as ingest
+from tools.doc_store import DocStore, write_doc_store
+from tools.ingest import Ingestor, load_id_map
+
+DIM = 8
+
+
+def _fake_embeddings(texts):
+    rows = []
+    for text in texts:
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        rows.append(rng.random(DIM, dtype="float32"))
+    return np.array(rows)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "get_embeddings", _fake_embeddings)
+    paths = {
+        "index_path": str(tmp_path / "faiss.index"),
+        "docs_data_path": str(tmp_path / "docs.bin"),
+        "docs_index_path": str(tmp_path / "docs.idx"),
+        "map_path": str(tmp_path / "docs.map"),
+        "legacy_docs_path": str(tmp_path / "docs.pkl"),
+    }
+    return paths
+
+
+def _texts(store_paths, ids):
+    docs = DocStore(store_paths["docs_data_path"], store_paths["docs_index_path"])
+    return [docs.get(i) for i in ids]
+
+
+def _index_ids(path):
+    index = faiss.read_index(path)
+    return sorted(faiss.vector_to_array(index.id_map).tolist())
+
+
+def test_upsert_assigns_ids_and_records_them(store):
+    with Ingestor(batch_size=2, **store) as ingestor:
+        ingestor.upsert("pump.md", "Prime the pump before starting.")
+        ingestor.upsert("vfd.txt", "Fault F004 means undervoltage.")
+
+    id_map = load_id_map(store["map_path"])
+    assert id_map == {"pump.md": [0], "vfd.txt": [1]}
+    assert _index_ids(store["index_path"]) == [0, 1]
+    assert _texts(store, [0, 1]) == ["Prime the pump before starting.", "Fault F004 means undervoltage."]
+
+
+def test_reupsert_replaces_only_that_documents_chunks(store):
+    with Ingestor(**store) as ingestor:
+        ingestor.upsert("pump.md", "old pump text")
+        ingestor.upsert("vfd.txt", "vfd text")
+    with Ingestor(**store) as ingestor:
+        ingestor.upsert("pump.md", "new pump text")
+        stats = ingestor.stats
+
+    assert stats["deleted_chunks"] == 1
+    id_map = load_id_map(store["map_path"])
+    assert id_map == {"pump.md": [2], "vfd.txt": [1]}
+    assert _index_ids(store["index_path"]) == [1, 2]
+    assert _texts(store, [0, 1, 2]) == [None, "vfd text", "new pump text"]
+
+
+def test_delete_removes_vectors_texts_and_mapping(store):
+    with Ingestor(**store) as ingestor:
+        ingestor.upsert("pump.md", "pump text")
+        ingestor.upsert("vfd.txt", "vfd text")
+    with Ingestor(**store) as ingestor:
+        ingestor.delete("pump.md")
+
+    assert load_id_map(store["map_path"]) == {"vfd.txt": [1]}
+    assert _index_ids(store["index_path"]) == [1]
+    assert _texts(store, [0, 1]) == [None, "vfd text"]
+
+
+def test_long_document_is_chunked_under_consecutive_ids(store):
+    text = " ".join(f"word{i}" for i in range(600))
+    with Ingestor(batch_size=3, **store) as ingestor:
+        ingestor.upsert("manual.md", text)
+        stats = ingestor.stats
+
+    ids = load_id_map(store["map_path"])["manual.md"]
+    assert stats["chunks"] == len(ids) > 1
+    assert ids == list(range(len(ids)))
+    assert _index_ids(store["index_path"]) == ids
+
+
+def test_legacy_positional_index_keeps_its_ids(store):
+    write_doc_store(["legacy a", "legacy b"], store["docs_data_path"], store["docs_index_path"])
+    legacy = faiss.IndexFlatL2(DIM)
+    legacy.add(_fake_embeddings(["legacy a", "legacy b"]))
+    faiss.write_index(legacy, store["index_path"])
+
+    with Ingestor(**store) as ingestor:
+        ingestor.upsert("new.md", "new text")
+
+    assert load_id_map(store["map_path"]) == {"new.md": [2]}
+    assert _index_ids(store["index_path"]) == [0, 1, 2]
+    assert _texts(store, [0, 1, 2]) == ["legacy a", "legacy b", "new text"]
+
+
+def test_failed_ingest_does_not_commit(store):
+    with pytest.raises(RuntimeError):
+        with Ingestor(**store) as ingestor:
+            ingestor.upsert("pump.md", "pump text")
+            raise RuntimeError("interrupted")
+
+    assert load_id_map(store["map_path"]) == {}
+    with pytest.raises(RuntimeError):
+        faiss.read_index(store["index_path"])
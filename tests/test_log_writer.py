@@ -0,0 +1,98 @@
+# tests/test_log_writer.py
+#
+# Drives utils/log_writer.LogWriter against MemoryFirestore: no Firebase
+# project or network is involved.
+
+import json
+import time
+
+import pytest
+
+import utils.log_writer as log_writer
+from utils.log_writer import LogWriter, MemoryFirestore
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(log_writer, "BACKOFF_SECONDS", 0.001)
+
+
+def _writer(store, tmp_path, **kwargs):
+    options = dict(batch_size=3, flush_interval=10, max_retries=2, spill_path=str(tmp_path / "spill.jsonl"))
+    options.update(kwargs)
+    return LogWriter(client_factory=lambda: store, **options)
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.005)
+
+
+def test_records_are_committed_in_batches(tmp_path):
+    store = MemoryFirestore()
+    writer = _writer(store, tmp_path)
+    for n in range(7):
+        writer.log("ai_logs", {"n": n})
+    assert writer.flush(timeout=2)
+
+    assert store.commits == 3  # 3 + 3 + 1
+    assert sorted(data["n"] for data in store.docs.values()) == list(range(7))
+    assert writer.stats["written"] == 7 and writer.stats["batches"] == 3
+    writer.close()
+
+
+def test_partial_batch_is_committed_after_flush_interval(tmp_path):
+    store = MemoryFirestore()
+    writer = _writer(store, tmp_path, batch_size=100, flush_interval=0.05)
+    writer.log("ai_logs", {"n": 1})
+    _wait_until(lambda: store.commits == 1)
+    writer.close()
+
+
+def test_close_drains_the_queue_promptly(tmp_path):
+    store = MemoryFirestore()
+    writer = _writer(store, tmp_path, batch_size=100)
+    for n in range(5):
+        writer.log("user_sessions/a@b.c/sessions", {"n": n}, doc_id=f"s{n}")
+
+    started = time.monotonic()
+    writer.close(timeout=5)
+    assert time.monotonic() - started < 1.0  # not held up by the 10 s flush interval
+    assert sorted(doc_id for _, doc_id in store.docs) == [f"s{n}" for n in range(5)]
+    assert writer.pending() == 0
+
+
+def test_failed_commit_is_retried(tmp_path):
+    store = MemoryFirestore(fail_commits=2)
+    writer = _writer(store, tmp_path)
+    writer.log("ai_logs", {"n": 1})
+    assert writer.flush(timeout=2)
+
+    assert len(store.docs) == 1
+    assert writer.stats["retries"] == 2 and writer.stats["spilled"] == 0
+    writer.close()
+
+
+def test_outage_spills_then_replays_without_duplicates(tmp_path):
+    store = MemoryFirestore(fail_commits=3)  # first attempt plus both retries fail
+    writer = _writer(store, tmp_path)
+    writer.log("ai_logs", {"n": 1})
+    writer.log("ai_logs", {"n": 2}, doc_id="fixed")
+    assert writer.flush(timeout=2)
+
+    assert store.docs == {}
+    spill_path = tmp_path / "spill.jsonl"
+    spilled = [json.loads(line) for line in spill_path.read_text().splitlines()]
+    assert [row["data"]["n"] for row in spilled] == [1, 2]
+    assert spilled[1]["doc_id"] == "fixed"
+
+    writer.log("ai_logs", {"n": 3})  # Firestore is back: this commit triggers the replay
+    assert writer.flush(timeout=2)
+    assert sorted(data["n"] for data in store.docs.values()) == [1, 2, 3]
+    assert ("ai_logs", spilled[0]["doc_id"]) in store.docs and ("ai_logs", "fixed") in store.docs
+    assert writer.stats["replayed"] == 2
+    assert not spill_path.exists()
+    writer.close()
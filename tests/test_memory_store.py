@@ -0,0 +1,92 @@
+# tests/test_memory_store.py
+#
+# Exercises utils/memory_store.ConversationMemory with in-process backends and
+# plain-function summarizers; no model is called.
+
+import threading
+
+import utils.memory_store as memory_store
+from utils.memory_store import ConversationMemory, InMemoryBackend, extractive_summary
+
+
+def _words(tag, count=40):
+    return " ".join(f"{tag}{i}" for i in range(count))
+
+
+def test_turns_over_budget_are_folded_into_the_summary():
+    folded = []
+
+    def summarizer(summary, turns, max_tokens):
+        folded.extend(turn.text for turn in turns)
+        return extractive_summary(summary, turns, max_tokens)
+
+    memory = ConversationMemory("s", budget_tokens=100, summary_tokens=50, keep_turns=2, summarizer=summarizer)
+    for n in range(6):
+        memory.add("user", _words(f"t{n}x"))
+
+    assert folded and folded == [_words(f"t{n}x") for n in range(len(folded))]
+    assert len(memory) == 2 and len(folded) == 4
+    assert "Conversation summary:" in memory.context_window()
+
+
+def test_summarizer_runs_without_holding_the_lock():
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_summarizer(summary, turns, max_tokens):
+        entered.set()
+        release.wait(2)
+        return " | ".join(filter(None, [summary] + [turn.text for turn in turns]))
+
+    memory = ConversationMemory("s", max_turns=2, summarizer=slow_summarizer)
+    memory.add("user", "first")
+    memory.add("assistant", "second")
+    adder = threading.Thread(target=memory.add, args=("user", "third"))
+    adder.start()
+    assert entered.wait(2)
+
+    # While the summarizer runs, the session can still be read, and the turn
+    # being folded is still part of its context and saved state.
+    assert "first" in memory.context_window() and "third" in memory.context_window()
+    assert [m["content"] for m in memory.messages()] == ["first", "second", "third"]
+    assert len(memory.state()["turns"]) == 3
+    release.set()
+    adder.join(2)
+
+    memory.add("assistant", "fourth")
+    assert memory.summary == "first | second"
+    assert [turn["text"] for turn in memory.state()["turns"]] == ["third", "fourth"]
+
+
+def test_clear_during_a_fold_discards_it():
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_summarizer(summary, turns, max_tokens):
+        entered.set()
+        release.wait(2)
+        return "stale"
+
+    memory = ConversationMemory("s", max_turns=1, summarizer=slow_summarizer)
+    memory.add("user", "first")
+    adder = threading.Thread(target=memory.add, args=("user", "second"))
+    adder.start()
+    assert entered.wait(2)
+    memory.clear()
+    release.set()
+    adder.join(2)
+    assert memory.summary == "" and len(memory) == 0
+
+
+def test_state_round_trips_through_the_backend():
+    backend = InMemoryBackend()
+    memory = ConversationMemory("s", backend=backend, summarizer=extractive_summary)
+    memory.add_exchange("pump won't prime", "check the foot valve")
+    restored = ConversationMemory("s", backend=backend, summarizer=extractive_summary)
+    assert [m["content"] for m in restored.messages()] == ["pump won't prime", "check the foot valve"]
+
+
+def test_get_memory_counts_with_the_conversation_model(monkeypatch):
+    monkeypatch.setattr(memory_store, "_sessions", memory_store.OrderedDict())
+    monkeypatch.setattr(memory_store, "_backend", InMemoryBackend())
+    assert memory_store.get_memory("a", "gpt-3.5-turbo").model == "gpt-3.5-turbo"
+    assert memory_store.get_memory("a").model == "gpt-3.5-turbo"
+    assert memory_store.get_memory("a", "gemini-pro").model == "gemini-pro"
@@ -0,0 +1,50 @@
+# tests/test_model_routing.py
+#
+# Routes calls through utils/providers with a fresh ModelRouter and a fake
+# acall_agent, so breakers can be opened without contacting a provider.
+
+import asyncio
+
+import pytest
+
+import utils.providers as providers
+from utils.model_router import CONSECUTIVE_FAILURES_TO_OPEN, ModelRouter
+from utils.providers import ProviderError
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    monkeypatch.setattr(providers, "router", ModelRouter())
+    served = []
+
+    async def fake_acall_agent(provider, prompt, model, **kwargs):
+        served.append(model)
+        return f"{model}: ok"
+
+    monkeypatch.setattr(providers, "acall_agent", fake_acall_agent)
+    return served
+
+
+def _open_breaker(provider, model):
+    for _ in range(CONSECUTIVE_FAILURES_TO_OPEN):
+        providers.router.record(provider, model, 1.0, ok=False)
+
+
+def _route(model, min_tier=None):
+    return asyncio.run(providers._acall_routed("OpenAI", "hi", model, min_tier, False))
+
+
+def test_healthy_model_serves_its_own_call(calls):
+    assert _route("gpt-4-0125-preview") == ("gpt-4-0125-preview: ok", "gpt-4-0125-preview")
+
+
+def test_open_tier3_model_does_not_fall_back_to_a_weaker_model(calls):
+    _open_breaker("OpenAI", "gpt-4-0125-preview")
+    with pytest.raises(ProviderError, match="tier 3"):
+        _route("gpt-4-0125-preview")
+    assert calls == []
+
+
+def test_explicit_min_tier_allows_a_weaker_fallback(calls):
+    _open_breaker("OpenAI", "gpt-4-0125-preview")
+    assert _route("gpt-4-0125-preview", min_tier=1) == ("gpt-3.5-turbo: ok", "gpt-3.5-turbo")
@@ -0,0 +1,83 @@
+# tests/test_response_cache.py
+#
+# Drives utils/response_cache with a fake embedder and a stubbed model call,
+# so no provider is contacted.
+
+import numpy as np
+import pytest
+
+import utils.response_cache as response_cache
+from utils.response_cache import ResponseCache, call_agent_cached
+
+
+class FakeEmbedder:
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+
+    def __call__(self, text):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("embedding endpoint down")
+        vector = np.zeros(8, dtype="float32")
+        for word in text.lower().split():
+            vector[hash(word) % 8] += 1
+        return vector
+
+
+@pytest.fixture
+def model_calls(monkeypatch):
+    calls = []
+
+    def fake_call_agent(stream=False, **call):
+        calls.append(call["prompt"])
+        answer = f"answer {len(calls)}"
+        return iter(answer.split(" ")) if stream else answer
+
+    monkeypatch.setattr(response_cache, "call_agent", fake_call_agent)
+    return calls
+
+
+def _ask(cache, role, prompt, stream=False):
+    result = call_agent_cached(role=role, system_prompt="preset", prompt=prompt, provider="OpenAI",
+                               model="gpt-4", temperature=0.0, stream=stream, cache=cache)
+    return "".join(result) if stream else result
+
+
+def test_exact_only_role_never_embeds(model_calls):
+    embed = FakeEmbedder()
+    cache = ResponseCache(embed=embed)
+    assert _ask(cache, "Translator", "translate pump") == "answer 1"
+    assert _ask(cache, "Translator", "translate pump") == "answer 1"
+    assert _ask(cache, "Translator", "translate pump now", stream=True) == "answer2"
+    assert embed.calls == 0
+    assert cache.snapshot_stats()["exact_hits"] == 1
+
+
+def test_semantic_role_reuses_similar_prompt(model_calls):
+    embed = FakeEmbedder()
+    cache = ResponseCache(embed=embed)
+    assert _ask(cache, "Trainer", "how do I prime the pump") == "answer 1"
+    assert _ask(cache, "Trainer", "How do I prime the pump ") == "answer 1"  # same words, same vector
+    assert len(model_calls) == 1
+    assert cache.snapshot_stats()["semantic_hits"] == 1
+
+
+def test_embedding_failure_is_a_miss_and_the_answer_still_returns(model_calls):
+    embed = FakeEmbedder(fail=True)
+    cache = ResponseCache(embed=embed)
+    assert _ask(cache, "Trainer", "prime the pump", stream=True) == "answer1"
+    assert _ask(cache, "Trainer", "prime the pump") == "answer1"  # stored for exact hits
+    assert _ask(cache, "Trainer", "bleed the pump") == "answer 2"
+    stats = cache.snapshot_stats()
+    assert stats["embed_errors"] == 2 and stats["misses"] == 2 and stats["exact_hits"] == 1
+
+
+def test_entries_without_vectors_still_serve_exact_hits(model_calls):
+    embed = FakeEmbedder(fail=True)
+    cache = ResponseCache(embed=embed)
+    partition = cache.partition("OpenAI", "gpt-4", "preset", 0.0)
+    cache.store(partition, "prime the pump", "stored", 1.5)
+    assert cache.lookup(partition, "prime the pump", 0.95) == ("stored", None)
+    assert embed.calls == 0
+    assert cache.snapshot_stats()["saved_seconds"] == 1.5
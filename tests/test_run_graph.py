@@ -0,0 +1,41 @@
+# tests/test_run_graph.py
+#
+# Runs core/agents/chained_agent.run_graph with plain functions as steps.
+
+import time
+
+import pytest
+
+from core.agents.chained_agent import ChainStepTimeout, chain_stats, run_graph
+
+
+def test_dependent_steps_see_upstream_results_and_deadlines():
+    calls = {}
+
+    def step(name, results, deadline):
+        calls[name] = (sorted(results), deadline)
+        return name.upper()
+
+    started = time.monotonic()
+    results = run_graph({"a": [], "b": [], "c": ["a", "b"]}, step, {"c": 5})
+    assert results == {"a": "A", "b": "B", "c": "C"}
+    assert calls["a"] == ([], None)
+    assert calls["c"][0] == ["a", "b"]
+    assert started + 5 <= calls["c"][1] <= time.monotonic() + 5
+
+
+def test_timed_out_step_is_abandoned_and_counted():
+    before = chain_stats()
+
+    def step(name, results, deadline):
+        if name == "slow":
+            time.sleep(max(0.0, deadline - time.monotonic()) + 0.2)  # ignores its deadline
+        return name
+
+    with pytest.raises(ChainStepTimeout, match="'slow' exceeded"):
+        run_graph({"slow": [], "fast": []}, step, {"slow": 0.1})
+    assert chain_stats()["abandoned"] == before["abandoned"] + 1
+    assert chain_stats()["running"] == before["running"] + 1
+
+    time.sleep(0.4)
+    assert chain_stats()["running"] == before["running"]
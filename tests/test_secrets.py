@@ -0,0 +1,116 @@
+# tests/test_secrets.py
+#
+# Drives utils/secrets.SecretLoader with a fake Secret Manager client; no
+# Google Cloud project or credentials are involved.
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import utils.secrets as secrets
+from config import SECRET_MANIFEST
+from utils.secrets import SecretLoader
+
+
+class NotFound(Exception):
+    """Stands in for google.api_core.exceptions.NotFound."""
+
+
+class FakeSecretManager:
+    def __init__(self, values):
+        self.values = dict(values)
+        self.down = False
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def access_secret_version(self, name):
+        key = name.split("/")[3]
+        with self._lock:
+            self.requests.append(key)
+        if self.down:
+            raise ConnectionError("Secret Manager unreachable")
+        if key not in self.values:
+            raise NotFound(name)
+        return SimpleNamespace(payload=SimpleNamespace(data=self.values[key].encode("UTF-8")))
+
+
+@pytest.fixture
+def client():
+    return FakeSecretManager({"OPENAI_API_KEY": "sk-remote", "GEMINI_API_KEY": "gm-remote"})
+
+
+def _loader(client, tmp_path, **kwargs):
+    options = dict(project_id="proj", client_factory=lambda: client, missing_path=str(tmp_path / "missing.json"),
+                   missing_errors=(NotFound,), ttl=60, retry_seconds=0.05)
+    options.update(kwargs)
+    return SecretLoader(**options)
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.005)
+
+
+def test_values_come_from_secret_manager_and_are_cached(client, tmp_path):
+    loader = _loader(client, tmp_path)
+    assert loader.get_many(["OPENAI_API_KEY", "GEMINI_API_KEY"]) == {
+        "OPENAI_API_KEY": "sk-remote", "GEMINI_API_KEY": "gm-remote"}
+    assert loader.get("OPENAI_API_KEY") == "sk-remote"
+    assert sorted(client.requests) == ["GEMINI_API_KEY", "OPENAI_API_KEY"]
+
+
+def test_missing_secret_falls_back_to_env_and_is_remembered(client, tmp_path, monkeypatch):
+    monkeypatch.setenv("HUGGINGFACE_TOKEN", "hf-env")
+    monkeypatch.delenv("NOT_ANYWHERE", raising=False)
+    loader = _loader(client, tmp_path)
+    assert loader.get("HUGGINGFACE_TOKEN") == "hf-env"
+    assert loader.get("NOT_ANYWHERE") is None
+
+    # A restarted process skips the RPC for keys recorded as missing.
+    client.requests.clear()
+    restarted = _loader(client, tmp_path)
+    assert restarted.get("HUGGINGFACE_TOKEN") == "hf-env"
+    assert client.requests == []
+
+
+def test_missing_secret_is_rechecked_after_recheck_interval(client, tmp_path, monkeypatch):
+    monkeypatch.setenv("HUGGINGFACE_TOKEN", "hf-env")
+    _loader(client, tmp_path).get("HUGGINGFACE_TOKEN")
+    client.values["HUGGINGFACE_TOKEN"] = "hf-remote"
+    assert _loader(client, tmp_path, missing_recheck=0).get("HUGGINGFACE_TOKEN") == "hf-remote"
+
+
+def test_unreachable_secret_manager_uses_env_then_retries(client, tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-env")
+    client.down = True
+    loader = _loader(client, tmp_path)
+    assert loader.get("OPENAI_API_KEY") == "sk-env"
+    assert not (tmp_path / "missing.json").exists()  # an outage is not a missing key
+
+    client.down = False
+    time.sleep(0.06)  # past the first retry delay
+    loader.get("OPENAI_API_KEY")  # serves the env value, refreshes in the background
+    _wait_until(lambda: loader.get("OPENAI_API_KEY") == "sk-remote")
+
+
+def test_failed_refresh_keeps_serving_the_cached_value(client, tmp_path):
+    loader = _loader(client, tmp_path, ttl=0.05)
+    assert loader.get("OPENAI_API_KEY") == "sk-remote"
+    client.down = True
+    time.sleep(0.06)
+    assert loader.get("OPENAI_API_KEY") == "sk-remote"
+    _wait_until(lambda: client.requests.count("OPENAI_API_KEY") >= 2)
+    assert loader.get("OPENAI_API_KEY") == "sk-remote"
+
+
+def test_load_secrets_defaults_to_the_manifest(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(secrets, "_loader", _loader(client, tmp_path))
+    loaded = secrets.load_secrets()
+    assert list(loaded) == list(SECRET_MANIFEST)
+    assert loaded["OPENAI_API_KEY"] == "sk-remote"
+    assert secrets.load_secrets(["GEMINI_API_KEY"]) == {"GEMINI_API_KEY": "gm-remote"}
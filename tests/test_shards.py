@@ -0,0 +1,100 @@
+# tests/test_shards.py
+#
+# Runs tools/shards.ShardedRetriever over small flat shards in a temporary
+# root, and checks that tools/retrieval reports scores the same way with and
+# without shards. No embedding provider is contacted.
+
+import threading
+import time
+
+import faiss
+import numpy as np
+import pytest
+
+import tools.retrieval as retrieval
+from tools.doc_store import write_doc_store
+from tools.retrieval import Retriever
+from tools.shards import ShardedRetriever, _write_meta, shard_paths
+
+DIM = 4
+
+
+def _write_shard(directory, vectors, texts):
+    _write_meta(directory, None)
+    paths = shard_paths(directory)
+    index = faiss.IndexFlatL2(DIM)
+    index.add(np.asarray(vectors, dtype="float32"))
+    faiss.write_index(index, paths["index_path"])
+    write_doc_store(texts, paths["docs_data_path"], paths["docs_index_path"])
+    return paths
+
+
+def _wait_until(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def pool(tmp_path):
+    _write_shard(str(tmp_path / "a"), [[0, 0, 0, 0], [1, 1, 1, 1]], ["a-near", "a-far"])
+    retriever = ShardedRetriever(root=str(tmp_path), workers=1, rescan_seconds=0.05)
+    yield retriever
+    retriever.shutdown()
+
+
+def test_rescan_runs_in_background_and_swaps_in_new_shards(pool, tmp_path):
+    _write_shard(str(tmp_path / "b"), [[0.1, 0, 0, 0]], ["b-near"])
+    opening = threading.Event()
+    release = threading.Event()
+    open_shard = pool._open_shard
+
+    def slow_open(shard, wait=True):
+        opening.set()
+        release.wait(10)
+        return open_shard(shard, wait)
+
+    pool._open_shard = slow_open
+    time.sleep(0.06)
+    started = time.monotonic()
+    hits = pool.search([0, 0, 0, 0], k=3)
+    assert opening.wait(5)
+    # The search neither waited for the rescan nor saw a half-loaded shard.
+    assert time.monotonic() - started < 5
+    assert [text for text, _ in hits] == ["a-near", "a-far"]
+    assert set(pool.shards()) == {"a"}
+
+    release.set()
+    _wait_until(lambda: set(pool.shards()) == {"a", "b"})
+    hits = pool.search([0, 0, 0, 0], k=3)
+    assert [text for text, _ in hits] == ["a-near", "b-near", "a-far"]
+    assert hits[0][1] > hits[1][1] > hits[2][1]  # L2 distances negated: higher is better
+
+
+def test_rescan_drops_removed_shards(pool, tmp_path):
+    _write_shard(str(tmp_path / "b"), [[0.1, 0, 0, 0]], ["b-near"])
+    pool.refresh()
+    assert set(pool.shards()) == {"a", "b"}
+    for name in ("faiss.index", "docs.bin", "docs.idx", "shard.json"):
+        (tmp_path / "b" / name).unlink()
+    (tmp_path / "b").rmdir()
+    pool.refresh()
+    assert set(pool.shards()) == {"a"}
+    assert [text for text, _ in pool.search([0, 0, 0, 0], k=3)] == ["a-near", "a-far"]
+
+
+def test_batch_scores_match_hits_without_shards(tmp_path, monkeypatch):
+    paths = _write_shard(str(tmp_path / "single"), [[0, 0, 0, 0], [1, 1, 1, 1]], ["near", "far"])
+    retriever = Retriever(legacy_docs_path=str(tmp_path / "none.pkl"), **paths)
+    queries = {"pump": [0.1, 0, 0, 0], "vfd": [1, 1, 1, 0.9]}
+    monkeypatch.setattr(retrieval, "SHARDS_ENABLED", False)
+    monkeypatch.setattr(retrieval, "get_retriever", lambda: retriever)
+    monkeypatch.setattr(retrieval, "get_embedding", lambda text: np.asarray(queries[text], dtype="float32"))
+    monkeypatch.setattr(retrieval, "get_embeddings", lambda texts: np.asarray([queries[t] for t in texts]))
+
+    batch = retrieval.retrieve_documents_batch(["pump", "vfd"], k=2)
+    for query, hits in zip(["pump", "vfd"], batch):
+        assert [list(hit) for hit in hits] == retrieval.retrieve_hits(query, k=2)
+        assert hits[0][1] > hits[1][1]
@@ -0,0 +1,82 @@
+# tests/test_step_cache.py
+#
+# Covers utils/step_cache keys and expiry, and the per-tenant retrieval
+# configuration chained_agent folds into them.
+
+import time
+
+import pytest
+
+import core.agents.chained_agent as chained_agent
+from tools.shards import set_tenant
+from utils.step_cache import StepCache, step_key
+
+
+def test_key_ignores_whitespace_and_case_except_for_code():
+    assert step_key("retrieval", "Pump  Priming\n") == step_key("retrieval", "pump priming")
+    assert step_key("code", "print(1)\n") == step_key("code", "print(1)")
+    assert step_key("code", "X = 1") != step_key("code", "x = 1")
+    assert step_key("code", "if x:\n    y()") != step_key("code", "if x:\ny()")
+
+
+def test_key_includes_tenant_and_retrieval_version():
+    base = step_key("retrieval", "pump", ("acme", "v1"))
+    assert step_key("retrieval", "pump", ("acme", "v1")) == base
+    assert step_key("retrieval", "pump", ("globex", "v1")) != base
+    assert step_key("retrieval", "pump", ("acme", "v2")) != base
+    assert step_key("retrieval", "pump") != base
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    current = {"acme": "v1", None: "v0"}
+    monkeypatch.setattr(chained_agent, "retrieval_version", lambda tenant: (tenant, current[tenant]))
+    return current
+
+
+def test_step_config_follows_tenant_and_index_version(versions):
+    assert chained_agent._step_config("retrieval", "acme") == ("acme", ("acme", "v1"))
+    assert chained_agent._step_config("code", "acme") == ()
+
+    first = step_key("retrieval", "pump", chained_agent._step_config("retrieval", "acme"))
+    versions["acme"] = "v2"  # the tenant's index was re-ingested
+    assert step_key("retrieval", "pump", chained_agent._step_config("retrieval", "acme")) != first
+
+
+def test_step_config_defaults_to_the_callers_tenant(versions):
+    set_tenant("acme")
+    try:
+        assert chained_agent._step_config("retrieval") == ("acme", ("acme", "v1"))
+    finally:
+        set_tenant(None)
+    assert chained_agent._step_config("retrieval") == (None, (None, "v0"))
+
+
+def test_entries_expire_and_untimed_tools_are_not_cached():
+    cache = StepCache({"retrieval": 0.05})
+    key = step_key("retrieval", "pump")
+    cache.put("retrieval", key, ["doc"])
+    assert cache.get("retrieval", key) == (True, ["doc"])
+    time.sleep(0.06)
+    assert cache.get("retrieval", key) == (False, None)
+
+    cache.put("model", "k", "answer")
+    assert cache.get("model", "k") == (False, None)
+    assert cache.stats()["retrieval"]["hits"] == 1
+
+
+def test_lru_evicts_oldest_entry():
+    cache = StepCache({"retrieval": 60}, max_entries=2)
+    for name in ("a", "b"):
+        cache.put("retrieval", name, name)
+    cache.get("retrieval", "a")
+    cache.put("retrieval", "c", "c")
+    assert cache.get("retrieval", "b") == (False, None)
+    assert cache.get("retrieval", "a") == (True, "a")
+    assert cache.stats()["retrieval"]["evictions"] == 1
+
+
+def test_sqlite_tier_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "steps.sqlite")
+    StepCache({"retrieval": 60}, path=path).put("retrieval", "k", {"hits": [1, 2]})
+    assert StepCache({"retrieval": 60}, path=path).get("retrieval", "k") == (True, {"hits": [1, 2]})
@@ -0,0 +1,522 @@
+# tools/bench.py
+"""
+Offline performance benchmark.
+
+Runs the retrieval path, the chained agent and admission control against deterministic stub
+providers (no network, no API keys) and synthetic FAISS corpora, and writes
+the results as JSON to bench_results/<commit>.json for comparison across
+commits:
+
+    python -m tools.bench --sizes 1000 10000 --sessions 1 8
+    python -m tools.bench --compare bench_results/<old>.json
+
+Heavy modules (numpy, faiss, the app) are imported inside the functions
+that need them, so the cold-start probe's import timings start from a bare
+interpreter.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+from config import (BENCH_ADMISSION_SLOTS, BENCH_CHAIN_REQUESTS, BENCH_DIM, BENCH_EMBED_LATENCY_MS, BENCH_INDEX_KIND, BENCH_LLM_LATENCY_MS,
+                    BENCH_QUERIES, BENCH_RESULTS_PATH, BENCH_SESSIONS, BENCH_SIZES, BENCH_THREADS)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COLD_START_MODULES = ["utils.providers", "tools.retrieval", "core.agents.chained_agent"]
+HIGHER_IS_BETTER = ("qps", "rps")
+VOCABULARY = ("pump", "valve", "bearing", "motor", "seal", "pressure", "vibration", "temperature", "filter",
+              "belt", "coupling", "alignment", "lubrication", "sensor", "overload", "fault", "reset", "inspect",
+              "replace", "torque", "leak", "noise", "current", "voltage", "compressor", "conveyor", "gearbox")
+QUERIES = ("Pump is vibrating above 7 mm/s after the bearing change",
+           "Conveyor motor trips on overload every few hours",
+           "Compressor discharge temperature keeps rising",
+           "How do I check coupling alignment on the gearbox?",
+           "Hydraulic valve leaks when the pressure is over 150 bar")
+
+
+# --- stub providers ---
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+def stub_vector(text: str, dim: int = BENCH_DIM) -> list[float]:
+    """A deterministic unit vector for `text`."""
+    import numpy as np
+
+    vector = np.random.default_rng(_seed(text)).standard_normal(dim).astype("float32")
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def stub_text(prompt: str, words: int = 120) -> str:
+    """A deterministic response for `prompt`."""
+    rng = random.Random(_seed(prompt))
+    return " ".join(rng.choice(VOCABULARY) if i % 12 else f"Step {i // 12 + 1}:" for i in range(words))
+
+
+@contextlib.contextmanager
+def stub_providers(dim: int = BENCH_DIM, embed_latency_ms: float = BENCH_EMBED_LATENCY_MS,
+                   llm_latency_ms: float = BENCH_LLM_LATENCY_MS, chunks: int = 20):
+    """
+    Swaps the embedding and LLM providers for deterministic stubs.
+
+    Embeddings block for `embed_latency_ms` per request (as the OpenAI
+    client does) and return `stub_vector`s. Model calls wait
+    `llm_latency_ms` on the provider loop and return `stub_text`; streams
+    spread the same latency over `chunks` deltas. Everything above the
+    transport (provider pools, router, chains, memory) runs unchanged.
+    """
+    import asyncio
+
+    import tools.retrieval as retrieval
+    import utils.providers as providers
+
+    def get_embeddings(texts, *args, **kwargs):
+        time.sleep(embed_latency_ms / 1000)
+        return [stub_vector(text, dim) for text in texts]
+
+    def get_embedding(text, *args, **kwargs):
+        return get_embeddings([text])[0]
+
+    async def dispatch(provider, prompt, model, *args):
+        await asyncio.sleep(llm_latency_ms / 1000)
+        return stub_text(prompt)
+
+    async def astream_agent(provider, prompt, model, **kwargs):
+        words = stub_text(prompt).split(" ")
+        step = max(1, len(words) // chunks)
+        for start in range(0, len(words), step):
+            await asyncio.sleep(llm_latency_ms / 1000 / chunks)
+            yield " ".join(words[start:start + step]) + " "
+
+    patches = [(retrieval, "get_embedding", get_embedding), (retrieval, "get_embeddings", get_embeddings),
+               (providers, "_dispatch", dispatch), (providers, "astream_agent", astream_agent)]
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, stub in patches:
+        setattr(module, name, stub)
+    try:
+        yield
+    finally:
+        for module, name, original in originals:
+            setattr(module, name, original)
+
+
+# --- synthetic corpus ---
+
+def synthetic_documents(n: int, seed: int = 0) -> list[str]:
+    """`n` short maintenance-note style documents of varying length."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(40, 160, n)
+    words = rng.integers(0, len(VOCABULARY), int(lengths.sum()))
+    documents, start = [], 0
+    for i, length in enumerate(lengths):
+        body = " ".join(VOCABULARY[w] for w in words[start:start + length])
+        documents.append(f"Work order {i}: {body}.")
+        start += length
+    return documents
+
+
+def build_corpus(root: str, size: int, dim: int = BENCH_DIM, kind: str = BENCH_INDEX_KIND, seed: int = 0) -> dict:
+    """Writes an index and document store of `size` entries under `root`;
+    returns their paths and build stats."""
+    import faiss
+
+    from tools.doc_store import write_doc_store
+    from tools.index_types import build_index, index_memory_bytes, synthetic_corpus
+
+    os.makedirs(root, exist_ok=True)
+    paths = {"index_path": os.path.join(root, "faiss.index"),
+             "docs_data_path": os.path.join(root, "docs.bin"),
+             "docs_index_path": os.path.join(root, "docs.idx")}
+    started = time.perf_counter()
+    index = build_index(kind, synthetic_corpus(size, dim, seed=seed))
+    faiss.write_index(index, paths["index_path"])
+    write_doc_store(synthetic_documents(size, seed), paths["docs_data_path"], paths["docs_index_path"])
+    return {"paths": paths, "build_s": round(time.perf_counter() - started, 2),
+            "index_mb": round(index_memory_bytes(index) / 2**20, 1)}
+
+
+@contextlib.contextmanager
+def use_corpus(paths: dict):
+    """Points the process-wide retriever at a synthetic corpus."""
+    import tools.retrieval as retrieval
+
+    original = retrieval._retriever
+    retrieval._retriever = retrieval.Retriever(legacy_docs_path=os.devnull, **paths)
+    try:
+        yield retrieval._retriever
+    finally:
+        retrieval._retriever = original
+
+
+# --- measurements ---
+
+def latency_summary(latencies_ms) -> dict:
+    import numpy as np
+
+    if not len(latencies_ms):
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3),
+            "mean_ms": round(float(np.mean(latencies_ms)), 3)}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)  # bytes on macOS, KiB on Linux
+
+
+def _queries(n: int) -> list[str]:
+    return [f"{QUERIES[i % len(QUERIES)]} (case {i})" for i in range(n)]
+
+
+def bench_retrieval(paths: dict, queries: int = BENCH_QUERIES, k: int = 5, threads: int = BENCH_THREADS) -> dict:
+    """
+    Single-query latency percentiles and QPS through `retrieve_documents`,
+    QPS with `threads` concurrent callers, and batched QPS through
+    `retrieve_documents_batch`. Expects `stub_providers` to be active.
+    """
+    from tools.retrieval import retrieve_documents, retrieve_documents_batch
+
+    texts = _queries(queries)
+    with use_corpus(paths) as retriever:
+        started = time.perf_counter()
+        retriever.snapshot()
+        load_ms = (time.perf_counter() - started) * 1000
+
+        latencies = []
+        started = time.perf_counter()
+        for text in texts:
+            query_started = time.perf_counter()
+            retrieve_documents(text, k)
+            latencies.append((time.perf_counter() - query_started) * 1000)
+        sequential_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda text: retrieve_documents(text, k), texts))
+        concurrent_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        retrieve_documents_batch(texts, k)
+        batch_s = time.perf_counter() - started
+
+    return {"load_ms": round(load_ms, 1), **latency_summary(latencies), "qps": round(queries / sequential_s, 1),
+            "concurrent_qps": round(queries / concurrent_s, 1), "batch_qps": round(queries / batch_s, 1)}
+
+
+def bench_chain(paths: dict, sessions: int, requests: int = BENCH_CHAIN_REQUESTS, mode: str = "troubleshoot",
+                model: str = "gpt-4-0125-preview", stream: bool = False) -> dict:
+    """
+    End-to-end `chained_agent` latency with `sessions` concurrent sessions,
+    each sending `requests` prompts in turn with its own conversation
+    memory. Caches are bypassed so every request runs every step. Expects
+    `stub_providers` to be active.
+    """
+    import utils.memory_store as memory_store
+    from core.agents.chained_agent import chained_agent
+
+    def run_session(index):
+        latencies, errors = [], 0
+        for n in range(requests):
+            started = time.perf_counter()
+            try:
+                response = chained_agent(f"{QUERIES[(index + n) % len(QUERIES)]} (session {index}, turn {n})",
+                                         model, "OpenAI", "stub-key", mode=mode, stream=stream,
+                                         bypass_cache=True, session_id=f"bench-{index}")
+                if stream:
+                    "".join(response)
+            except Exception as e:
+                errors += 1
+                print(f"[Bench] Chain request failed: {type(e).__name__}: {e}")
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies, errors
+
+    original_backend = memory_store._backend
+    memory_store._backend = memory_store.InMemoryBackend()  # never write bench sessions anywhere
+    try:
+        with use_corpus(paths) as retriever:
+            retriever.snapshot()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=sessions) as pool:
+                outcomes = list(pool.map(run_session, range(sessions)))
+            elapsed = time.perf_counter() - started
+    finally:
+        memory_store._backend = original_backend
+        with memory_store._sessions_lock:
+            for index in range(sessions):
+                memory_store._sessions.pop(f"bench-{index}", None)
+
+    latencies = [ms for session_latencies, _ in outcomes for ms in session_latencies]
+    return {"sessions": sessions, "requests": sessions * requests, "errors": sum(e for _, e in outcomes),
+            **latency_summary(latencies), "rps": round(len(latencies) / elapsed, 2)}
+
+
+def bench_admission(heavy_sessions: int = 8, light_users: int = 4, requests: int = BENCH_CHAIN_REQUESTS,
+                    slots: int = BENCH_ADMISSION_SLOTS, model: str = "gpt-4-0125-preview") -> dict:
+    """
+    Model-call latency for one heavy user running `heavy_sessions`
+    concurrent sessions alongside `light_users` users with one session each,
+    all through `call_agent` with an admission controller of `slots`
+    in-flight calls. With fair queueing the light users' latency stays near
+    one call's. Expects `stub_providers` to be active.
+    """
+    import utils.admission as admission
+    from utils.providers import call_agent
+
+    def run_session(user, index):
+        admission.set_caller(user, "tech")
+        latencies, shed = [], 0
+        for n in range(requests):
+            started = time.perf_counter()
+            try:
+                call_agent("OpenAI", f"{QUERIES[(index + n) % len(QUERIES)]} ({user} {index}.{n})", model,
+                           api_key="stub-key")
+            except admission.ServerBusy:
+                shed += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+        return user, latencies, shed
+
+    sessions = [("heavy", i) for i in range(heavy_sessions)] + [(f"light-{i}", i) for i in range(light_users)]
+    original = admission._controller
+    admission._controller = controller = admission.AdmissionController(max_in_flight=slots)
+    try:
+        with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+            outcomes = list(pool.map(lambda session: run_session(*session), sessions))
+    finally:
+        admission._controller = original
+
+    result = {"slots": slots}
+    for group in ("heavy", "light"):
+        rows = [(latencies, shed) for user, latencies, shed in outcomes if user.startswith(group)]
+        latencies = [ms for session_latencies, _ in rows for ms in session_latencies]
+        result[group] = {**latency_summary(latencies), "shed": sum(shed for _, shed in rows)}
+    snapshot = controller.snapshot()
+    result["wait_p95_ms"] = snapshot["wait_p95_ms"]
+    return result
+
+
+def probe_cold_start(paths: dict, dim: int) -> dict:
+    """Run in a fresh interpreter: import times of the app's entry modules,
+    then the first retrieval, which loads the index."""
+    imports = {}
+    for name in COLD_START_MODULES:
+        started = time.perf_counter()
+        __import__(name)
+        imports[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    from tools.retrieval import retrieve_documents
+
+    with stub_providers(dim=dim, embed_latency_ms=0), use_corpus(paths):
+        started = time.perf_counter()
+        retrieve_documents(QUERIES[0])
+        first_retrieval_ms = (time.perf_counter() - started) * 1000
+    return {"import_ms": imports, "first_retrieval_ms": round(first_retrieval_ms, 1)}
+
+
+def bench_cold_start(paths: dict, dim: int = BENCH_DIM) -> dict:
+    """Cold start in a subprocess: interpreter start to first retrieval result."""
+    command = [sys.executable, "-m", "tools.bench", "--probe-cold-start", json.dumps(paths), "--dim", str(dim)]
+    started = time.perf_counter()
+    completed = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    total_ms = (time.perf_counter() - started) * 1000
+    probe = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {"total_ms": round(total_ms, 1), **probe}
+
+
+# --- results ---
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(params: dict) -> dict:
+    return {
+        "commit": _git("rev-parse", "HEAD") or "unknown",
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": params,
+    }
+
+
+def run_benchmarks(sizes=BENCH_SIZES, sessions=BENCH_SESSIONS, dim=BENCH_DIM, kind=BENCH_INDEX_KIND,
+                   queries=BENCH_QUERIES, threads=BENCH_THREADS, requests=BENCH_CHAIN_REQUESTS,
+                   embed_latency_ms=BENCH_EMBED_LATENCY_MS, llm_latency_ms=BENCH_LLM_LATENCY_MS,
+                   chain=True, admission=True, cold_start=True) -> dict:
+    """
+    The full suite. Retrieval runs at every corpus size; the chain runs on
+    the smallest corpus at each session count; cold start loads the largest.
+    """
+    params = {"sizes": list(sizes), "sessions": list(sessions), "dim": dim, "kind": kind, "queries": queries,
+              "threads": threads, "chain_requests": requests, "embed_latency_ms": embed_latency_ms,
+              "llm_latency_ms": llm_latency_ms}
+    results = {"meta": run_metadata(params), "retrieval": [], "chain": [], "admission": None, "cold_start": None}
+
+    with tempfile.TemporaryDirectory(prefix="bench-corpus-") as root:
+        corpora = {}
+        for size in sizes:
+            print(f"[Bench] Building {kind} corpus of {size} x {dim}")
+            corpora[size] = build_corpus(os.path.join(root, str(size)), size, dim, kind)
+
+        with stub_providers(dim, embed_latency_ms, llm_latency_ms):
+            for size in sizes:
+                print(f"[Bench] Retrieval over {size} documents")
+                row = bench_retrieval(corpora[size]["paths"], queries, threads=threads)
+                results["retrieval"].append({"size": size, "build_s": corpora[size]["build_s"],
+                                             "index_mb": corpora[size]["index_mb"], **row})
+            if chain:
+                for count in sessions:
+                    print(f"[Bench] Chain with {count} concurrent sessions")
+                    results["chain"].append(bench_chain(corpora[min(sizes)]["paths"], count, requests))
+            if admission:
+                print("[Bench] Admission: one heavy user against light users")
+                results["admission"] = bench_admission(requests=requests)
+
+        if cold_start:
+            print("[Bench] Cold start")
+            results["cold_start"] = bench_cold_start(corpora[max(sizes)]["paths"], dim)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def save_results(results: dict, directory: str = BENCH_RESULTS_PATH) -> str:
+    meta = results["meta"]
+    name = meta["commit"][:12] + ("-dirty" if meta["dirty"] else "")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def flatten(results: dict) -> dict:
+    """Comparable metrics as {"retrieval.10000.p95_ms": value, ...}."""
+    metrics = {}
+    for row in results.get("retrieval", []):
+        for key, value in row.items():
+            if key != "size":
+                metrics[f"retrieval.{row['size']}.{key}"] = value
+    for row in results.get("chain", []):
+        for key, value in row.items():
+            if key != "sessions":
+                metrics[f"chain.{row['sessions']}.{key}"] = value
+    for group in ("heavy", "light"):
+        for key, value in ((results.get("admission") or {}).get(group) or {}).items():
+            metrics[f"admission.{group}.{key}"] = value
+    cold = results.get("cold_start") or {}
+    for key, value in cold.items():
+        if isinstance(value, dict):
+            metrics.update({f"cold_start.{key}.{name}": v for name, v in value.items()})
+        else:
+            metrics[f"cold_start.{key}"] = value
+    metrics["peak_rss_mb"] = results.get("peak_rss_mb")
+    return metrics
+
+
+def compare(old: dict, new: dict) -> list[dict]:
+    """Per metric present in both runs: values and relative change; `better`
+    is True/False when the change is an improvement/regression."""
+    old_metrics, new_metrics = flatten(old), flatten(new)
+    rows = []
+    for key, value in new_metrics.items():
+        before = old_metrics.get(key)
+        if not isinstance(value, (int, float)) or not isinstance(before, (int, float)) or isinstance(value, bool):
+            continue
+        change = (value - before) / before if before else None
+        higher_is_better = key.rsplit(".", 1)[-1].endswith(HIGHER_IS_BETTER)
+        better = None if not change else (change > 0) == higher_is_better
+        rows.append({"metric": key, "old": before, "new": value, "change": change, "better": better})
+    return rows
+
+
+def print_comparison(rows, old_meta, new_meta):
+    print(f"Comparing {old_meta['commit'][:12]} -> {new_meta['commit'][:12]}")
+    if old_meta.get("params") != new_meta.get("params"):
+        print("⚠️ The runs used different parameters; differences are not only the code's.")
+    for row in rows:
+        change = "" if row["change"] is None else f"{row['change']:+.1%}"
+        marker = {True: "✅", False: "⚠️", None: ""}[row["better"]]
+        print(f"{row['metric']:<48}{row['old']:>12}{row['new']:>12}{change:>9} {marker}")
+
+
+def print_results(results):
+    for row in results["retrieval"]:
+        print(f"📚 {row['size']:>8} docs  p50 {row['p50_ms']:.2f} ms  p95 {row['p95_ms']:.2f} ms  "
+              f"p99 {row['p99_ms']:.2f} ms  {row['qps']:.0f} QPS ({row['concurrent_qps']:.0f} concurrent, "
+              f"{row['batch_qps']:.0f} batched)")
+    for row in results["chain"]:
+        print(f"🔗 {row['sessions']:>3} sessions  p50 {row['p50_ms']} ms  p95 {row['p95_ms']} ms  "
+              f"p99 {row['p99_ms']} ms  {row['rps']} req/s  {row['errors']} errors")
+    if results.get("admission"):
+        row = results["admission"]
+        print(f"🚦 Admission ({row['slots']} slots)  heavy p95 {row['heavy']['p95_ms']} ms, {row['heavy']['shed']} shed"
+              f"  light p95 {row['light']['p95_ms']} ms, {row['light']['shed']} shed")
+    if results["cold_start"]:
+        cold = results["cold_start"]
+        print(f"🧊 Cold start {cold['total_ms']:.0f} ms (first retrieval {cold['first_retrieval_ms']:.0f} ms)")
+    print(f"📈 Peak RSS {results['peak_rss_mb']} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark with stub providers and synthetic corpora.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=BENCH_SIZES, help="Corpus sizes (documents).")
+    parser.add_argument("--sessions", type=int, nargs="+", default=BENCH_SESSIONS,
+                        help="Concurrent chain sessions to test.")
+    parser.add_argument("--dim", type=int, default=BENCH_DIM)
+    parser.add_argument("--kind", default=BENCH_INDEX_KIND, help="Index kind (see tools/index_types.py).")
+    parser.add_argument("--queries", type=int, default=BENCH_QUERIES)
+    parser.add_argument("--threads", type=int, default=BENCH_THREADS)
+    parser.add_argument("--requests", type=int, default=BENCH_CHAIN_REQUESTS, help="Chain requests per session.")
+    parser.add_argument("--embed-latency-ms", type=float, default=BENCH_EMBED_LATENCY_MS)
+    parser.add_argument("--llm-latency-ms", type=float, default=BENCH_LLM_LATENCY_MS)
+    parser.add_argument("--no-chain", action="store_true")
+    parser.add_argument("--no-admission", action="store_true")
+    parser.add_argument("--no-cold-start", action="store_true")
+    parser.add_argument("--output", default=BENCH_RESULTS_PATH, help="Directory for the results JSON.")
+    parser.add_argument("--compare", metavar="OLD_JSON", help="Compare with an earlier results file.")
+    parser.add_argument("--probe-cold-start", metavar="PATHS_JSON", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe_cold_start:
+        print(json.dumps(probe_cold_start(json.loads(args.probe_cold_start), args.dim)))
+        sys.exit(0)
+
+    results = run_benchmarks(args.sizes, args.sessions, args.dim, args.kind, args.queries, args.threads,
+                             args.requests, args.embed_latency_ms, args.llm_latency_ms,
+                             chain=not args.no_chain, admission=not args.no_admission,
+                             cold_start=not args.no_cold_start)
+    print_results(results)
+    print(f"✅ Results written to {save_results(results, args.output)}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old = json.load(f)
+        print_comparison(compare(old, results), old["meta"], results["meta"])
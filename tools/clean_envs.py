@@ -1,4 +1,7 @@
+import argparse
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Define common env folder names
@@ -9,26 +12,174 @@ ignored_keywords = [
     "node_modules", "CloudStorage", "Trash", ".vscode", ".rustup", ".rbenv", ".pyenv"
 ]
 
+# Scanning and deleting are I/O-bound, so use more threads than cores.
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+
+class EnvMatch:
+    __slots__ = ("path", "size", "files", "error")
+
+    def __init__(self, path, size=0, files=0, error=None):
+        self.path = path
+        self.size = size    # bytes allocated on disk
+        self.files = files
+        self.error = error
+
+
 def is_safe_to_delete(path):
     return not any(keyword in str(path) for keyword in ignored_keywords)
 
-def find_and_delete_envs(base_path):
+
+def _scan_tree(top):
+    """Env directories under `top`, without descending into ignored
+    subtrees or into an env once it has matched."""
+    matches = []
+    stack = [top]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if not entry.is_dir(follow_symlinks=False):
+                            continue
+                    except OSError:
+                        continue
+                    # Every path below an unsafe one is unsafe too, so skip the whole subtree.
+                    if not is_safe_to_delete(entry.path):
+                        continue
+                    if entry.name in env_names:
+                        matches.append(entry.path)
+                    else:
+                        stack.append(entry.path)
+        except OSError:  # unreadable or vanished directory, as os.walk skips them
+            continue
+    return matches
+
+
+def disk_usage(path):
+    """(bytes allocated, file count) for the tree at `path`; symlinks are not followed."""
+    size = files = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                    except OSError:
+                        continue
+                    # st_blocks is what deleting actually frees (sparse files, small files).
+                    size += stat.st_blocks * 512 if hasattr(stat, "st_blocks") else stat.st_size
+                    files += 1
+        except OSError:
+            continue
+    return size, files
+
+
+def scan_envs(base_path, workers=DEFAULT_WORKERS, measure=True):
+    """
+    Finds environment directories under `base_path`.
+
+    Top-level directories are scanned in parallel with os.scandir; ignored
+    subtrees and matched environments are pruned instead of walked. With
+    `measure`, each match's reclaimable size is computed, also in parallel.
+
+    Returns:
+        list[EnvMatch]: Matches, largest first when measured.
+    """
+    base_path = os.fspath(base_path)
+    if not is_safe_to_delete(base_path):
+        return []
+    matches, subtrees = [], []
+    try:
+        with os.scandir(base_path) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_dir(follow_symlinks=False) or not is_safe_to_delete(entry.path):
+                        continue
+                except OSError:
+                    continue
+                if entry.name in env_names:
+                    matches.append(entry.path)
+                else:
+                    subtrees.append(entry.path)
+    except OSError as e:
+        print(f"❌ Cannot scan {base_path}: {e}")
+        return []
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for found in pool.map(_scan_tree, subtrees):
+            matches.extend(found)
+        envs = [EnvMatch(path) for path in sorted(matches)]
+        if measure:
+            for env, (size, files) in zip(envs, pool.map(disk_usage, [env.path for env in envs])):
+                env.size, env.files = size, files
+            envs.sort(key=lambda env: env.size, reverse=True)
+    return envs
+
+
+def _delete(env):
+    try:
+        shutil.rmtree(env.path)
+    except OSError as e:
+        env.error = str(e)
+    return env
+
+
+def delete_envs(envs, workers=DEFAULT_WORKERS):
+    """Removes the matched directories in parallel, in process; failures are
+    recorded on each match's `error`."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_delete, envs))
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def print_report(envs, dry_run):
+    verb = "Would delete" if dry_run else "Deleting"
+    for env in envs:
+        print(f"🗑️ {verb}: {env.path}  ({format_size(env.size)}, {env.files} files)")
+    total = sum(env.size for env in envs)
+    print(f"\n📦 {len(envs)} environment(s), {format_size(total)} reclaimable.")
+
+
+def find_and_delete_envs(base_path, dry_run=False, workers=DEFAULT_WORKERS):
     print(f"🔍 Scanning for environments under {base_path}...\n")
+    envs = scan_envs(base_path, workers)
+    print_report(envs, dry_run)
+    if dry_run:
+        return []
     deleted = []
-    for root, dirs, _ in os.walk(base_path):
-        for d in dirs:
-            if d in env_names:
-                full_path = Path(root) / d
-                if is_safe_to_delete(full_path):
-                    print(f"🗑️ Deleting: {full_path}")
-                    try:
-                        os.system(f'rm -rf "{full_path}"')
-                        deleted.append(str(full_path))
-                    except Exception as e:
-                        print(f"❌ Error deleting {full_path}: {e}")
+    for env in delete_envs(envs, workers):
+        if env.error:
+            print(f"❌ Error deleting {env.path}: {env.error}")
+        else:
+            deleted.append(env.path)
     return deleted
 
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find and delete Python virtual environments.")
+    parser.add_argument("base_path", nargs="?", default=str(Path.home()), help="Directory to scan (default: home).")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be removed and its size.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args(argv)
+
+    deleted_envs = find_and_delete_envs(args.base_path, args.dry_run, args.workers)
+    if args.dry_run:
+        print("\n✅ Dry run: nothing was removed.")
+    else:
+        print(f"\n✅ Done. {len(deleted_envs)} environment(s) removed.")
+
+
 if __name__ == "__main__":
-    home = str(Path.home())
-    deleted_envs = find_and_delete_envs(home)
-    print(f"\n✅ Done. {len(deleted_envs)} environment(s) removed.")
\ No newline at end of file
+    main()
@@ -0,0 +1,263 @@
+# tools/code_interpreter.py
+
+import atexit
+import contextlib
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from config import (CODE_EXECUTION_ENABLED, CODE_OUTPUT_LIMIT, CODE_PRELOAD_MODULES, CODE_QUEUE_SIZE,
+                    CODE_QUEUE_TIMEOUT, CODE_TASK_CPU_SECONDS, CODE_TASK_MEMORY_MB, CODE_TASK_WALL_SECONDS,
+                    CODE_WORKER_START_TIMEOUT, CODE_WORKERS)
+
+FENCED_CODE = re.compile(r"```(?:python|py)[ \t]*\n(.*?)```", re.DOTALL)
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "code_worker.py")
+
+
+class CodePoolBusy(RuntimeError):
+    """Raised when the code pool's queue is full or no worker frees up in time."""
+
+
+class CodeSandboxError(RuntimeError):
+    """Raised when a worker cannot set up its sandbox, e.g. without user namespaces."""
+
+
+class CodeResult:
+    __slots__ = ("ok", "stdout", "stderr", "error", "duration", "truncated")
+
+    def __init__(self, ok, stdout="", stderr="", error=None, duration=0.0, truncated=False):
+        self.ok = ok
+        self.stdout = stdout
+        self.stderr = stderr
+        self.error = error
+        self.duration = duration
+        self.truncated = truncated
+
+
+# --- pool ---
+
+class _Worker:
+    __slots__ = ("process", "conn", "workdir")
+
+    def __init__(self, process, conn, workdir):
+        self.process = process
+        self.conn = conn
+        self.workdir = workdir
+
+
+def _sandbox_env(workdir) -> dict:
+    """The whole environment a worker gets: nothing of the app's (API keys,
+    FIREBASE_KEY_JSON, cloud credentials paths) is passed on."""
+    return {"PATH": os.defpath, "HOME": workdir, "TMPDIR": workdir, "LANG": "C.UTF-8"}
+
+
+class CodeWorkerPool:
+    """
+    Warm worker processes for running untrusted Python snippets.
+
+    Workers are fresh `python -I` interpreters (tools/code_worker.py)
+    started ahead of time with common modules already imported, so a task
+    pays no interpreter start-up. They inherit none of the app's
+    environment, threads or file descriptors beyond their pipe, run in a
+    temporary working directory, and move into their own user and network
+    namespaces before taking tasks, so task code sees no credentials in its
+    environment and cannot reach the network or the metadata server. A
+    worker that cannot do so fails to start with CodeSandboxError.
+
+    Each task gets captured and size-limited output, a CPU-time rlimit, an
+    address-space rlimit and a wall-clock deadline. Workers are single-use:
+    whatever a task leaves behind (patched builtins or modules, threads,
+    files in its working directory) goes away with its process, and a
+    replacement is started in the background so the next caller still gets
+    a warm worker. At most `queue_size` callers wait for a worker; further
+    calls raise CodePoolBusy instead of piling up.
+
+    Files readable by the app's user stay readable to task code; keep
+    credentials out of the image and in Secret Manager.
+    """
+
+    def __init__(self, size=CODE_WORKERS, cpu_seconds=CODE_TASK_CPU_SECONDS,
+                 wall_seconds=CODE_TASK_WALL_SECONDS, memory_mb=CODE_TASK_MEMORY_MB, output_limit=CODE_OUTPUT_LIMIT,
+                 queue_size=CODE_QUEUE_SIZE, queue_timeout=CODE_QUEUE_TIMEOUT,
+                 start_timeout=CODE_WORKER_START_TIMEOUT):
+        self.size = size
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_mb = memory_mb
+        self.output_limit = output_limit
+        self.queue_timeout = queue_timeout
+        self.start_timeout = start_timeout
+        self._idle = queue.Queue()
+        self._admission = threading.BoundedSemaphore(size + queue_size)
+        self._closed = False
+        self.stats = {"tasks": 0, "timeouts": 0, "crashes": 0, "recycled": 0, "rejected": 0}
+        for _ in range(size):
+            self._idle.put(self._start_worker())
+
+    def _start_worker(self) -> _Worker:
+        parent_conn, child_conn = multiprocessing.Pipe()
+        workdir = tempfile.mkdtemp(prefix="code-worker-")
+        args = [str(child_conn.fileno()), str(self.cpu_seconds), str(self.memory_mb), str(self.output_limit)]
+        process = subprocess.Popen(
+            [sys.executable, "-I", WORKER_SCRIPT, *args, *CODE_PRELOAD_MODULES],
+            env=_sandbox_env(workdir), cwd=workdir, pass_fds=(child_conn.fileno(),),
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, start_new_session=True,
+        )
+        child_conn.close()
+        worker = _Worker(process, parent_conn, workdir)
+        try:
+            hello = parent_conn.recv() if parent_conn.poll(self.start_timeout) else {"error": "no reply"}
+        except (EOFError, OSError):
+            hello = {"error": f"exited with code {process.poll()}"}
+        if hello["error"]:
+            self._stop_worker(worker)
+            raise CodeSandboxError(f"Code worker could not start its sandbox: {hello['error']}")
+        return worker
+
+    def _stop_worker(self, worker: _Worker, graceful: bool = False):
+        if graceful and worker.process.poll() is None:
+            with contextlib.suppress(OSError):
+                worker.conn.send(None)
+            with contextlib.suppress(subprocess.TimeoutExpired):
+                worker.process.wait(1)
+        if worker.process.poll() is None:
+            worker.process.kill()
+        with contextlib.suppress(subprocess.TimeoutExpired):
+            worker.process.wait(1)
+        worker.conn.close()
+        shutil.rmtree(worker.workdir, ignore_errors=True)
+
+    def _release(self, worker: _Worker, healthy: bool):
+        """Retires a worker after its task and starts its replacement, off the caller's thread."""
+        if self._closed:
+            self._stop_worker(worker)
+            return
+        threading.Thread(target=self._replace, args=(worker, healthy), name="code-worker-restart",
+                         daemon=True).start()
+
+    def _replace(self, worker: _Worker, healthy: bool):
+        self._stop_worker(worker, graceful=healthy)
+        self.stats["recycled"] += 1
+        try:
+            worker = self._start_worker()
+        except CodeSandboxError as e:
+            print(f"[Code] ⚠️ {e}; pool is one worker short")
+            return
+        if self._closed:
+            self._stop_worker(worker)
+            return
+        self._idle.put(worker)
+
+    def run(self, code: str, deadline: float | None = None) -> CodeResult:
+        """Runs `code` on a worker; raises CodePoolBusy under backpressure.
+        A `deadline` (a `time.monotonic()` value) shortens the queue wait and
+        the wall-clock limit, so a task whose caller gave up is killed."""
+        if self._closed:
+            raise RuntimeError("Code pool is shut down")
+        if not self._admission.acquire(blocking=False):
+            self.stats["rejected"] += 1
+            raise CodePoolBusy("Code execution queue is full")
+        try:
+            try:
+                worker = self._idle.get(timeout=_within(self.queue_timeout, deadline))
+            except queue.Empty:
+                self.stats["rejected"] += 1
+                raise CodePoolBusy(f"No code worker free within {self.queue_timeout}s")
+            return self._run_on(worker, code, _within(self.wall_seconds, deadline))
+        finally:
+            self._admission.release()
+
+    def _run_on(self, worker: _Worker, code: str, wall_seconds: float) -> CodeResult:
+        started = time.perf_counter()
+        self.stats["tasks"] += 1
+        healthy = False
+        try:
+            worker.conn.send(code)
+            if not worker.conn.poll(wall_seconds):
+                self.stats["timeouts"] += 1
+                return CodeResult(False, error=f"Timed out after {wall_seconds:.3g}s",
+                                  duration=time.perf_counter() - started)
+            reply = worker.conn.recv()
+            healthy = True
+            return CodeResult(**reply)
+        except (EOFError, OSError):
+            self.stats["crashes"] += 1
+            with contextlib.suppress(subprocess.TimeoutExpired):
+                worker.process.wait(1)
+            exitcode = worker.process.returncode
+            reason = ("CPU time limit exceeded" if exitcode == -signal.SIGXCPU
+                      else f"Worker exited unexpectedly (code {exitcode})")
+            return CodeResult(False, error=reason, duration=time.perf_counter() - started)
+        finally:
+            self._release(worker, healthy)
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                self._stop_worker(self._idle.get_nowait(), graceful=True)
+            except queue.Empty:
+                break
+
+
+def _within(seconds: float, deadline: float | None) -> float:
+    """`seconds`, cut short to what is left before `deadline`."""
+    if deadline is None:
+        return seconds
+    return max(0.0, min(seconds, deadline - time.monotonic()))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_code_pool() -> CodeWorkerPool:
+    """The shared pool, started on first use (or by `prewarm`)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CodeWorkerPool()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+
+def extract_code(text: str) -> str | None:
+    """The Python in `text`'s ```python fenced blocks, or None. Unfenced text
+    is never run, however much of it parses as Python."""
+    blocks = FENCED_CODE.findall(text or "")
+    return "\n\n".join(block.strip("\n") for block in blocks) if blocks else None
+
+
+def run_code(code: str, deadline: float | None = None) -> CodeResult:
+    return get_code_pool().run(code, deadline)
+
+
+def run_code_tool(input_text: str, deadline: float | None = None) -> str:
+    """Code step for chained_agent: runs the fenced Python in `input_text`
+    and reports its output, or "" when there is none or code execution is
+    disabled (config.CODE_EXECUTION_ENABLED). The run stops at `deadline`
+    (see `CodeWorkerPool.run`)."""
+    code = extract_code(input_text) if CODE_EXECUTION_ENABLED else None
+    if code is None:
+        return ""
+    try:
+        result = run_code(code, deadline)
+    except (CodePoolBusy, CodeSandboxError) as e:
+        return f"Code was not run: {e}"
+
+    lines = [f"Ran in {result.duration * 1000:.0f} ms" + (" (output truncated)" if result.truncated else "")]
+    if result.stdout:
+        lines.append(f"Output:\n{result.stdout.rstrip()}")
+    if result.stderr:
+        lines.append(f"Stderr:\n{result.stderr.rstrip()}")
+    if result.error:
+        lines.append(f"Error:\n{result.error.rstrip()}")
+    return "\n".join(lines)
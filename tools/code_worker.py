@@ -0,0 +1,137 @@
+# tools/code_worker.py
+#
+# Worker process for tools/code_interpreter.py. It is started as a script with
+# `python -I` (no environment variables, user site or repo paths), so it must
+# only import the standard library.
+
+import contextlib
+import ctypes
+import io
+import os
+import signal
+import sys
+import time
+import traceback
+from multiprocessing.connection import Connection
+
+try:
+    import resource
+except ImportError:  # not available on Windows; limits are then wall-clock only
+    resource = None
+
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+
+
+class _BoundedWriter(io.TextIOBase):
+    """Captures writes up to `limit` characters and discards the rest."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.parts = []
+        self.size = 0
+        self.truncated = False
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        room = self.limit - self.size
+        if len(text) > room:
+            self.truncated = True
+            text = text[:max(room, 0)]
+        if text:
+            self.parts.append(text)
+            self.size += len(text)
+        return len(text)
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+
+def _isolate_network():
+    """Moves this process into new user and network namespaces. The only
+    interface left is a downed loopback, so task code cannot reach the
+    network, including the cloud metadata server that hands out credentials."""
+    flags = CLONE_NEWUSER | CLONE_NEWNET
+    if hasattr(os, "unshare"):  # Python 3.12+
+        os.unshare(flags)
+        return
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.unshare(flags) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def _vm_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _limit_memory(memory_mb):
+    """Caps the address space at the worker's warm baseline plus `memory_mb`."""
+    try:
+        baseline = _vm_bytes()
+    except OSError:
+        baseline = 0
+    limit = baseline + memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _limit_cpu(cpu_seconds):
+    """Lets the next task use `cpu_seconds` more CPU; past that the kernel sends SIGXCPU."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime) + cpu_seconds + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, resource.RLIM_INFINITY))
+
+
+def _run_task(code, output_limit):
+    stdout, stderr = _BoundedWriter(output_limit), _BoundedWriter(output_limit)
+    started = time.perf_counter()
+    error = None
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            exec(compile(code, "<code>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+    except MemoryError:
+        error = "MemoryError: task exceeded its memory limit"
+    except BaseException:
+        error = traceback.format_exc(limit=-5)[-output_limit:]
+    return {
+        "ok": error is None, "stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "error": error,
+        "duration": time.perf_counter() - started, "truncated": stdout.truncated or stderr.truncated,
+    }
+
+
+def main(fd, cpu_seconds, memory_mb, output_limit, preload):
+    """Sets up the sandbox, reports {"error": None} (or why it could not)
+    over the connection on `fd`, then runs one task and exits: a task's
+    changes to builtins, modules or the working directory must never be
+    seen by the next user's task."""
+    conn = Connection(fd)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent decides when workers stop
+    try:
+        _isolate_network()
+        for name in preload:
+            __import__(name)
+        if resource is not None:
+            _limit_memory(memory_mb)
+            resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    except Exception as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+        return
+    conn.send({"error": None})
+
+    try:
+        code = conn.recv()
+    except EOFError:
+        return
+    if code is None:
+        return
+    if resource is not None:
+        _limit_cpu(cpu_seconds)
+    conn.send(_run_task(code, output_limit))
+
+
+if __name__ == "__main__":
+    fd, cpu_seconds, memory_mb, output_limit = map(int, sys.argv[1:5])
+    main(fd, cpu_seconds, memory_mb, output_limit, sys.argv[5:])
@@ -0,0 +1,181 @@
+# tools/doc_store.py
+
+import fcntl
+import mmap
+import os
+import pickle
+
+import numpy as np
+
+# One fixed-size record per document: vector id, byte offset and byte length
+# of its UTF-8 text inside the data file. A record with length -1 is a
+# tombstone deleting that id.
+RECORD_DTYPE = np.dtype([("id", "<i8"), ("offset", "<i8"), ("length", "<i8")])
+
+
+def read_records(index_path: str) -> np.ndarray:
+    """
+    Memory-maps the record file at `index_path`.
+
+    A trailing partial record (e.g. a writer caught mid-append) is ignored.
+    """
+    if not os.path.exists(index_path):
+        return np.empty(0, dtype=RECORD_DTYPE)
+    count = os.path.getsize(index_path) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.memmap(index_path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+
+
+class DocStore:
+    """
+    Read-only, memory-mapped view over the retrieval document store.
+
+    Document texts live back to back in `data_path`; `index_path` holds their
+    (id, offset, length) records. Nothing is decoded until a document is
+    actually returned by a search, so opening the store costs the same for
+    ten documents or ten million.
+
+    Both files are append-only (see `DocStoreWriter`), so the records are
+    mapped before the data: every record seen here points at bytes that were
+    already written.
+    """
+
+    def __init__(self, data_path: str, index_path: str):
+        self.data_path = data_path
+        self.index_path = index_path
+
+        records = read_records(index_path)
+        tombstones = records["length"] < 0
+        if tombstones.any():
+            deleted = np.asarray(records["id"][tombstones])
+            records = records[~tombstones & ~np.isin(records["id"], deleted)]
+        self._records = records
+
+        with open(data_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        ids = np.asarray(self._records["id"])
+        # Stores written in one go use ids 0..n-1, which index records directly.
+        self._dense = bool(len(ids) == 0 or (ids[0] == 0 and np.all(np.diff(ids) == 1)))
+        if not self._dense:
+            self._order = np.argsort(ids, kind="stable")
+            self._sorted_ids = ids[self._order]
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _row(self, doc_id: int):
+        if self._dense:
+            return doc_id if 0 <= doc_id < len(self._records) else None
+        pos = int(np.searchsorted(self._sorted_ids, doc_id))
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == doc_id:
+            return int(self._order[pos])
+        return None
+
+    def get(self, doc_id: int):
+        """Returns the text stored under `doc_id`, or None if it is unknown."""
+        row = self._row(int(doc_id))
+        if row is None:
+            return None
+        record = self._records[row]
+        start = int(record["offset"])
+        return self._data[start:start + int(record["length"])].decode("utf-8")
+
+
+def _atomic_write(path: str, payload: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_doc_store(documents: list[str], data_path: str, index_path: str):
+    """
+    Writes `documents` as a fresh store, with ids matching list positions.
+
+    The data file is replaced before the record file, so a reader never sees
+    records pointing past the end of the data it has mapped.
+    """
+    encoded = [doc.encode("utf-8") for doc in documents]
+    records = np.zeros(len(encoded), dtype=RECORD_DTYPE)
+    records["id"] = np.arange(len(encoded))
+    records["length"] = [len(blob) for blob in encoded]
+    if len(encoded):
+        records["offset"][1:] = np.cumsum(records["length"])[:-1]
+
+    _atomic_write(data_path, b"".join(encoded))
+    _atomic_write(index_path, records.tobytes())
+
+
+class DocStoreWriter:
+    """
+    Appends documents and tombstones to a store that readers keep serving.
+
+    Texts are appended and fsync'ed before the records that point at them, and
+    an exclusive lock on `<index_path>.lock` keeps concurrent writers out.
+    Use as a context manager.
+    """
+
+    def __init__(self, data_path: str, index_path: str):
+        self.data_path = data_path
+        self.index_path = index_path
+        self._lock_file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        self._lock_file = open(f"{self.index_path}.lock", "w")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def next_id(self) -> int:
+        """Returns the first vector id never used by this store."""
+        records = read_records(self.index_path)
+        return int(records["id"].max()) + 1 if len(records) else 0
+
+    def _append_records(self, records: np.ndarray):
+        with open(self.index_path, "ab") as f:
+            # Drop a torn record left by a crashed writer before appending.
+            f.truncate(f.tell() - f.tell() % RECORD_DTYPE.itemsize)
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, ids, texts: list[str]):
+        """Appends `texts` under the given vector ids."""
+        if not texts:
+            return
+        encoded = [text.encode("utf-8") for text in texts]
+        records = np.zeros(len(encoded), dtype=RECORD_DTYPE)
+        records["id"] = ids
+        records["length"] = [len(blob) for blob in encoded]
+
+        with open(self.data_path, "ab") as f:
+            start = f.tell()
+            f.write(b"".join(encoded))
+            f.flush()
+            os.fsync(f.fileno())
+        records["offset"] = start + np.concatenate(([0], np.cumsum(records["length"])[:-1]))
+        self._append_records(records)
+
+    def delete(self, ids):
+        """Appends tombstones for `ids`; the text bytes stay until a rewrite."""
+        records = np.zeros(len(ids), dtype=RECORD_DTYPE)
+        records["id"] = ids
+        records["length"] = -1
+        self._append_records(records)
+
+
+def convert_pickle(pkl_path: str, data_path: str, index_path: str):
+    """One-time migration from the legacy `docs.pkl` list of strings."""
+    with open(pkl_path, "rb") as f:
+        documents = pickle.load(f)
+    write_doc_store(list(documents), data_path, index_path)
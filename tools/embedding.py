@@ -0,0 +1,71 @@
+# tools/embedding.py
+
+import os
+import threading
+
+from openai import OpenAI
+from tools.embedding_cache import EmbeddingCache, cached_embeddings
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")  # 1536-d
+MAX_BATCH_SIZE = 2048  # OpenAI's per-request input limit
+
+_client = None
+_client_lock = threading.Lock()
+_cache = None
+
+
+def get_client() -> OpenAI:
+    """Returns a shared OpenAI client so requests reuse its connection pool."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI()
+    return _client
+
+
+def get_cache() -> EmbeddingCache:
+    """Returns the process-wide embedding cache."""
+    global _cache
+    if _cache is None:
+        with _client_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
+
+
+def _embed_remote(texts: list[str], model: str) -> list[list[float]]:
+    client = get_client()
+    vectors = []
+    for start in range(0, len(texts), MAX_BATCH_SIZE):
+        response = client.embeddings.create(model=model, input=texts[start:start + MAX_BATCH_SIZE])
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return vectors
+
+
+def get_embeddings(texts: list[str], model: str = EMBEDDING_MODEL, use_cache: bool = True) -> list[list[float]]:
+    """
+    Embeds many texts with as few requests as possible.
+
+    Args:
+        texts (list[str]): Texts to embed.
+        model (str): Embedding model name.
+        use_cache (bool): Serve repeated texts from the embedding cache.
+
+    Returns:
+        list[list[float]]: One vector per input text, in input order.
+    """
+    if not use_cache:
+        return _embed_remote(texts, model)
+    vectors = cached_embeddings(get_cache(), texts, model, lambda missing: _embed_remote(missing, model))
+    return [vector.tolist() for vector in vectors]
+
+
+def get_embedding(text: str, model: str = EMBEDDING_MODEL, use_cache: bool = True) -> list[float]:
+    """Embeds a single text."""
+    return get_embeddings([text], model, use_cache)[0]
+
+
+def embedding_cache_stats() -> dict:
+    """Hit/miss counters for the embedding cache."""
+    return get_cache().snapshot_stats()
@@ -0,0 +1,140 @@
+# tools/embedding_cache.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "tools/vector_index/embedding_cache.sqlite")
+MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace and Unicode forms so trivially different copies of
+    the same string share one cache entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier, content-addressed embedding cache.
+
+    Tier one is an in-process LRU bounded to `memory_size` vectors. Tier two is
+    a SQLite file (WAL mode) that survives restarts and is shared by every
+    worker process pointing at the same path. Pass `path=None` to run
+    memory-only.
+    """
+
+    def __init__(self, path: str | None = CACHE_PATH, memory_size: int = MEMORY_SIZE):
+        self.path = path
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "miss_seconds": 0.0}
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = self._conn()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key: str, vector: np.ndarray):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def get_many(self, keys: list[str]) -> dict:
+        """Returns {key: vector} for every key found in either tier."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            self.stats["memory_hits"] += len(found)
+
+        missing = [key for key in keys if key not in found]
+        if missing and self.path:
+            conn = self._conn()
+            for start in range(0, len(missing), 500):  # stay under SQLite's variable limit
+                chunk = missing[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype="float32")
+                    found[key] = vector
+                    self._remember(key, vector)
+                with self._lock:
+                    self.stats["disk_hits"] += len(rows)
+        return found
+
+    def put_many(self, items: dict, seconds: float = 0.0):
+        """Stores freshly computed vectors; `seconds` is what computing them cost."""
+        vectors = {key: np.asarray(vector, dtype="float32") for key, vector in items.items()}
+        for key, vector in vectors.items():
+            self._remember(key, vector)
+        with self._lock:
+            self.stats["misses"] += len(vectors)
+            self.stats["miss_seconds"] += seconds
+        if self.path and vectors:
+            conn = self._conn()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, vector.tobytes()) for key, vector in vectors.items()],
+            )
+            conn.commit()
+
+    def snapshot_stats(self) -> dict:
+        """Hit/miss counters plus an estimate of the embedding time saved."""
+        with self._lock:
+            stats = dict(self.stats)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        per_miss = stats["miss_seconds"] / stats["misses"] if stats["misses"] else 0.0
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        stats["saved_seconds_estimate"] = hits * per_miss
+        stats["memory_entries"] = len(self._memory)
+        return stats
+
+
+def cached_embeddings(cache: EmbeddingCache, texts: list[str], model: str, compute) -> list[np.ndarray]:
+    """
+    Resolves `texts` through `cache`, calling `compute(missing_texts)` once for
+    everything not cached. Duplicate texts within the call are embedded once.
+    """
+    keys = [cache_key(model, text) for text in texts]
+    found = cache.get_many(list(dict.fromkeys(keys)))
+
+    pending = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in pending:
+            pending[key] = text
+    if pending:
+        started = time.perf_counter()
+        vectors = compute(list(pending.values()))
+        fresh = dict(zip(pending.keys(), vectors))
+        cache.put_many(fresh, time.perf_counter() - started)
+        found.update((key, np.asarray(vector, dtype="float32")) for key, vector in fresh.items())
+    return [found[key] for key in keys]
@@ -0,0 +1,150 @@
+# tools/export_logs.py
+#
+# Incremental export of ai_logs to day-partitioned Parquet for reports:
+#
+#   python -m tools.export_logs
+#   python -m tools.export_logs --full   # ignore the watermark and re-export
+
+import argparse
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from firebase_admin import firestore
+
+from config import ANALYTICS_PATH, EXPORT_PAGE_SIZE
+from utils.logger import span
+
+LOG_COLLECTION = "ai_logs"
+WATERMARK_FILE = "_watermark.json"
+
+LOG_SCHEMA = pa.schema([
+    ("doc_id", pa.string()),
+    ("user", pa.string()),
+    ("role", pa.string()),
+    ("model", pa.string()),
+    ("response_length", pa.int64()),
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+    ("date", pa.string()),
+])
+
+
+def load_watermark(root: str = ANALYTICS_PATH) -> dict:
+    """The last exported timestamp and the ids exported at exactly that timestamp."""
+    path = os.path.join(root, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {"timestamp": None, "doc_ids": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_watermark(root: str, watermark: dict):
+    path = os.path.join(root, WATERMARK_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(watermark, f)
+    os.replace(tmp_path, path)
+
+
+def _timestamp_key(value) -> str:
+    # ai_logs timestamps are ISO strings; Firestore timestamps come back as datetimes.
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def logs_to_table(rows: list) -> pa.Table:
+    """Converts exported log dicts to an Arrow table in LOG_SCHEMA."""
+    df = pd.DataFrame(rows, columns=["doc_id", "user", "role", "model", "response_length", "timestamp"])
+    df["response_length"] = pd.to_numeric(df["response_length"], errors="coerce").fillna(0).astype("int64")
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, errors="coerce", format="mixed")
+    df = df.dropna(subset=["timestamp"])
+    for column in ("user", "role", "model"):
+        df[column] = df[column].fillna("unknown").astype(str)
+    df["date"] = df["timestamp"].dt.strftime("%Y-%m-%d")
+    return pa.Table.from_pandas(df, schema=LOG_SCHEMA, preserve_index=False)
+
+
+def write_partitioned(table: pa.Table, root: str = ANALYTICS_PATH):
+    """
+    Appends `table` under root/date=YYYY-MM-DD/. File names derive from the
+    documents they hold, so re-exporting the same page after an interrupted
+    run overwrites its files instead of duplicating rows.
+    """
+    ids = table.column("doc_id")
+    batch_key = hashlib.sha1(f"{ids[0]}:{ids[-1]}:{len(ids)}".encode()).hexdigest()[:12]
+    pq.write_to_dataset(
+        table, root_path=root, partition_cols=["date"],
+        basename_template=f"part-{batch_key}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def export_new_logs(db=None, root: str = ANALYTICS_PATH, page_size: int = EXPORT_PAGE_SIZE,
+                    full: bool = False) -> int:
+    """
+    Exports ai_logs documents newer than the watermark, one page at a time,
+    advancing the watermark after each page is written.
+
+    Returns:
+        int: number of documents exported.
+    """
+    db = db or firestore.client()
+    os.makedirs(root, exist_ok=True)
+    watermark = {"timestamp": None, "doc_ids": []} if full else load_watermark(root)
+    seen_at_mark = set(watermark["doc_ids"])
+
+    query = db.collection(LOG_COLLECTION)
+    if watermark["timestamp"] is not None:
+        query = query.where("timestamp", ">=", watermark["timestamp"])
+    query = query.order_by("timestamp").limit(page_size)
+
+    exported = 0
+    last_snapshot = None
+    while True:
+        page = query.start_after(last_snapshot) if last_snapshot is not None else query
+        with span("firestore.read", collection=LOG_COLLECTION, query="export"):
+            snapshots = list(page.stream())
+        if not snapshots:
+            break
+        last_snapshot = snapshots[-1]
+
+        rows = []
+        for snapshot in snapshots:
+            data = snapshot.to_dict()
+            mark = _timestamp_key(data.get("timestamp"))
+            if mark == watermark["timestamp"] and snapshot.id in seen_at_mark:
+                continue
+            rows.append({"doc_id": snapshot.id, **{k: data.get(k) for k in LOG_SCHEMA.names[1:-1]}})
+            if mark != watermark["timestamp"]:
+                watermark = {"timestamp": mark, "doc_ids": []}
+                seen_at_mark = set()
+            watermark["doc_ids"].append(snapshot.id)
+            seen_at_mark.add(snapshot.id)
+
+        if rows:
+            table = logs_to_table(rows)
+            if table.num_rows:
+                write_partitioned(table, root)
+            exported += len(rows)
+        save_watermark(root, watermark)
+
+        if len(snapshots) < page_size:
+            break
+
+    print(f"📦 Exported {exported} {LOG_COLLECTION} documents to {root}")
+    return exported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export new ai_logs documents to partitioned Parquet.")
+    parser.add_argument("--root", default=ANALYTICS_PATH, help="Dataset directory.")
+    parser.add_argument("--page-size", type=int, default=EXPORT_PAGE_SIZE)
+    parser.add_argument("--full", action="store_true", help="Ignore the watermark and export everything.")
+    args = parser.parse_args()
+
+    import firebase_admin
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app()  # application default credentials
+    export_new_logs(root=args.root, page_size=args.page_size, full=args.full)
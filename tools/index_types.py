@@ -0,0 +1,255 @@
+# tools/index_types.py
+#
+# Approximate index types for retrieval, and a benchmark to choose between them:
+#
+#   python -m tools.index_types benchmark --size 200000 --dim 1536
+#   python -m tools.index_types convert --kind ivf_pq --nlist 4096
+
+import argparse
+import json
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+INDEX_KINDS = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+MAX_TRAINING_POINTS = 100_000
+
+
+def default_nlist(n: int) -> int:
+    """~4*sqrt(n) lists, kept within what `n` points can train."""
+    return max(1, min(int(4 * math.sqrt(max(n, 1))), n // 39 or 1))
+
+
+def default_pq_m(d: int) -> int:
+    """Largest sub-quantizer count <= 64 that divides the dimension."""
+    return next(m for m in (64, 48, 32, 24, 16, 8, 4, 2, 1) if d % m == 0)
+
+
+def build_index(kind: str, vectors, ids=None, nlist: int | None = None, pq_m: int | None = None,
+                hnsw_m: int = 32, ef_construction: int = 200, metric=faiss.METRIC_L2):
+    """
+    Builds an ID-mapped index of the given kind over `vectors`.
+
+    Args:
+        kind (str): One of "flat", "ivf_flat", "ivf_pq", "hnsw".
+        vectors: (n, d) float32 matrix.
+        ids: Optional int64 vector ids; defaults to 0..n-1.
+        nlist (int): IVF list count (default ~4*sqrt(n)).
+        pq_m (int): PQ sub-quantizers for "ivf_pq" (8 bits each).
+        hnsw_m (int): HNSW graph degree.
+        ef_construction (int): HNSW build-time beam width.
+
+    Returns:
+        A FAISS index accepting `add_with_ids`. IVF kinds also support
+        `remove_ids`; HNSW does not, so deletes need a rebuild.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, d = vectors.shape
+    ids = np.arange(n, dtype="int64") if ids is None else np.asarray(ids, dtype="int64")
+
+    if kind == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlat(d, metric))
+    elif kind == "ivf_flat":
+        index = faiss.index_factory(d, f"IVF{nlist or default_nlist(n)},Flat", metric)
+    elif kind == "ivf_pq":
+        index = faiss.index_factory(d, f"IVF{nlist or default_nlist(n)},PQ{pq_m or default_pq_m(d)}", metric)
+    elif kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(d, hnsw_m, metric)
+        hnsw.hnsw.efConstruction = ef_construction
+        index = faiss.IndexIDMap2(hnsw)
+    else:
+        raise ValueError(f"Unknown index kind: {kind} (expected one of {', '.join(INDEX_KINDS)})")
+
+    if not index.is_trained:
+        sample = vectors
+        if n > MAX_TRAINING_POINTS:
+            sample = vectors[np.random.default_rng(0).choice(n, MAX_TRAINING_POINTS, replace=False)]
+        index.train(sample)
+    if n:
+        index.add_with_ids(vectors, ids)
+    return index
+
+
+def _inner_index(index):
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def search_params(index, nprobe: int | None = None, ef_search: int | None = None):
+    """
+    Per-call search parameters for `index.search(..., params=...)`.
+
+    Unlike setting `index.nprobe`, these do not mutate the shared index, so
+    concurrent queries can use different operating points. Returns None when
+    neither knob applies to the index type.
+    """
+    inner = _inner_index(index)
+    if nprobe is not None and isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if ef_search is not None and isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+def _ivf_ids(ivf) -> np.ndarray:
+    """Every vector id stored in the inverted lists of `ivf`."""
+    invlists = ivf.invlists
+    parts = []
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            ptr = invlists.get_ids(list_no)
+            parts.append(faiss.rev_swig_ptr(ptr, size).astype("int64"))
+            invlists.release_ids(list_no, ptr)
+    return np.concatenate(parts) if parts else np.empty(0, dtype="int64")
+
+
+def extract_vectors(index):
+    """
+    Returns (vectors, ids) stored in `index`.
+
+    ID-mapped indexes (flat, HNSW) and IVF indexes keep their vector ids; a
+    bare positional index yields ids 0..n-1. IVF vectors are reconstructed
+    from their codes, so IVF-PQ yields approximations. Ids are sorted.
+    """
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        ids = faiss.vector_to_array(index.id_map).astype("int64")
+        vectors = index.index.reconstruct_n(0, index.ntotal)
+    elif isinstance(index, faiss.IndexIVF):
+        ids = _ivf_ids(index)
+        # IVF reconstruction by arbitrary id needs a hashtable direct map.
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        vectors = index.reconstruct_batch(ids) if len(ids) else np.empty((0, index.d), dtype="float32")
+    else:
+        return index.reconstruct_n(0, index.ntotal), np.arange(index.ntotal, dtype="int64")
+    order = np.argsort(ids, kind="stable")
+    return vectors[order], ids[order]
+
+
+def index_memory_bytes(index) -> int:
+    """Serialized size of the index, a close proxy for its resident footprint."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def convert_index(src_path: str, dst_path: str, kind: str, **build_kwargs):
+    """Rebuilds the index at `src_path` (any kind `build_index` makes) as
+    `kind`, keeping vector ids, and swaps it into `dst_path` atomically."""
+    vectors, ids = extract_vectors(faiss.read_index(src_path))
+    index = build_index(kind, vectors, ids, **build_kwargs)
+    tmp_path = f"{dst_path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, dst_path)
+    return index
+
+
+def synthetic_corpus(n: int, d: int, clusters: int = 256, seed: int = 0):
+    """Clustered Gaussian vectors; uniform noise would make every IVF look bad."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, d)).astype("float32")
+    labels = rng.integers(0, clusters, n)
+    return centers[labels] + 0.3 * rng.standard_normal((n, d)).astype("float32")
+
+
+def benchmark(size: int = 100_000, dim: int = 1536, queries: int = 500, k: int = 10,
+              configs: list[dict] | None = None, seed: int = 0) -> list[dict]:
+    """
+    Compares index kinds on a synthetic corpus.
+
+    Each config is a dict with "kind" plus optional build kwargs and
+    "nprobe"/"ef_search". Recall@k is measured against exact flat search.
+
+    Returns:
+        list[dict]: One row per config with recall, p50/p99 single-query
+        latency (ms), batch QPS, build seconds and index memory.
+    """
+    corpus = synthetic_corpus(size + queries, dim, seed=seed)
+    vectors, query_vectors = corpus[:size], corpus[size:]
+
+    exact = build_index("flat", vectors)
+    _, truth = exact.search(query_vectors, k)
+
+    configs = configs or [
+        {"kind": "flat"},
+        {"kind": "ivf_flat", "nprobe": 16},
+        {"kind": "ivf_flat", "nprobe": 64},
+        {"kind": "ivf_pq", "nprobe": 16},
+        {"kind": "ivf_pq", "nprobe": 64},
+        {"kind": "hnsw", "ef_search": 64},
+        {"kind": "hnsw", "ef_search": 256},
+    ]
+
+    rows = []
+    built = {}
+    for config in configs:
+        config = dict(config)
+        nprobe = config.pop("nprobe", None)
+        ef_search = config.pop("ef_search", None)
+        key = json.dumps(config, sort_keys=True)
+        if key not in built:
+            started = time.perf_counter()
+            built[key] = (build_index(vectors=vectors, **config), time.perf_counter() - started)
+        index, build_seconds = built[key]
+        params = search_params(index, nprobe, ef_search)
+
+        latencies = []
+        for query in query_vectors:
+            started = time.perf_counter()
+            index.search(query.reshape(1, -1), k, params=params)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        _, found = index.search(query_vectors, k, params=params)
+        batch_seconds = time.perf_counter() - started
+
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        rows.append({
+            **config, "nprobe": nprobe, "ef_search": ef_search,
+            "recall_at_k": round(float(recall), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            "batch_qps": round(queries / batch_seconds, 1),
+            "build_s": round(build_seconds, 2),
+            "memory_mb": round(index_memory_bytes(index) / 2**20, 1),
+        })
+    return rows
+
+
+def _print_rows(rows, k):
+    print(f"{'kind':<10}{'nprobe':>8}{'efS':>6}{f'recall@{k}':>11}{'p50 ms':>9}{'p99 ms':>9}{'QPS':>10}{'MB':>9}")
+    for row in rows:
+        print(f"{row['kind']:<10}{row['nprobe'] or '-':>8}{row['ef_search'] or '-':>6}{row['recall_at_k']:>11.4f}"
+              f"{row['p50_ms']:>9.3f}{row['p99_ms']:>9.3f}{row['batch_qps']:>10.1f}{row['memory_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or benchmark approximate retrieval indexes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    bench = sub.add_parser("benchmark", help="Recall/latency/memory on a synthetic corpus.")
+    bench.add_argument("--size", type=int, default=100_000)
+    bench.add_argument("--dim", type=int, default=1536)
+    bench.add_argument("--queries", type=int, default=500)
+    bench.add_argument("-k", type=int, default=10)
+    bench.add_argument("--json", action="store_true", help="Print rows as JSON.")
+
+    convert = sub.add_parser("convert", help="Rebuild the live index as another kind.")
+    convert.add_argument("--kind", choices=INDEX_KINDS, required=True)
+    convert.add_argument("--index", default="tools/vector_index/faiss.index")
+    convert.add_argument("--nlist", type=int)
+    convert.add_argument("--pq-m", type=int)
+    convert.add_argument("--hnsw-m", type=int, default=32)
+
+    args = parser.parse_args()
+    if args.command == "benchmark":
+        rows = benchmark(args.size, args.dim, args.queries, args.k)
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            _print_rows(rows, args.k)
+    else:
+        index = convert_index(args.index, args.index, args.kind, nlist=args.nlist, pq_m=args.pq_m, hnsw_m=args.hnsw_m)
+        print(f"✅ Rebuilt {args.index} as {args.kind} ({index.ntotal} vectors).")
@@ -0,0 +1,221 @@
+# tools/ingest.py
+#
+# Incremental ingestion into the retrieval store:
+#
+#   python -m tools.ingest manuals/pump.md manuals/vfd.txt
+#   python -m tools.ingest --delete manuals/pump.md
+
+import argparse
+import json
+import os
+
+import faiss
+import numpy as np
+from tools.doc_store import DocStoreWriter, convert_pickle
+from tools.embedding import get_embeddings
+from tools.index_types import _inner_index
+from tools.retrieval import DOCS_DATA_PATH, DOCS_INDEX_PATH, DOCS_PATH, INDEX_PATH
+
+DOCS_MAP_PATH = "tools/vector_index/docs.map"  # append-only log of doc_id -> vector ids
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+EMBED_BATCH_SIZE = 256
+
+
+def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+    """Yields overlapping chunks of `text`, preferring to break on whitespace."""
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            cut = text.rfind(" ", start + size // 2, end)
+            if cut > start:
+                end = cut
+        chunk = text[start:end].strip()
+        if chunk:
+            yield chunk
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+
+
+def load_id_map(path: str = DOCS_MAP_PATH) -> dict:
+    """Folds the append-only map log into {doc_id: [vector ids]}."""
+    id_map = {}
+    if not os.path.exists(path):
+        return id_map
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from a crashed writer
+            if entry["ids"]:
+                id_map[entry["doc_id"]] = entry["ids"]
+            else:
+                id_map.pop(entry["doc_id"], None)
+    return id_map
+
+
+def _load_writable_index(path: str):
+    """Loads the index for in-place updates, wrapping a legacy positional
+    flat index in an ID map whose ids are the old positions. IVF indexes
+    carry their own ids and are used as-is. HNSW indexes are refused:
+    FAISS cannot remove vectors from them, so upserts and deletes would
+    fail at commit."""
+    if not os.path.exists(path):
+        return None
+    index = faiss.read_index(path)
+    if isinstance(_inner_index(index), faiss.IndexHNSW):
+        raise ValueError(f"{path} is an HNSW index, which does not support removing vectors; convert it to "
+                         f"flat or IVF (python -m tools.index_types convert), ingest, then convert it back")
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2, faiss.IndexIVF)):
+        return index
+    if index.ntotal and not isinstance(index, faiss.IndexFlat):
+        raise ValueError(f"Cannot convert {type(index).__name__} to an ID-mapped index; rebuild it")
+    mapped = faiss.IndexIDMap2(faiss.IndexFlat(index.d, index.metric_type))
+    if index.ntotal:
+        mapped.add_with_ids(index.reconstruct_n(0, index.ntotal), np.arange(index.ntotal, dtype="int64"))
+    return mapped
+
+
+class Ingestor:
+    """
+    Streams documents into the live retrieval store.
+
+    Documents are chunked and embedded in batches; chunk texts are appended to
+    the document store and their vectors added to an ID-mapped FAISS index in
+    place, so the cost of an ingest scales with the new data. `commit()`
+    replaces the index file atomically and only then tombstones superseded
+    chunks, so a `Retriever` serving queries meanwhile sees either the old or
+    the new version of a document, never a mix. Use as a context manager;
+    leaving the block commits.
+
+    FAISS has no append-only file format, so each `commit()` rewrites the
+    whole index file: its cost is proportional to the index size, not to
+    the change. Batch many documents per commit rather than committing
+    after each one.
+    """
+
+    def __init__(self, index_path: str = INDEX_PATH, docs_data_path: str = DOCS_DATA_PATH,
+                 docs_index_path: str = DOCS_INDEX_PATH, map_path: str = DOCS_MAP_PATH,
+                 legacy_docs_path: str = DOCS_PATH, batch_size: int = EMBED_BATCH_SIZE):
+        self.index_path = index_path
+        self.map_path = map_path
+        self.legacy_docs_path = legacy_docs_path
+        self.batch_size = batch_size
+        self.writer = DocStoreWriter(docs_data_path, docs_index_path)
+        self.stats = {"documents": 0, "chunks": 0, "deleted_chunks": 0}
+
+    def __enter__(self):
+        self.writer.__enter__()
+        if not os.path.exists(self.writer.data_path) and os.path.exists(self.legacy_docs_path):
+            convert_pickle(self.legacy_docs_path, self.writer.data_path, self.writer.index_path)
+        self.index = _load_writable_index(self.index_path)
+        self.id_map = load_id_map(self.map_path)
+        self._next_id = self.writer.next_id()
+        self._pending = []         # (vector id, chunk text) awaiting embedding
+        self._changed = {}         # doc_id -> new ids ([] for a delete)
+        self._superseded = []      # vector ids to remove at commit
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            if exc_type is None:
+                self.commit()
+        finally:
+            self.writer.__exit__(exc_type, *exc)
+
+    def _retire(self, doc_id: str):
+        old_ids = self._changed.get(doc_id, self.id_map.get(doc_id, []))
+        self._superseded.extend(old_ids)
+
+    def upsert(self, doc_id: str, text: str):
+        """Adds a document, replacing any earlier version with the same id."""
+        self._retire(doc_id)
+        ids = []
+        for chunk in chunk_text(text):
+            ids.append(self._next_id)
+            self._pending.append((self._next_id, chunk))
+            self._next_id += 1
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+        self._changed[doc_id] = ids
+        self.stats["documents"] += 1
+
+    def delete(self, doc_id: str):
+        """Removes a document and all of its chunks."""
+        self._retire(doc_id)
+        self._changed[doc_id] = []
+
+    def ingest(self, documents) -> dict:
+        """Upserts every (doc_id, text) pair from an iterable, streaming."""
+        for doc_id, text in documents:
+            self.upsert(doc_id, text)
+        return self.stats
+
+    def flush(self):
+        """Embeds pending chunks and adds them to the store and the in-memory index."""
+        if not self._pending:
+            return
+        ids = np.array([vector_id for vector_id, _ in self._pending], dtype="int64")
+        texts = [chunk for _, chunk in self._pending]
+        vectors = np.ascontiguousarray(get_embeddings(texts), dtype="float32")
+
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+        self.writer.append(ids, texts)
+        self.index.add_with_ids(vectors, ids)
+        self.stats["chunks"] += len(ids)
+        self._pending = []
+
+    def commit(self):
+        """Publishes everything ingested so far, rewriting the index file."""
+        self.flush()
+        if self.index is None:
+            return
+        superseded = np.array(self._superseded, dtype="int64")
+        if len(superseded):
+            self.index.remove_ids(superseded)
+
+        tmp_path = f"{self.index_path}.tmp"
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+
+        if len(superseded):
+            self.writer.delete(superseded)
+            self.stats["deleted_chunks"] += len(superseded)
+        if self._changed:
+            with open(self.map_path, "a", encoding="utf-8") as f:
+                for doc_id, ids in self._changed.items():
+                    f.write(json.dumps({"doc_id": doc_id, "ids": ids}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            for doc_id, ids in self._changed.items():
+                if ids:
+                    self.id_map[doc_id] = ids
+                else:
+                    self.id_map.pop(doc_id, None)
+        self._changed = {}
+        self._superseded = []
+
+
+def _read_files(paths):
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            yield path, f.read()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally add, update or delete retrieval documents.")
+    parser.add_argument("paths", nargs="*", help="Text files to upsert; the path is the document id.")
+    parser.add_argument("--delete", nargs="*", default=[], metavar="DOC_ID", help="Document ids to remove.")
+    args = parser.parse_args()
+
+    with Ingestor() as ingestor:
+        for doc_id in args.delete:
+            ingestor.delete(doc_id)
+        stats = ingestor.ingest(_read_files(args.paths))
+    print(f"✅ Ingested {stats['documents']} document(s), {stats['chunks']} chunk(s); "
+          f"removed {stats['deleted_chunks']} stale chunk(s).")
@@ -1,36 +1,257 @@
 # tools/retrieval.py
 
 import os
+import threading
+
 import faiss
-import pickle
-from openai import OpenAI
-from tools.embedding import get_embedding  # Assumes you have a helper here or inlined
+import numpy as np
+from config import SHARDS_ENABLED
+from tools.doc_store import DocStore, convert_pickle
+from tools.embedding import get_embedding, get_embeddings
+from tools.index_types import search_params
+from utils.logger import span
 
 INDEX_PATH = "tools/vector_index/faiss.index"
-DOCS_PATH = "tools/vector_index/docs.pkl"
+DOCS_PATH = "tools/vector_index/docs.pkl"  # legacy format, migrated on first load
+DOCS_DATA_PATH = "tools/vector_index/docs.bin"
+DOCS_INDEX_PATH = "tools/vector_index/docs.idx"
+
+# Map the index instead of copying it onto the heap; every process sharing the
+# file shares the same page cache. Flat codes and IVF inverted lists need
+# different flags, and FAISS rejects the combination for IVF, so try in order.
+MMAP_FLAG_SETS = (
+    faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY,
+    faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+)
+
+
+def _file_stamp(path: str):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_index_mmap(path: str):
+    """Reads a FAISS index memory-mapped, falling back to a plain read for
+    index types that do not support mmap."""
+    for flags in MMAP_FLAG_SETS:
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError:
+            continue
+    return faiss.read_index(path)
+
 
-def retrieve_documents(query: str, k: int = 5) -> list[str]:
+class Retriever:
+    """
+    Long-lived handle on the FAISS index and document store.
+
+    Both are loaded once and memory-mapped; before each search the files are
+    stat'ed and reloaded if they changed on disk. Searches run concurrently
+    against an immutable (index, docs) snapshot, so a reload never disturbs a
+    query already in flight.
+    """
+
+    def __init__(self, index_path: str = INDEX_PATH, docs_data_path: str = DOCS_DATA_PATH,
+                 docs_index_path: str = DOCS_INDEX_PATH, legacy_docs_path: str = DOCS_PATH):
+        self.index_path = index_path
+        self.docs_data_path = docs_data_path
+        self.docs_index_path = docs_index_path
+        self.legacy_docs_path = legacy_docs_path
+        self._lock = threading.Lock()
+        self._state = None  # (stamp, index, docs)
+
+    def _stamp(self):
+        return tuple(_file_stamp(p) for p in (self.index_path, self.docs_data_path, self.docs_index_path))
+
+    def _load(self):
+        if not os.path.exists(self.docs_data_path) and os.path.exists(self.legacy_docs_path):
+            print(f"[Retrieval] Migrating {self.legacy_docs_path} to memory-mapped store")
+            convert_pickle(self.legacy_docs_path, self.docs_data_path, self.docs_index_path)
+
+        with span("retrieval.load"):
+            stamp = self._stamp()
+            index = read_index_mmap(self.index_path)
+            docs = DocStore(self.docs_data_path, self.docs_index_path)
+        self._state = (stamp, index, docs)
+        print(f"[Retrieval] Loaded index with {index.ntotal} vectors and {len(docs)} documents")
+
+    def version(self):
+        """Identifies the on-disk index and documents; changes after every ingest."""
+        return self._stamp()
+
+    def snapshot(self):
+        """Returns the current (index, docs) pair, reloading if the files changed."""
+        state = self._state
+        if state is None or state[0] != self._stamp():
+            with self._lock:
+                state = self._state
+                if state is None or state[0] != self._stamp():
+                    self._load()
+                    state = self._state
+        return state[1], state[2]
+
+    def higher_is_better(self) -> bool:
+        """True if the index scores by inner product (bigger is closer), False for L2 distance."""
+        return self.snapshot()[0].metric_type == faiss.METRIC_INNER_PRODUCT
+
+    def search_batch(self, query_vectors, k: int = 5, nprobe: int | None = None,
+                     ef_search: int | None = None) -> list[list[tuple[str, float]]]:
+        """
+        Searches the index for many query vectors in a single FAISS call.
+
+        Args:
+            query_vectors: (n, d) float32 matrix, or anything convertible to one.
+            k (int): Number of results per query.
+            nprobe (int): IVF lists to visit for this call (IVF indexes only).
+            ef_search (int): HNSW beam width for this call (HNSW indexes only).
+
+        Returns:
+            list[list[tuple[str, float]]]: Per query, (document text, distance)
+            pairs, best first.
+        """
+        index, docs = self.snapshot()
+        queries = np.ascontiguousarray(query_vectors, dtype="float32")
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        D, I = index.search(queries, k, params=search_params(index, nprobe, ef_search))
+
+        batch = []
+        for ids, scores in zip(I, D):
+            results = []
+            for doc_id, score in zip(ids, scores):
+                if doc_id < 0:
+                    continue  # fewer than k vectors in the index
+                text = docs.get(doc_id)
+                if text is not None:
+                    results.append((text, float(score)))
+            batch.append(results)
+        return batch
+
+    def search(self, query_vector, k: int = 5, **search_kwargs) -> list[tuple[str, float]]:
+        """Searches the index for one query vector; see `search_batch`."""
+        return self.search_batch([query_vector], k, **search_kwargs)[0]
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever() -> Retriever:
+    """Returns the process-wide Retriever, creating it on first use."""
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = Retriever()
+    return _retriever
+
+
+def _sharded():
+    from tools.shards import get_sharded_retriever  # imported late: shards imports this module
+    return get_sharded_retriever()
+
+
+def _tenant(tenant):
+    """`tenant`, or the one set for this context (the signed-in user's)."""
+    from tools.shards import current_tenant
+    return current_tenant() if tenant is None else tenant
+
+
+def retrieve_documents(query: str, k: int = 5, nprobe: int | None = None,
+                       ef_search: int | None = None, tenant: str | None = None) -> list[str]:
     """
     Retrieves relevant documents using vector search (FAISS + OpenAI).
-    
+
     Args:
         query (str): The query string to retrieve documents for.
         k (int): Number of top documents to return.
-    
+        nprobe (int): IVF lists to visit (IVF indexes only).
+        ef_search (int): HNSW beam width (HNSW indexes only).
+        tenant (str): Whose shards to search with config.SHARDS_ENABLED
+            (default the context's tenant, see tools/shards.set_tenant).
+
     Returns:
         list[str]: A list of document texts relevant to the query.
     """
-    print(f"[Retrieval] Looking up documents for query: '{query}'")
+    with span("retrieval.embed"):
+        query_vector = get_embedding(query)  # Should return a list[float] of 1536-d
+    if SHARDS_ENABLED:
+        return [doc for doc, _ in _sharded().search(query_vector, k, _tenant(tenant), nprobe=nprobe,
+                                                    ef_search=ef_search)]
+    with span("retrieval.search", k=k) as search_span:
+        results = [doc for doc, _ in get_retriever().search(query_vector, k, nprobe=nprobe, ef_search=ef_search)]
+        search_span.set(results=len(results))
+    return results
+
+
+def retrieve_documents_batch(queries: list[str], k: int = 5, nprobe: int | None = None,
+                             ef_search: int | None = None,
+                             tenant: str | None = None) -> list[list[tuple[str, float]]]:
+    """
+    Retrieves documents for many queries at once: one batched embedding
+    request and one FAISS search over the stacked query matrix.
+
+    Args:
+        queries (list[str]): The query strings to retrieve documents for.
+        k (int): Number of top documents to return per query.
+        nprobe (int): IVF lists to visit (IVF indexes only).
+        ef_search (int): HNSW beam width (HNSW indexes only).
+        tenant (str): As for `retrieve_documents`.
+
+    Returns:
+        list[list[tuple[str, float]]]: For each query, in order, its
+        (document text, score) pairs, best first; scores are higher-is-better
+        whatever the index metric or sharding, as in `retrieve_hits`.
+    """
+    if not queries:
+        return []
+    with span("retrieval.embed", queries=len(queries)):
+        matrix = np.asarray(get_embeddings(list(queries)), dtype="float32")
+    if SHARDS_ENABLED:
+        return [[tuple(hit) for hit in hits]
+                for hits in _sharded().search_batch(matrix, k, _tenant(tenant), nprobe=nprobe, ef_search=ef_search)]
+    retriever = get_retriever()
+    with span("retrieval.search", k=k, queries=len(queries)):
+        results = retriever.search_batch(matrix, k, nprobe=nprobe, ef_search=ef_search)
+    sign = 1.0 if retriever.higher_is_better() else -1.0
+    return [[(text, sign * distance) for text, distance in hits] for hits in results]
+
+
+def retrieve_hits(query: str, k: int = 5, nprobe: int | None = None,
+                  ef_search: int | None = None, tenant: str | None = None) -> list[list]:
+    """
+    Retrieves documents with a relevance score for ranking.
+
+    With config.SHARDS_ENABLED the query goes to the shards visible to
+    `tenant` (default the context's, see tools/shards.set_tenant);
+    otherwise `tenant` is ignored.
+
+    Returns:
+        list[list]: [document text, score] pairs, best first; higher scores
+        are more relevant whatever the index metric (L2 distances are negated).
+    """
+    with span("retrieval.embed"):
+        query_vector = get_embedding(query)
+    if SHARDS_ENABLED:
+        return _sharded().search(query_vector, k, _tenant(tenant), nprobe=nprobe, ef_search=ef_search)
+    retriever = get_retriever()
+    with span("retrieval.search", k=k) as search_span:
+        hits = retriever.search(query_vector, k, nprobe=nprobe, ef_search=ef_search)
+        search_span.set(results=len(hits))
+    sign = 1.0 if retriever.higher_is_better() else -1.0
+    return [[text, sign * distance] for text, distance in hits]
 
-    # Load FAISS index and corresponding docs
-    with open(DOCS_PATH, "rb") as f:
-        documents = pickle.load(f)
 
-    index = faiss.read_index(INDEX_PATH)
-    query_vector = get_embedding(query)  # Should return a list[float] of 1536-d
+def retrieval_version(tenant: str | None = None):
+    """Identifies the index files `retrieve_hits` would search for `tenant`."""
+    if SHARDS_ENABLED:
+        return _sharded().version(_tenant(tenant))
+    return get_retriever().version()
 
-    D, I = index.search([query_vector], k)
-    results = [documents[i] for i in I[0]]
 
-    print(f"[Retrieval] Top results:\n" + "\n---\n".join(results))
-    return results
\ No newline at end of file
+def run_retrieval(query: str, k: int = 5, tenant: str | None = None) -> str:
+    """The top documents as one context block."""
+    return "\n---\n".join(retrieve_documents(query, k, tenant=tenant))
@@ -0,0 +1,29 @@
+# tools/serve.py
+"""
+Container entry point: prewarm shared resources, then run Streamlit in this
+same process, so its port only opens once the instance is warm.
+
+    python -m tools.serve home.py --server.port=8080 --server.headless=true
+
+Arguments are passed to `streamlit run` unchanged.
+"""
+
+import sys
+import time
+
+from utils import startup  # first, so start-up timings count from here
+
+
+def main(argv):
+    report = startup.prewarm()
+    startup.print_report(report)
+
+    started = time.perf_counter()
+    from streamlit.web import cli as stcli
+    print(f"[Startup] Streamlit imported in {(time.perf_counter() - started) * 1000:.0f} ms; starting server")
+    sys.argv = ["streamlit", "run", *argv]
+    sys.exit(stcli.main())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or ["home.py"])
@@ -0,0 +1,521 @@
+# tools/shards.py
+#
+# Sharded retrieval: the corpus split into several index + document store
+# directories under SHARD_ROOT, one per tenant (site) or per hash bucket.
+#
+#   python -m tools.shards split --shards 8            # hash-split the live index
+#   python -m tools.shards ingest --tenant plant-a manuals/plant-a/*.md
+#   python -m tools.shards list
+
+import argparse
+import contextvars
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from config import SHARD_RESCAN_SECONDS, SHARD_ROOT, SHARD_SEARCH_TIMEOUT, SHARD_WORKERS
+from utils.logger import span
+
+SHARD_META = "shard.json"
+SHARD_FILES = {"index_path": "faiss.index", "docs_data_path": "docs.bin", "docs_index_path": "docs.idx"}
+
+_tenant = contextvars.ContextVar("retrieval_tenant", default=None)
+
+
+def set_tenant(tenant: str | None):
+    """Sets the tenant whose shards retrieval in this context (a Streamlit
+    script run, and chain steps bound to it) searches when none is passed.
+    utils/auth sets it from the signed-in user's `tenant` token claim."""
+    _tenant.set(tenant)
+
+
+def current_tenant() -> str | None:
+    return _tenant.get()
+
+
+def shard_paths(directory: str) -> dict:
+    """Retriever paths for the shard stored in `directory`."""
+    return {key: os.path.join(directory, name) for key, name in SHARD_FILES.items()}
+
+
+class Shard:
+    __slots__ = ("name", "tenant", "paths", "worker")
+
+    def __init__(self, name, tenant, paths, worker=None):
+        self.name = name
+        self.tenant = tenant  # None: shared by every tenant
+        self.paths = paths
+        self.worker = worker
+
+
+def discover_shards(root: str = SHARD_ROOT) -> dict:
+    """{name: Shard} for every directory under `root` holding an index."""
+    shards = {}
+    try:
+        entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+    except FileNotFoundError:
+        return shards
+    for entry in entries:
+        paths = shard_paths(entry.path)
+        if entry.name.endswith((".tmp", ".old")) or not entry.is_dir() or not os.path.exists(paths["index_path"]):
+            continue
+        try:
+            with open(os.path.join(entry.path, SHARD_META), encoding="utf-8") as f:
+                tenant = json.load(f).get("tenant")
+        except (OSError, ValueError):
+            tenant = None
+        shards[entry.name] = Shard(entry.name, tenant, paths)
+    return shards
+
+
+# --- worker process ---
+
+def _open(retrievers, name, paths):
+    from tools.retrieval import Retriever
+
+    retriever = retrievers.get(name)
+    if retriever is None:
+        retriever = retrievers[name] = Retriever(legacy_docs_path=os.devnull, **paths)
+    return retriever
+
+
+def _search_shards(retrievers, shards, query_vectors, k, nprobe, ef_search):
+    """Top-k per query across this worker's `shards`, scores higher-is-better,
+    and {name: error} for shards that could not be searched. A failing shard
+    (e.g. its directory was just removed) is skipped; the others still answer."""
+    merged = [[] for _ in range(len(query_vectors))]
+    failed = {}
+    for name, paths in shards:
+        try:
+            retriever = _open(retrievers, name, paths)
+            sign = 1.0 if retriever.higher_is_better() else -1.0
+            found = retriever.search_batch(query_vectors, k, nprobe=nprobe, ef_search=ef_search)
+        except Exception as e:
+            retrievers.pop(name, None)
+            failed[name] = f"{type(e).__name__}: {e}"
+            continue
+        for hits, shard_hits in zip(merged, found):
+            hits.extend([text, sign * score] for text, score in shard_hits)
+    return [heapq.nlargest(k, hits, key=lambda hit: hit[1]) for hits in merged], failed
+
+
+def _shard_worker(requests, responses):
+    import faiss
+
+    # One search thread per process: parallelism comes from the processes,
+    # and OpenMP threads in each would only contend for the same cores.
+    faiss.omp_set_num_threads(1)
+    retrievers = {}  # shard name -> Retriever over its memory-mapped files
+    while True:
+        message = requests.get()
+        if message is None:
+            return
+        request_id, op, payload = message
+        try:
+            if op == "search":
+                result = _search_shards(retrievers, *payload)
+            elif op == "load":
+                name, paths = payload
+                retrievers.pop(name, None)
+                result = _open(retrievers, name, paths).snapshot()[0].ntotal
+            elif op == "unload":
+                result = retrievers.pop(payload, None) is not None
+            else:
+                raise ValueError(f"Unknown shard op: {op}")
+            responses.put((request_id, True, result))
+        except Exception as e:
+            responses.put((request_id, False, f"{type(e).__name__}: {e}"))
+
+
+# --- pool ---
+
+class ShardedRetriever:
+    """
+    Serves the shards under `root` from `workers` processes.
+
+    Each shard is assigned to one worker, which memory-maps its index and
+    documents; the page cache is shared, so a shard costs RAM once however
+    many processes map it. A query is embedded once, then fans out to only
+    the shards it can see: its tenant's shards plus shared ones (tenant
+    None), or every shard with `tenant="*"`. Retrieval in tools/retrieval
+    passes the signed-in user's tenant (`current_tenant`) unless told
+    otherwise. Each worker searches its
+    shards in one message, and the per-worker top-k lists are merged by
+    score, so shards on different workers are searched on different cores.
+
+    Shard directories added under `root` are picked up within
+    `rescan_seconds`, and removed ones are dropped; the rescan runs in a
+    background thread and swaps in the new shard set at once, so searches
+    never wait for it or see it half done. `load_shard` and
+    `unload_shard` do the same on demand, without restarting the app.
+    """
+
+    def __init__(self, root=SHARD_ROOT, workers=SHARD_WORKERS, timeout=SHARD_SEARCH_TIMEOUT,
+                 rescan_seconds=SHARD_RESCAN_SECONDS):
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self.root = root
+        self.timeout = timeout
+        self.rescan_seconds = rescan_seconds
+        self._responses = self._ctx.Queue()
+        self._workers = [self._start_worker() for _ in range(max(1, workers))]
+        self._pending = {}  # request id -> Future
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._shards = {}   # name -> Shard; replaced, never mutated, so readers need no lock
+        self._failing = set()  # shards whose last search failed, reported once until reloaded
+        self._scanned = 0.0
+        self._refreshing = False
+        self._closed = False
+        threading.Thread(target=self._collect, name="shard-responses", daemon=True).start()
+        self.refresh()
+
+    # --- workers ---
+
+    def _start_worker(self):
+        requests = self._ctx.Queue()
+        process = self._ctx.Process(target=_shard_worker, args=(requests, self._responses),
+                                    name="shard-worker", daemon=True)
+        process.start()
+        return process, requests
+
+    def _collect(self):
+        while True:
+            try:
+                message = self._responses.get()
+            except Exception:
+                if self._closed:  # queue torn down at interpreter exit
+                    return
+                raise
+            if message is None:
+                return
+            request_id, ok, result = message
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue  # timed out already
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(result))
+
+    def _submit(self, worker: int, op: str, payload) -> Future:
+        future = Future()
+        with self._lock:
+            process, requests = self._workers[worker]
+            if not process.is_alive():
+                # Its shards reopen lazily in the replacement: every search carries their paths.
+                print(f"[Shards] Worker {worker} exited ({process.exitcode}); restarting")
+                self._workers[worker] = self._start_worker()
+                process, requests = self._workers[worker]
+            future.request_id = request_id = next(self._ids)
+            self._pending[request_id] = future
+        requests.put((request_id, op, payload))
+        return future
+
+    def _result(self, future: Future, timeout=None):
+        try:
+            return future.result(timeout or self.timeout)
+        finally:
+            with self._lock:
+                self._pending.pop(future.request_id, None)
+
+    # --- shards ---
+
+    def shards(self) -> dict:
+        return dict(self._shards)
+
+    def _worker_load(self, shards) -> list:
+        load = [0] * len(self._workers)
+        for shard in shards:
+            load[shard.worker] += 1
+        return load
+
+    def _least_loaded_worker(self) -> int:
+        load = self._worker_load(self._shards.values())
+        return load.index(min(load))
+
+    def _open_shard(self, shard: Shard, wait: bool = True) -> Shard:
+        future = self._submit(shard.worker, "load", (shard.name, shard.paths))
+        if wait:
+            ntotal = self._result(future)
+            print(f"[Shards] Loaded {shard.name} ({ntotal} vectors) on worker {shard.worker}")
+        return shard
+
+    def load_shard(self, name: str, tenant=None, paths=None, wait: bool = True) -> Shard:
+        """Starts serving a shard (by default the directory `name` under the
+        root), replacing any shard of that name; with `wait`, returns once its
+        worker has it open."""
+        if paths is None:
+            found = discover_shards(self.root).get(name)
+            if found is None:
+                raise FileNotFoundError(f"No shard {name!r} under {self.root}")
+            tenant, paths = found.tenant, found.paths
+        with self._lock:
+            existing = self._shards.get(name)
+        shard = self._open_shard(Shard(name, tenant, paths,
+                                       existing.worker if existing else self._least_loaded_worker()), wait)
+        with self._lock:
+            self._shards = {**self._shards, name: shard}
+            self._failing.discard(name)
+        return shard
+
+    def unload_shard(self, name: str):
+        """Stops routing queries to `name` and closes it in its worker."""
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is None:
+                return
+            self._shards = {key: value for key, value in self._shards.items() if key != name}
+            self._failing.discard(name)
+        self._submit(shard.worker, "unload", name)
+        print(f"[Shards] Unloaded {name}")
+
+    def refresh(self):
+        """Loads shard directories that appeared under the root and unloads
+        those that disappeared. New shards are opened in their workers first;
+        then routing switches to the new set in one swap."""
+        found = discover_shards(self.root)
+        current = self._shards
+        removed = set(current) - set(found)
+        load = self._worker_load(shard for name, shard in current.items() if name not in removed)
+        added = {}
+        for name, shard in found.items():
+            if name in current:
+                continue
+            worker = load.index(min(load))
+            try:
+                added[name] = self._open_shard(Shard(name, shard.tenant, shard.paths, worker))
+            except Exception as e:
+                print(f"[Shards] Could not load {name}: {e}")
+                continue
+            load[worker] += 1
+        if added or removed:
+            with self._lock:
+                self._shards = {**{name: shard for name, shard in self._shards.items() if name not in removed},
+                                **added}
+                self._failing -= removed | set(added)
+        for name in removed:
+            self._submit(current[name].worker, "unload", name)
+            print(f"[Shards] Unloaded {name}")
+        self._scanned = time.monotonic()
+
+    def _maybe_refresh(self):
+        """Starts a background rescan when one is due; the caller carries on
+        with the current routing."""
+        if not self.rescan_seconds or time.monotonic() - self._scanned < self.rescan_seconds:
+            return
+        with self._lock:
+            if self._refreshing or self._closed:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="shard-refresh", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"[Shards] Rescan of {self.root} failed: {e}")
+        finally:
+            self._scanned = time.monotonic()  # a failed rescan waits for the next interval too
+            self._refreshing = False
+
+    def _note_failures(self, failed: dict):
+        """Logs newly failing shards once, and stops routing to those whose
+        directory is gone instead of waiting for the next rescan."""
+        with self._lock:
+            new = {name: error for name, error in failed.items() if name not in self._failing}
+            self._failing.update(new)
+        for name, error in new.items():
+            print(f"[Shards] Skipping {name} in searches: {error}")
+        for name in failed:
+            shard = self._shards.get(name)
+            if shard is not None and not os.path.exists(shard.paths["index_path"]):
+                self.unload_shard(name)
+
+    def route(self, tenant=None) -> list:
+        """The shards a query for `tenant` searches."""
+        return [shard for shard in self._shards.values()
+                if tenant == "*" or shard.tenant is None or shard.tenant == tenant]
+
+    def version(self, tenant=None):
+        """Identifies the routed shards' files; changes after any of them is rewritten."""
+        from tools.retrieval import _file_stamp
+        return tuple((shard.name, tuple(_file_stamp(path) for path in shard.paths.values()))
+                     for shard in sorted(self.route(tenant), key=lambda shard: shard.name))
+
+    # --- search ---
+
+    def search_batch(self, query_vectors, k: int = 5, tenant=None, nprobe: int | None = None,
+                     ef_search: int | None = None) -> list[list[list]]:
+        """
+        Searches the shards visible to `tenant`.
+
+        Returns:
+            list[list[list]]: Per query, [document text, score] pairs, best
+            first; higher scores are more relevant whatever the index metric.
+            Shards that fail, or whose worker does not answer within the
+            timeout, are left out rather than failing the query.
+        """
+        import numpy as np
+
+        self._maybe_refresh()
+        queries = np.ascontiguousarray(query_vectors, dtype="float32")
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+
+        by_worker = {}
+        for shard in self.route(tenant):
+            by_worker.setdefault(shard.worker, []).append((shard.name, shard.paths))
+        with span("shards.search", shards=sum(map(len, by_worker.values())), workers=len(by_worker)):
+            futures = [self._submit(worker, "search", (shards, queries, k, nprobe, ef_search))
+                       for worker, shards in by_worker.items()]
+            merged = [[] for _ in range(len(queries))]
+            deadline = time.monotonic() + self.timeout
+            for future in futures:
+                try:
+                    per_query, failed = self._result(future, max(0.001, deadline - time.monotonic()))
+                except (FutureTimeout, RuntimeError) as e:
+                    print(f"[Shards] Shard search failed, returning partial results: {e or 'timed out'}")
+                    continue
+                if failed:
+                    self._note_failures(failed)
+                for hits, found in zip(merged, per_query):
+                    hits.extend(found)
+        return [heapq.nlargest(k, hits, key=lambda hit: hit[1]) for hits in merged]
+
+    def search(self, query_vector, k: int = 5, tenant=None, **search_kwargs) -> list[list]:
+        return self.search_batch([query_vector], k, tenant, **search_kwargs)[0]
+
+    def shutdown(self):
+        if self._closed:
+            return
+        self._closed = True
+        for process, requests in self._workers:
+            requests.put(None)
+        for process, _ in self._workers:
+            process.join(2)
+            if process.is_alive():
+                process.kill()
+        self._responses.put(None)
+
+
+_sharded = None
+_sharded_lock = threading.Lock()
+
+
+def get_sharded_retriever() -> ShardedRetriever:
+    """The process-wide shard pool, started on first use (or by the start-up prewarm)."""
+    global _sharded
+    if _sharded is None:
+        with _sharded_lock:
+            if _sharded is None:
+                import atexit
+                _sharded = ShardedRetriever()
+                atexit.register(_sharded.shutdown)
+    return _sharded
+
+
+# --- building shards ---
+
+def _write_meta(directory: str, tenant):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, SHARD_META), "w", encoding="utf-8") as f:
+        json.dump({"tenant": tenant}, f)
+
+
+def split_index(index_path: str, docs_data_path: str, docs_index_path: str, root: str = SHARD_ROOT,
+                shards: int = 8, tenant=None, prefix: str = "shard", kind: str = "flat") -> list[str]:
+    """
+    Hash-partitions the index at `index_path` (any kind) and its documents into `shards`
+    shard directories `<prefix>-NN` under `root`, keeping vector ids.
+    Each shard is written to a temporary directory and renamed into place,
+    so a running pool never loads a half-written shard. `<prefix>-NN`
+    directories left from an earlier split into more shards are removed
+    afterwards, since they hold copies of the same vectors.
+    """
+    import faiss
+    import numpy as np
+
+    from tools.doc_store import DocStore, DocStoreWriter
+    from tools.index_types import build_index, extract_vectors
+
+    vectors, ids = extract_vectors(faiss.read_index(index_path))
+    docs = DocStore(docs_data_path, docs_index_path)
+    buckets = ids % shards
+    names = []
+    for bucket in range(shards):
+        name = f"{prefix}-{bucket:02d}"
+        final = os.path.join(root, name)
+        staging = f"{final}.tmp"
+        mask = buckets == bucket
+        _write_meta(staging, tenant)
+        paths = shard_paths(staging)
+        faiss.write_index(build_index(kind, vectors[mask], ids[mask]), paths["index_path"])
+        shard_ids = ids[mask]
+        texts = [docs.get(vector_id) or "" for vector_id in shard_ids]
+        with DocStoreWriter(paths["docs_data_path"], paths["docs_index_path"]) as writer:
+            writer.append(np.asarray(shard_ids, dtype="int64"), texts)
+        if os.path.exists(final):
+            os.rename(final, f"{final}.old")
+        os.rename(staging, final)
+        if os.path.exists(f"{final}.old"):
+            shutil.rmtree(f"{final}.old")
+        names.append(name)
+
+    numbered = re.compile(rf"{re.escape(prefix)}-(\d+)")
+    for entry in os.scandir(root):
+        match = numbered.fullmatch(entry.name)
+        if match and int(match.group(1)) >= shards and entry.is_dir():
+            shutil.rmtree(entry.path)
+    return names
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and inspect retrieval shards.")
+    parser.add_argument("--root", default=SHARD_ROOT)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    split = sub.add_parser("split", help="Hash-split the live index into shards.")
+    split.add_argument("--shards", type=int, default=8)
+    split.add_argument("--tenant", help="Tenant the shards belong to (default: shared).")
+    split.add_argument("--prefix", default="shard")
+    split.add_argument("--kind", default="flat", help="Index kind for the shards (see tools/index_types.py).")
+
+    ingest = sub.add_parser("ingest", help="Add or update documents in a tenant's shard.")
+    ingest.add_argument("--tenant", required=True)
+    ingest.add_argument("paths", nargs="*", help="Text files to upsert; the path is the document id.")
+    ingest.add_argument("--delete", nargs="*", default=[], metavar="DOC_ID")
+
+    sub.add_parser("list", help="Show the shards under the root.")
+    args = parser.parse_args()
+
+    if args.command == "split":
+        from tools.retrieval import DOCS_DATA_PATH, DOCS_INDEX_PATH, INDEX_PATH
+        names = split_index(INDEX_PATH, DOCS_DATA_PATH, DOCS_INDEX_PATH, args.root, args.shards, args.tenant,
+                            args.prefix, args.kind)
+        print(f"✅ Wrote {len(names)} shard(s) under {args.root}")
+    elif args.command == "ingest":
+        from tools.ingest import Ingestor, _read_files
+        directory = os.path.join(args.root, args.tenant)
+        _write_meta(directory, args.tenant)
+        paths = shard_paths(directory)
+        with Ingestor(map_path=os.path.join(directory, "docs.map"), legacy_docs_path=os.devnull,
+                      **paths) as ingestor:
+            for doc_id in args.delete:
+                ingestor.delete(doc_id)
+            stats = ingestor.ingest(_read_files(args.paths))
+        print(f"✅ Shard {args.tenant}: ingested {stats['documents']} document(s), {stats['chunks']} chunk(s); "
+              f"removed {stats['deleted_chunks']} stale chunk(s).")
+    else:
+        import faiss
+        for name, shard in discover_shards(args.root).items():
+            index = faiss.read_index(shard.paths["index_path"])
+            print(f"📦 {name:<24} tenant={shard.tenant or '(shared)':<16} {index.ntotal} vectors")
@@ -0,0 +1,308 @@
+# utils/admission.py
+
+import asyncio
+import contextlib
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+
+from config import (ADMISSION_DEFAULT_ROLE, ADMISSION_INITIAL_SERVICE_SECONDS, ADMISSION_MAX_IN_FLIGHT,
+                    ADMISSION_MAX_WAIT, ADMISSION_ROLE_WEIGHTS, ADMISSION_USER_QUEUE)
+from utils.logger import add_metrics_source, record
+
+ANONYMOUS = "anonymous"
+
+_caller = contextvars.ContextVar("caller", default=None)  # (user, role)
+_holding = contextvars.ContextVar("admission_holding", default=False)
+
+
+class ServerBusy(RuntimeError):
+    """Raised instead of queueing a model call that would wait too long."""
+
+    def __init__(self, retry_after: float, reason: str = "busy"):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"The assistant is busy ({reason}), retry in {self.retry_after} s")
+
+
+class _Waiter:
+    __slots__ = ("user", "role", "event", "notify", "admitted")
+
+    def __init__(self, user, role, notify=None):
+        self.user = user
+        self.role = role
+        self.event = threading.Event()
+        self.notify = notify  # also called on admission, for waiters on an event loop
+        self.admitted = False
+
+
+def set_caller(user: str | None, role: str | None = None):
+    """Identifies who the model calls made from this context (a Streamlit
+    script run, and chain steps bound to it) are for."""
+    _caller.set((user or ANONYMOUS, role or ADMISSION_DEFAULT_ROLE))
+
+
+def get_caller() -> tuple:
+    return _caller.get() or (ANONYMOUS, ADMISSION_DEFAULT_ROLE)
+
+
+class AdmissionController:
+    """
+    Global in-flight limit for model calls with weighted fair queueing.
+
+    At most `max_in_flight` calls run at once. Callers beyond that queue,
+    and freed slots go first to the role with the least weighted service so
+    far (`role_weights`, e.g. technicians 2 : admins 1). Within a role they
+    go to the user with the least service, and within a user calls run in
+    order. A user or role that goes idle gets no credit for the idle time,
+    so one heavy user gets no more than their share however many calls
+    they queue.
+
+    Load is shed early: a call is refused with ServerBusy when its user
+    already has `user_queue` calls waiting, or when its estimated wait
+    exceeds `max_wait`. A call still queued after `max_wait` is refused too.
+    The estimate comes from the queue ahead of it under fair sharing and
+    the recent mean call duration.
+
+    Batch work passes `shed=False`: its calls are never refused and wait as
+    long as it takes, still taking turns with other users' calls, so a batch
+    larger than `user_queue` runs to completion at its fair share.
+    """
+
+    def __init__(self, max_in_flight=ADMISSION_MAX_IN_FLIGHT, max_wait=ADMISSION_MAX_WAIT,
+                 user_queue=ADMISSION_USER_QUEUE, role_weights=None,
+                 initial_service_seconds=ADMISSION_INITIAL_SERVICE_SECONDS):
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self.user_queue = user_queue
+        self.role_weights = dict(ADMISSION_ROLE_WEIGHTS if role_weights is None else role_weights)
+        self.service_seconds = initial_service_seconds  # moving average of call duration
+        self.in_flight = 0
+        self._queues = {}    # role -> {user: deque of _Waiter}
+        self._role_vt = {}   # role -> virtual time (weighted service received)
+        self._user_vt = {}   # user -> virtual time, while the user has calls queued
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._waits_ms = deque(maxlen=1000)
+        self.stats = {"admitted": 0, "waited": 0, "shed": 0, "timed_out": 0}
+
+    # --- fair selection ---
+
+    def _activate(self, role, user):
+        users = self._queues.setdefault(role, {})
+        if not users:
+            active = [self._role_vt[r] for r, u in self._queues.items() if u and r != role]
+            self._role_vt[role] = max(self._role_vt.get(role, 0.0), min(active, default=0.0))
+        if user not in users:
+            active = [self._user_vt[u] for u in users]
+            self._user_vt[user] = min(active, default=0.0)
+            users[user] = deque()
+        return users[user]
+
+    def _dequeue(self, role, user):
+        users = self._queues[role]
+        waiter = users[user].popleft()
+        if not users[user]:
+            del users[user]
+            del self._user_vt[user]
+        self._queued -= 1
+        return waiter
+
+    def _next_waiter(self):
+        roles = [role for role, users in self._queues.items() if users]
+        if not roles:
+            return None
+        role = min(roles, key=lambda r: self._role_vt[r])
+        user = min(self._queues[role], key=lambda u: self._user_vt[u])
+        self._role_vt[role] += 1.0 / self.role_weights.get(role, 1)
+        self._user_vt[user] += 1.0
+        return self._dequeue(role, user)
+
+    def _estimated_wait(self, role, user) -> float:
+        """Seconds until a new call for `user` would start, assuming each
+        queued user is served in turn."""
+        own = len(self._queues.get(role, {}).get(user, ()))
+        ahead = own + sum(min(len(queue), own + 1)
+                          for users in self._queues.values() for u, queue in users.items() if u != user)
+        return (ahead + 1) / self.max_in_flight * self.service_seconds
+
+    # --- admission ---
+
+    def _enqueue(self, user, role, shed, notify=None):
+        """Takes a free slot (returns None) or queues a waiter and returns it;
+        with `shed`, raises ServerBusy when the wait would be too long."""
+        with self._lock:
+            if self.in_flight < self.max_in_flight and not self._queued:
+                self.in_flight += 1
+                self.stats["admitted"] += 1
+                self._waits_ms.append(0.0)
+                return None
+            if shed:
+                queue = self._queues.get(role, {}).get(user, ())
+                estimate = self._estimated_wait(role, user)
+                if len(queue) >= self.user_queue or estimate > self.max_wait:
+                    self.stats["shed"] += 1
+                    reason = "too many of your requests queued" if len(queue) >= self.user_queue else "queue full"
+                    raise ServerBusy(estimate, reason)
+            waiter = _Waiter(user, role, notify)
+            self._activate(role, user).append(waiter)
+            self._queued += 1
+            self.stats["waited"] += 1
+            return waiter
+
+    def _withdraw(self, waiter, timed_out=True):
+        """Takes a waiter that gave up out of the queue and returns its
+        estimated wait; None if it was admitted meanwhile and holds a slot."""
+        role, user = waiter.role, waiter.user
+        with self._lock:
+            if waiter.admitted:
+                return None
+            self._queues[role][user].remove(waiter)
+            self._queued -= 1
+            if not self._queues[role][user]:
+                del self._queues[role][user]
+                del self._user_vt[user]
+            if timed_out:
+                self.stats["timed_out"] += 1
+            return self._estimated_wait(role, user)
+
+    def _waited(self, started, role) -> float:
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._waits_ms.append(waited * 1000)
+        record("admission.wait", waited * 1000, role=role)
+        return waited
+
+    def acquire(self, user=ANONYMOUS, role=ADMISSION_DEFAULT_ROLE, shed=True) -> float:
+        """Blocks until a slot is free for this caller and returns the seconds
+        waited; raises ServerBusy instead when the wait would be too long.
+        With `shed=False` it waits however long it takes."""
+        started = time.perf_counter()
+        waiter = self._enqueue(user, role, shed)
+        if waiter is None:
+            return 0.0
+        if not waiter.event.wait(self.max_wait if shed else None):
+            estimate = self._withdraw(waiter)
+            if estimate is not None:
+                raise ServerBusy(estimate, "timed out in queue")
+        return self._waited(started, role)
+
+    async def acquire_async(self, user=ANONYMOUS, role=ADMISSION_DEFAULT_ROLE, shed=True) -> float:
+        """`acquire` for coroutines: waits on the event loop, holding no thread."""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: admitted.done() or admitted.set_result(None))
+
+        waiter = self._enqueue(user, role, shed, notify)
+        if waiter is None:
+            return 0.0
+        try:
+            await asyncio.wait_for(asyncio.shield(admitted), self.max_wait if shed else None)
+        except asyncio.TimeoutError:
+            estimate = self._withdraw(waiter)
+            if estimate is not None:
+                raise ServerBusy(estimate, "timed out in queue")
+        except asyncio.CancelledError:
+            if self._withdraw(waiter, timed_out=False) is None:
+                self.release()  # admitted just as we were cancelled
+            raise
+        return self._waited(started, role)
+
+    def release(self, duration: float | None = None):
+        """Frees a slot (after a call of `duration` seconds) and hands it to the next waiter."""
+        with self._lock:
+            if duration is not None:
+                self.service_seconds += 0.1 * (duration - self.service_seconds)
+            waiter = self._next_waiter()
+            if waiter is None:
+                self.in_flight -= 1
+                return
+            waiter.admitted = True
+            self.stats["admitted"] += 1
+        waiter.event.set()  # the slot passes straight to the waiter; in_flight is unchanged
+        if waiter.notify is not None:
+            waiter.notify()
+
+    @contextlib.contextmanager
+    def admit(self, user=None, role=None):
+        """Holds a slot for the block. Nested admissions in the same context
+        (a model call made while one is running) pass straight through."""
+        if _holding.get():
+            yield
+            return
+        if user is None:
+            user, role = get_caller()
+        self.acquire(user, role or ADMISSION_DEFAULT_ROLE)
+        token = _holding.set(True)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            _holding.reset(token)
+            self.release(time.perf_counter() - started)
+
+    @contextlib.asynccontextmanager
+    async def admit_async(self, user=None, role=None, shed=True):
+        """`admit` for coroutines on the provider loop: the wait for a slot
+        does not block the loop, which keeps serving other calls. Pass
+        `user`/`role` explicitly, as the loop does not see the caller's
+        context; `shed=False` queues instead of refusing (see the class)."""
+        if user is None:
+            user, role = get_caller()
+        await self.acquire_async(user, role or ADMISSION_DEFAULT_ROLE, shed)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def admit_stream(self, chunks, user=None, role=None):
+        """Passes `chunks` through, holding a slot from the first chunk
+        requested until the stream ends or is closed."""
+        if user is None:
+            user, role = get_caller()
+        self.acquire(user, role or ADMISSION_DEFAULT_ROLE)
+        started = time.perf_counter()
+        try:
+            yield from chunks
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def snapshot(self) -> dict:
+        """Current queue depth by role and user, in-flight calls, wait percentiles and counters."""
+        with self._lock:
+            waits = sorted(self._waits_ms)
+            depth = {role: {user: len(queue) for user, queue in users.items()}
+                     for role, users in self._queues.items() if users}
+            state = {"in_flight": self.in_flight, "max_in_flight": self.max_in_flight, "queued": self._queued,
+                     "queue_depth": depth, "service_seconds": round(self.service_seconds, 3), **self.stats}
+
+        def pct(q):
+            return round(waits[min(len(waits) - 1, int(q / 100 * len(waits)))], 1) if waits else None
+
+        return {**state, "wait_p50_ms": pct(50), "wait_p95_ms": pct(95), "wait_p99_ms": pct(99)}
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission() -> AdmissionController:
+    """The process-wide controller every model call goes through."""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController()
+                add_metrics_source("admission", lambda: get_admission().snapshot())
+    return _controller
+
+
+def admission_stats() -> dict:
+    """Queue depth by role and user, in-flight calls and wait percentiles;
+    also served by the trace metrics endpoint (utils/logger)."""
+    return get_admission().snapshot()
@@ -3,6 +3,7 @@
 import streamlit as st
 from agent_caller import call_agent
 from model_selector import get_api_key
+from utils.admission import ServerBusy
 
 def safely_call_agent(
     provider,
@@ -33,6 +34,9 @@ def safely_call_agent(
             chaining_enabled=chaining_enabled,
             secrets=secrets
         )
+    except ServerBusy as e:
+        st.warning(f"⏳ {e}")
+        return None
     except Exception as e:
         st.error(f"❌ Agent call failed: {e}")
         return None
\ No newline at end of file
@@ -0,0 +1,144 @@
+# utils/auth.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.cookies import SimpleCookie
+
+import firebase_admin
+import streamlit as st
+from firebase_admin import auth as admin_auth, credentials
+
+from config import ADMIN_EMAIL_DOMAINS
+from tools.shards import set_tenant
+from utils.admission import set_caller
+from utils.logger import span
+
+LOGIN_URL = "/public/login.html"
+TOKEN_CACHE_SIZE = 10000
+EXPIRY_SKEW_SECONDS = 30  # treat tokens this close to `exp` as expired
+
+_tokens = OrderedDict()  # sha256(token) -> decoded claims
+_tokens_lock = threading.Lock()
+
+
+@st.cache_resource(show_spinner=False)
+def init_firebase():
+    """
+    Initializes the Firebase Admin app once per process.
+
+    Token verification goes through this single app, whose verifier keeps
+    Google's signing certificates in an HTTP cache for their max-age, so
+    certificates are not re-fetched per verification.
+    """
+    if firebase_admin._apps:
+        return firebase_admin.get_app()
+    cred = credentials.Certificate(json.loads(os.environ["FIREBASE_KEY_JSON"]))
+    return firebase_admin.initialize_app(cred)
+
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def verify_token(token: str) -> dict:
+    """
+    Decoded claims for a Firebase ID token. Verified claims are cached by
+    token hash until shortly before the token's `exp`, so repeat loads skip
+    signature verification. Raises on an invalid or expired token.
+    """
+    key = _token_hash(token)
+    now = time.time()
+    with _tokens_lock:
+        claims = _tokens.get(key)
+        if claims is not None:
+            if claims["exp"] - EXPIRY_SKEW_SECONDS > now:
+                _tokens.move_to_end(key)
+                return claims
+            del _tokens[key]
+
+    with span("auth.verify_token"):
+        claims = admin_auth.verify_id_token(token, app=init_firebase())
+    with _tokens_lock:
+        _tokens[key] = claims
+        while len(_tokens) > TOKEN_CACHE_SIZE:
+            _tokens.popitem(last=False)
+    return claims
+
+
+def _cookie_token():
+    try:
+        import streamlit.runtime.scriptrunner.script_run_context as src
+        headers = src.get_script_run_ctx().request.headers
+        if "cookie" in headers:
+            cookie = SimpleCookie()
+            cookie.load(headers["cookie"])
+            if "id_token" in cookie:
+                return cookie["id_token"].value
+    except Exception:
+        pass
+    return None
+
+
+def _redirect_to_login(message):
+    st.warning(message)
+    st.markdown(f'<meta http-equiv="refresh" content="0;url={LOGIN_URL}">', unsafe_allow_html=True)
+    st.stop()
+
+
+def user_role(email: str) -> str:
+    return "admin" if email.endswith(tuple(ADMIN_EMAIL_DOMAINS)) else "tech"
+
+
+def require_user() -> dict:
+    """
+    The signed-in user ({"email", "photoUrl"}), established within the
+    current script run. A session that already has a user returns
+    immediately; otherwise the ID token from the session or the `id_token`
+    cookie is verified and stored. Without a valid token the page redirects
+    to the login page and stops.
+
+    Model calls made later in the run are queued as this user's (see
+    utils/admission), and retrieval searches the shards of the tenant named
+    in their `tenant` custom claim (see tools/shards), if any.
+    """
+    init_firebase()
+    if "user" in st.session_state:
+        user = st.session_state["user"]
+        set_caller(user["email"], user_role(user["email"]))
+        set_tenant(user.get("tenant"))
+        return user
+
+    token = st.session_state.get("id_token")
+    if not token and not st.session_state.get("signed_out"):
+        # The browser keeps its cookie after signing out; don't sign back in from it.
+        token = _cookie_token()
+    if not token:
+        _redirect_to_login("Redirecting to login...")
+
+    try:
+        claims = verify_token(token)
+    except Exception:
+        st.session_state.pop("id_token", None)
+        st.error("Invalid login. Please try again.")
+        _redirect_to_login("Redirecting to login...")
+
+    st.session_state["id_token"] = token
+    st.session_state["user"] = {"email": claims["email"], "photoUrl": claims.get("picture", ""),
+                                "tenant": claims.get("tenant")}
+    set_caller(claims["email"], user_role(claims["email"]))
+    set_tenant(claims.get("tenant"))
+    return st.session_state["user"]
+
+
+def sign_out():
+    """Forgets the session's user and token so the next run asks for a login."""
+    token = st.session_state.pop("id_token", None)
+    st.session_state.pop("user", None)
+    st.session_state["signed_out"] = True
+    if token:
+        with _tokens_lock:
+            _tokens.pop(_token_hash(token), None)
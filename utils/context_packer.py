@@ -0,0 +1,142 @@
+# utils/context_packer.py
+
+import re
+
+from config import (CONTEXT_BUDGET_FRACTION, CONTEXT_DEDUP_THRESHOLD, CONTEXT_MAX_TOKENS, CONTEXT_SOURCES)
+from utils.tokens import count_tokens, truncate_to_tokens
+
+SHINGLE_WORDS = 5
+MIN_TRUNCATED_TOKENS = 64  # don't squeeze in a chunk as a shorter fragment than this
+RETRIEVAL_SEPARATOR = "\n---\n"
+
+
+class Chunk:
+    __slots__ = ("source", "text", "score", "tokens", "shingles")
+
+    def __init__(self, source, text, score):
+        self.source = source
+        self.text = text
+        self.score = score
+        self.tokens = 0
+        self.shingles = _shingles(text)
+
+
+class PackedContext:
+    __slots__ = ("text", "budget", "tokens_by_source", "chunks_by_source", "dropped", "duplicates")
+
+    def __init__(self, text, budget, tokens_by_source, chunks_by_source, dropped, duplicates):
+        self.text = text
+        self.budget = budget
+        self.tokens_by_source = tokens_by_source
+        self.chunks_by_source = chunks_by_source
+        self.dropped = dropped
+        self.duplicates = duplicates
+
+    def report(self) -> dict:
+        return {
+            "budget": self.budget,
+            "tokens": sum(self.tokens_by_source.values()),
+            "tokens_by_source": dict(self.tokens_by_source),
+            "chunks_by_source": dict(self.chunks_by_source),
+            "dropped": dict(self.dropped),
+            "duplicates": self.duplicates,
+        }
+
+
+def _shingles(text: str) -> frozenset:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1))
+
+
+def _similarity(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def context_budget(model: str, reserved_tokens: int = 0) -> int:
+    """Tokens available for context in `model`'s prompt after `reserved_tokens`."""
+    from model_selector import get_context_tokens  # model_selector pulls in streamlit
+
+    budget = min(CONTEXT_MAX_TOKENS, int(get_context_tokens(model) * CONTEXT_BUDGET_FRACTION))
+    return max(0, budget - reserved_tokens)
+
+
+def as_chunks(source: str, value) -> list:
+    """
+    Chunks from a step result: retrieval hits ([text, score] pairs), a
+    "---"-separated retrieval block, or any other text as a single chunk.
+    Chunks without a score rank in the order given.
+    """
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        chunks = []
+        for position, item in enumerate(value):
+            if isinstance(item, (list, tuple)):
+                chunks.append(Chunk(source, str(item[0]), float(item[1])))
+            else:
+                chunks.append(Chunk(source, str(item), -float(position)))
+        return chunks
+    parts = str(value).split(RETRIEVAL_SEPARATOR) if source == "retrieval" else [str(value)]
+    return [Chunk(source, part, -float(position)) for position, part in enumerate(parts) if part.strip()]
+
+
+def pack_context(sources: dict, model: str, budget: int | None = None, reserved_tokens: int = 0) -> PackedContext:
+    """
+    Assembles prompt context from step results within a token budget.
+
+    Args:
+        sources (dict): {source: step result}; sources are packed in
+            config.CONTEXT_SOURCES order, each under its heading.
+        model (str): Target model; sets the tokenizer and default budget.
+        budget (int): Token budget; defaults to `context_budget(model, reserved_tokens)`.
+        reserved_tokens (int): Tokens already used by the prompt and history.
+
+    Returns:
+        PackedContext: the context text plus per-source token counts, chunks
+        kept, chunks dropped for budget and near-duplicates removed.
+    """
+    budget = context_budget(model, reserved_tokens) if budget is None else budget
+    order = list(CONTEXT_SOURCES) + [s for s in sources if s not in CONTEXT_SOURCES]
+
+    kept, duplicates = [], 0
+    dropped = {source: 0 for source in sources}
+    tokens_by_source = {source: 0 for source in sources}
+    remaining = budget
+    for source in order:
+        if source not in sources:
+            continue
+        header_tokens = count_tokens(f"\n\n{CONTEXT_SOURCES.get(source, source)}:\n", model)
+        candidates = sorted(as_chunks(source, sources[source]), key=lambda chunk: chunk.score, reverse=True)
+        source_started = False
+        for chunk in candidates:
+            if any(_similarity(chunk.shingles, other.shingles) >= CONTEXT_DEDUP_THRESHOLD for other in kept):
+                duplicates += 1
+                continue
+            chunk.tokens = count_tokens(chunk.text, model)
+            cost = chunk.tokens + (0 if source_started else header_tokens)
+            if cost > remaining:
+                room = remaining - (0 if source_started else header_tokens)
+                if room < MIN_TRUNCATED_TOKENS:
+                    dropped[source] += 1
+                    continue
+                chunk.text = truncate_to_tokens(chunk.text, room, model)
+                chunk.tokens = count_tokens(chunk.text, model)
+                cost = chunk.tokens + (0 if source_started else header_tokens)
+            kept.append(chunk)
+            remaining -= cost
+            tokens_by_source[source] += cost
+            source_started = True
+
+    sections = []
+    for source in order:
+        texts = [chunk.text for chunk in kept if chunk.source == source]
+        if texts:
+            separator = RETRIEVAL_SEPARATOR if source == "retrieval" else "\n\n"
+            sections.append(f"\n\n{CONTEXT_SOURCES.get(source, source)}:\n{separator.join(texts)}")
+
+    chunks_by_source = {source: sum(1 for chunk in kept if chunk.source == source) for source in sources}
+    return PackedContext("".join(sections), budget, tokens_by_source, chunks_by_source, dropped, duplicates)
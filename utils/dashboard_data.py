@@ -0,0 +1,64 @@
+# utils/dashboard_data.py
+
+import streamlit as st
+from firebase_admin import firestore
+
+from utils.logger import span
+
+# Admin aggregates are shared by every session and refreshed at most this often.
+ADMIN_SUMMARY_TTL = 60
+
+USER_FIELDS = ["email", "role", "usage"]
+
+
+@st.cache_data(ttl=ADMIN_SUMMARY_TTL, show_spinner=False)
+def load_admin_summary():
+    """
+    Aggregates the users collection in a single streamed pass.
+
+    Only the fields the dashboard shows are fetched. The result is cached
+    process-wide, so reruns and other admin sessions within the TTL cost no
+    Firestore reads.
+
+    Returns:
+        dict: total_users, login_count and activity rows (email, role,
+        logins, lastLogin) for users who have logged in.
+    """
+    db = firestore.client()
+    total_users = 0
+    activity = []
+
+    with span("firestore.read", collection="users", query="admin_summary") as read_span:
+        for user in db.collection("users").select(USER_FIELDS).stream():
+            info = user.to_dict()
+            total_users += 1
+            usage = info.get("usage", {})
+            if usage.get("lastLogin"):
+                activity.append({
+                    "email": info.get("email", "N/A"),
+                    "role": info.get("role", "tech"),
+                    "logins": usage.get("logins", 0),
+                    "lastLogin": usage.get("lastLogin", "N/A")
+                })
+        read_span.set(documents=total_users)
+
+    return {"total_users": total_users, "login_count": len(activity), "activity": activity}
+
+
+def load_user_stats(email):
+    """
+    Reads one user's own usage: a single document read by id, falling back
+    to an email query for documents not keyed by email.
+
+    Returns:
+        dict: logins and lastLogin for the user.
+    """
+    db = firestore.client()
+    with span("firestore.read", collection="users", query="user_stats"):
+        doc = db.collection("users").document(email).get()
+        if not doc.exists:
+            matches = list(db.collection("users").where("email", "==", email).limit(1).stream())
+            doc = matches[0] if matches else None
+
+    usage = (doc.to_dict() or {}).get("usage", {}) if doc else {}
+    return {"logins": usage.get("logins", 0), "lastLogin": usage.get("lastLogin", "Unknown")}
@@ -0,0 +1,266 @@
+# utils/log_writer.py
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+from firebase_admin import firestore
+
+from config import LOG_BATCH_SIZE, LOG_FLUSH_SECONDS, LOG_MAX_RETRIES, LOG_QUEUE_SIZE, LOG_SPILL_PATH
+from utils.logger import span
+
+FIRESTORE_BATCH_LIMIT = 500
+BACKOFF_SECONDS = 0.5
+SERVER_TIMESTAMP_MARKER = {"__sentinel__": "SERVER_TIMESTAMP"}
+
+
+class _Record:
+    __slots__ = ("path", "doc_id", "data")
+
+    def __init__(self, path, doc_id, data):
+        self.path = path
+        self.doc_id = doc_id
+        self.data = data
+
+
+def _encode(data: dict) -> dict:
+    return {k: SERVER_TIMESTAMP_MARKER if v is firestore.SERVER_TIMESTAMP else v for k, v in data.items()}
+
+
+def _decode(data: dict) -> dict:
+    return {k: firestore.SERVER_TIMESTAMP if v == SERVER_TIMESTAMP_MARKER else v for k, v in data.items()}
+
+
+class LogWriter:
+    """
+    Write-behind logger for Firestore.
+
+    `log()` only enqueues; a background thread commits records with batched
+    writes of up to `batch_size` documents, as soon as a batch is full or
+    `flush_interval` seconds after its first record. Failed commits are
+    retried with exponential backoff, then appended to a local JSONL spill
+    file, which is replayed after the next successful commit. Records keep
+    the document id assigned on their first attempt, so a retried or
+    replayed write never duplicates a document.
+
+    `client_factory` returns a Firestore client (or anything with the same
+    collection/document/batch API, e.g. MemoryFirestore).
+    """
+
+    def __init__(self, client_factory=None, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_SECONDS,
+                 max_retries=LOG_MAX_RETRIES, spill_path=LOG_SPILL_PATH, max_queue=LOG_QUEUE_SIZE):
+        self.client_factory = client_factory or firestore.client
+        self.batch_size = max(1, min(batch_size, FIRESTORE_BATCH_LIMIT))
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.spill_path = spill_path
+        self._client = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.stats = {"written": 0, "batches": 0, "retries": 0, "spilled": 0, "replayed": 0}
+        self._thread = threading.Thread(target=self._run, name="firestore-log-writer", daemon=True)
+        self._thread.start()
+
+    def log(self, path: str, data: dict, doc_id: str | None = None):
+        """Queues `data` for the collection at `path` (e.g. "ai_logs" or
+        "user_sessions/<email>/sessions"); `doc_id=None` auto-generates one.
+        Never blocks: when the queue is full the record goes to the spill file."""
+        record = _Record(path, doc_id, dict(data))
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._spill([record])
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Commits everything queued so far; True once it has been written or spilled."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 10.0):
+        """Drains the queue and stops the writer thread."""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        try:
+            # Wake the writer out of its flush-interval wait; a full queue needs no waking.
+            self._queue.put_nowait(threading.Event())
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # --- writer thread ---
+
+    def _collect(self):
+        """Blocks for a batch: returns (records, flush events)."""
+        records, events = [], []
+        deadline = None
+        while len(records) < self.batch_size:
+            wait = self.flush_interval if deadline is None else deadline - time.monotonic()
+            if wait <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                if deadline is None and not self._stopping.is_set():
+                    continue
+                break
+            if isinstance(item, threading.Event):
+                events.append(item)
+                break
+            records.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return records, events
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            records, events = self._collect()
+            if records and self._write(records):
+                self._replay_spill()
+            for event in events:
+                event.set()
+
+    def _commit(self, records):
+        if self._client is None:
+            self._client = self.client_factory()
+        batch = self._client.batch()
+        for record in records:
+            collection = self._client.collection(record.path)
+            if record.doc_id is None:
+                ref = collection.document()
+                record.doc_id = ref.id
+            else:
+                ref = collection.document(record.doc_id)
+            batch.set(ref, _decode(record.data))
+        with span("firestore.write", records=len(records)):
+            batch.commit()
+
+    def _write(self, records) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._commit(records)
+                self.stats["written"] += len(records)
+                self.stats["batches"] += 1
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"[LogWriter] Firestore commit failed, spilling {len(records)} records: {e}")
+                    break
+                self.stats["retries"] += 1
+                # Shorter waits while shutting down so exit isn't held up.
+                delay = BACKOFF_SECONDS * (2 ** attempt)
+                time.sleep(min(delay, 1.0) if self._stopping.is_set() else delay)
+        self._spill(records)
+        return False
+
+    # --- spill file ---
+
+    def _spill(self, records):
+        for record in records:
+            if record.doc_id is None:
+                record.doc_id = uuid.uuid4().hex[:20]
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps({"path": record.path, "doc_id": record.doc_id,
+                                        "data": _encode(record.data)}, default=str) + "\n")
+        self.stats["spilled"] += len(records)
+
+    def _replay_spill(self):
+        replay_path = self.spill_path + ".replay"
+        with self._spill_lock:
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spill_path):
+                    return
+                os.replace(self.spill_path, replay_path)
+
+        with open(replay_path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        records = [_Record(row["path"], row["doc_id"], row["data"]) for row in rows]
+
+        for start in range(0, len(records), self.batch_size):
+            chunk = records[start:start + self.batch_size]
+            try:
+                self._commit(chunk)
+            except Exception:
+                # Still unreachable: keep the rest for the next successful commit.
+                self._spill(records[start:])
+                self.stats["spilled"] -= len(records) - start
+                break
+            self.stats["replayed"] += len(chunk)
+        os.remove(replay_path)
+
+
+class MemoryFirestore:
+    """
+    In-memory stand-in for the Firestore client API used by LogWriter.
+    `fail_commits` makes that many commits raise, to simulate an outage.
+    """
+
+    def __init__(self, fail_commits: int = 0):
+        self.docs = {}  # (collection path, doc id) -> data
+        self.commits = 0
+        self.fail_commits = fail_commits
+        self._lock = threading.Lock()
+
+    def collection(self, path):
+        return _MemoryCollection(path)
+
+    def batch(self):
+        return _MemoryBatch(self)
+
+
+class _MemoryCollection:
+    def __init__(self, path):
+        self.path = path
+
+    def document(self, doc_id=None):
+        ref = _MemoryCollection(self.path)
+        ref.id = doc_id or uuid.uuid4().hex[:20]
+        return ref
+
+
+class _MemoryBatch:
+    def __init__(self, store):
+        self.store = store
+        self.writes = []
+
+    def set(self, ref, data):
+        self.writes.append(((ref.path, ref.id), data))
+
+    def commit(self):
+        with self.store._lock:
+            if self.store.fail_commits:
+                self.store.fail_commits -= 1
+                raise ConnectionError("Firestore unavailable")
+            self.store.docs.update(self.writes)
+            self.store.commits += 1
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer() -> LogWriter:
+    """Process-wide writer; flushed at interpreter exit."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LogWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+
+def log_event(path: str, data: dict, doc_id: str | None = None):
+    """Queues a Firestore write without waiting for it."""
+    get_log_writer().log(path, data, doc_id)
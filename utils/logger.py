@@ -0,0 +1,264 @@
+# utils/logger.py
+
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import (TRACE_BACKUPS, TRACE_ENABLED, TRACE_MAX_BYTES, TRACE_METRICS_PORT, TRACE_PATH,
+                    TRACE_WINDOW)
+
+_enabled = False
+_request_id = contextvars.ContextVar("request_id", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_histograms = {}
+_histograms_lock = threading.Lock()
+_trace_log = logging.getLogger("chatterfix.trace")
+_trace_log.propagate = False
+_listener = None
+_metrics_server = None
+_sources = {}  # name -> callable returning a JSON-able snapshot, served with the histograms
+
+
+class _NoopSpan:
+    """Returned by `span` while tracing is off; entering it does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Histogram:
+    """Latency samples (ms) for one span name: a bounded window for
+    percentiles plus all-time count and total."""
+    __slots__ = ("samples", "count", "total_ms", "errors", "lock")
+
+    def __init__(self, window=TRACE_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total_ms = 0.0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def add(self, ms, error=False):
+        with self.lock:
+            self.samples.append(ms)
+            self.count += 1
+            self.total_ms += ms
+            self.errors += error
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            ordered = sorted(self.samples)
+            count, total, errors = self.count, self.total_ms, self.errors
+
+        def pct(q):
+            return round(ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))], 3) if ordered else None
+
+        return {"count": count, "errors": errors, "mean_ms": round(total / count, 3) if count else None,
+                "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99)}
+
+
+class Span:
+    __slots__ = ("name", "attrs", "span_id", "parent_id", "started", "token")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = None
+        self.started = 0.0
+        self.token = None
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.token = _current_span.set(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ms = (time.perf_counter() - self.started) * 1000
+        _current_span.reset(self.token)
+        error = f"{exc_type.__name__}: {exc}" if exc_type is not None else None
+        _emit(self.name, ms, self.attrs, self.span_id, self.parent_id, error)
+        return False
+
+    def set(self, **attrs):
+        """Adds attributes known only once the span is running (e.g. result counts)."""
+        self.attrs.update(attrs)
+
+
+def _histogram(name) -> Histogram:
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, Histogram())
+    return histogram
+
+
+def _emit(name, ms, attrs, span_id=None, parent_id=None, error=None):
+    _histogram(name).add(ms, error is not None)
+    record = {"ts": time.time(), "name": name, "ms": round(ms, 3), "request_id": _request_id.get()}
+    if span_id:
+        record["span_id"] = span_id
+    if parent_id:
+        record["parent_id"] = parent_id
+    if attrs:
+        record["attrs"] = attrs
+    if error:
+        record["error"] = error
+    # QueueHandler: the hot path only enqueues; a listener thread writes the file.
+    _trace_log.info(json.dumps(record, default=str))
+
+
+def span(name: str, **attrs):
+    """
+    Context manager timing a block as `name`, nested under the enclosing
+    span and tagged with the current request id. A shared no-op while
+    tracing is disabled.
+    """
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def record(name: str, ms: float, **attrs):
+    """Records a duration measured elsewhere (e.g. a stream's total time)."""
+    if _enabled:
+        _emit(name, ms, attrs)
+
+
+def timed(name: str | None = None):
+    """Decorator form of `span`; the name defaults to module.function."""
+    def decorate(fn):
+        span_name = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with Span(span_name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# --- correlation ids ---
+
+def new_request_id(request_id: str | None = None) -> str:
+    """Starts a new request: spans from here on (in this context) carry its
+    id, `request_id` if given, else a fresh one."""
+    request_id = request_id or uuid.uuid4().hex[:12]
+    _request_id.set(request_id)
+    return request_id
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def bind_context(fn):
+    """`fn` wrapped to run in a copy of the caller's context, so work handed
+    to a thread pool keeps the request id and parent span."""
+    context = contextvars.copy_context()
+    return functools.partial(context.run, fn)
+
+
+# --- export ---
+
+def metrics() -> dict:
+    """{span name: count, errors, mean and p50/p95/p99 ms} for every span seen,
+    plus the current snapshot of each registered source."""
+    with _histograms_lock:
+        items = list(_histograms.items())
+    result = {name: histogram.snapshot() for name, histogram in sorted(items)}
+    for name, source in list(_sources.items()):
+        result[name] = source()
+    return result
+
+
+def add_metrics_source(name: str, source):
+    """Includes `source()` (e.g. a queue's current depth) in `metrics()` as `name`."""
+    _sources[name] = source
+
+
+def reset_metrics():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = json.dumps(metrics()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_metrics(port: int):
+    """Serves `metrics()` as JSON at http://localhost:<port>/metrics from a daemon thread."""
+    global _metrics_server
+    if _metrics_server is None:
+        _metrics_server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+        threading.Thread(target=_metrics_server.serve_forever, name="trace-metrics", daemon=True).start()
+    return _metrics_server
+
+
+def enable(path: str = TRACE_PATH, metrics_port: int = TRACE_METRICS_PORT):
+    """Turns tracing on: spans are recorded, written to `path` (rotating) and,
+    with `metrics_port`, served over HTTP."""
+    global _enabled, _listener
+    if _listener is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=TRACE_MAX_BYTES,
+                                                            backupCount=TRACE_BACKUPS, encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        records = queue.SimpleQueue()
+        _trace_log.addHandler(logging.handlers.QueueHandler(records))
+        _trace_log.setLevel(logging.INFO)
+        _listener = logging.handlers.QueueListener(records, file_handler)
+        _listener.start()
+        atexit.register(_listener.stop)  # flush queued records on exit
+    if metrics_port:
+        serve_metrics(metrics_port)
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+if TRACE_ENABLED:
+    enable()
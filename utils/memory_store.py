@@ -0,0 +1,311 @@
+# utils/memory_store.py
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from config import (MEMORY_BACKEND, MEMORY_KEEP_TURNS, MEMORY_MAX_SESSIONS, MEMORY_MAX_TURNS, MEMORY_PATH,
+                    MEMORY_SUMMARY_MODEL, MEMORY_SUMMARY_PROVIDER, MEMORY_SUMMARY_TOKENS, MEMORY_TOKEN_BUDGET)
+from utils.logger import span
+from utils.tokens import count_tokens, truncate_to_tokens
+
+ROLE_LABELS = {"user": "User", "assistant": "Assistant", "system": "System"}
+
+
+class Turn:
+    __slots__ = ("role", "text", "tokens", "ts")
+
+    def __init__(self, role, text, tokens, ts=None):
+        self.role = role
+        self.text = text
+        self.tokens = tokens
+        self.ts = ts if ts is not None else time.time()
+
+    def to_dict(self):
+        return {"role": self.role, "text": self.text, "tokens": self.tokens, "ts": self.ts}
+
+    def render(self):
+        return f"{ROLE_LABELS.get(self.role, self.role.title())}: {self.text}"
+
+
+# --- summarizers: (previous summary, turns to fold in, max tokens) -> summary ---
+
+def extractive_summary(summary, turns, max_tokens):
+    """Keeps the opening sentence of each folded turn; no model call."""
+    lines = [summary] if summary else []
+    for turn in turns:
+        first = turn.text.strip().split("\n", 1)[0]
+        first = first.split(". ", 1)[0][:300]
+        lines.append(f"{ROLE_LABELS.get(turn.role, turn.role)}: {first}")
+    text = "\n".join(lines)
+    # Keep the newest material when over budget.
+    while count_tokens(text) > max_tokens and len(lines) > 1:
+        lines.pop(0)
+        text = "\n".join(lines)
+    return truncate_to_tokens(text, max_tokens)
+
+
+def model_summarizer(provider, model):
+    """A summarizer that asks `model` to fold turns into the running summary,
+    falling back to the extractive one if the call fails."""
+    def summarize(summary, turns, max_tokens):
+        from utils.providers import call_agent  # imported late: providers pulls in the router
+
+        transcript = "\n".join(turn.render() for turn in turns)
+        prompt = (
+            f"Update the running summary of a maintenance support conversation. Keep equipment, "
+            f"symptoms, steps already tried and open questions. At most {max_tokens} tokens.\n\n"
+            f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}\n\nUpdated summary:"
+        )
+        try:
+            return truncate_to_tokens(call_agent(provider, prompt, model, temperature=0.2).strip(), max_tokens)
+        except Exception as e:
+            print(f"[Memory] Summarization failed, using extractive summary: {e}")
+            return extractive_summary(summary, turns, max_tokens)
+    return summarize
+
+
+def default_summarizer():
+    if MEMORY_SUMMARY_PROVIDER and MEMORY_SUMMARY_MODEL:
+        return model_summarizer(MEMORY_SUMMARY_PROVIDER, MEMORY_SUMMARY_MODEL)
+    return extractive_summary
+
+
+# --- backends: load(session_id) -> state dict or None, save(session_id, state) ---
+
+class InMemoryBackend:
+    def __init__(self):
+        self._states = {}
+
+    def load(self, session_id):
+        return self._states.get(session_id)
+
+    def save(self, session_id, state):
+        self._states[session_id] = state
+
+
+class FileBackend:
+    """One JSON file per session, replaced atomically."""
+
+    def __init__(self, root=MEMORY_PATH):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, session_id):
+        safe = "".join(c if c.isalnum() or c in "-_.@" else "_" for c in session_id)
+        return os.path.join(self.root, f"{safe}.json")
+
+    def load(self, session_id):
+        try:
+            with open(self._path(session_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, session_id, state):
+        path = self._path(session_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+
+class FirestoreBackend:
+    """
+    One document per session in `collection`. Saves go through the
+    write-behind log writer, so recording a turn never waits on Firestore.
+    """
+
+    def __init__(self, collection="conversation_memory"):
+        self.collection = collection
+
+    def load(self, session_id):
+        from firebase_admin import firestore
+        with span("firestore.read", collection=self.collection):
+            doc = firestore.client().collection(self.collection).document(session_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def save(self, session_id, state):
+        from utils.log_writer import log_event
+        log_event(self.collection, state, doc_id=session_id)
+
+
+BACKENDS = {"memory": InMemoryBackend, "file": FileBackend, "firestore": FirestoreBackend}
+
+
+class ConversationMemory:
+    """
+    Token-budgeted memory for one conversation.
+
+    Turns sit in a ring buffer of at most `max_turns` __slots__ records,
+    with a running token count. Whenever the turns exceed `budget_tokens`
+    (or the buffer is full), the oldest are folded into a rolling summary
+    of at most `summary_tokens`, keeping the last `keep_turns` verbatim, so
+    the context handed to the model stays bounded however long the session
+    runs. State is written to `backend` after every change.
+
+    The summarizer may be a model call, so it runs outside the lock: turns
+    to fold are moved to a pending list under the lock (still shown by
+    `context_window` and saved), summarized in order by one thread at a
+    time, and merged back under the lock.
+    """
+
+    def __init__(self, session_id, backend=None, budget_tokens=MEMORY_TOKEN_BUDGET,
+                 summary_tokens=MEMORY_SUMMARY_TOKENS, max_turns=MEMORY_MAX_TURNS, keep_turns=MEMORY_KEEP_TURNS,
+                 summarizer=None, model=None):
+        self.session_id = session_id
+        self.backend = backend or InMemoryBackend()
+        self.budget_tokens = budget_tokens
+        self.summary_tokens = summary_tokens
+        self.keep_turns = keep_turns
+        self.summarizer = summarizer or default_summarizer()
+        self.model = model  # tokenizer to count with
+        self.summary = ""
+        self.summary_token_count = 0
+        self.turn_tokens = 0
+        self._turns = deque(maxlen=max_turns)
+        self._unfolded = []        # turns taken out of _turns, not yet in the summary
+        self._generation = 0       # bumped by clear(), so a fold in flight is dropped
+        self._lock = threading.RLock()
+        self._fold_lock = threading.Lock()
+
+        state = self.backend.load(session_id)
+        if state:
+            self.summary = state.get("summary", "")
+            self.summary_token_count = count_tokens(self.summary, model)
+            for turn in state.get("turns", [])[-max_turns:]:
+                self._turns.append(Turn(turn["role"], turn["text"], turn["tokens"], turn.get("ts")))
+                self.turn_tokens += turn["tokens"]
+
+    def __len__(self):
+        return len(self._turns)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.summary_token_count + self.turn_tokens
+
+    def add(self, role: str, text: str):
+        """Records a turn, compacting older turns into the summary if needed."""
+        turn = Turn(role, text, count_tokens(text, self.model))
+        with self._lock:
+            if len(self._turns) == self._turns.maxlen:
+                self._unfolded.append(self._pop_oldest())
+            self._turns.append(turn)
+            self.turn_tokens += turn.tokens
+            if self.turn_tokens > self.budget_tokens:
+                self._compact()
+            fold = bool(self._unfolded)
+            self.backend.save(self.session_id, self.state())
+        if fold:
+            self._fold()
+
+    def add_exchange(self, prompt: str, response: str):
+        self.add("user", prompt)
+        self.add("assistant", response)
+
+    def _pop_oldest(self) -> Turn:
+        turn = self._turns.popleft()
+        self.turn_tokens -= turn.tokens
+        return turn
+
+    def _compact(self):
+        # Fold down to half the budget so compaction (and any summarizer call)
+        # happens once every few turns rather than on each one.
+        target = self.budget_tokens // 2
+        while len(self._turns) > self.keep_turns and self.turn_tokens > target:
+            self._unfolded.append(self._pop_oldest())
+
+    def _fold(self):
+        """Summarizes the pending turns without holding the lock."""
+        with self._fold_lock:
+            with self._lock:
+                turns, summary, generation = list(self._unfolded), self.summary, self._generation
+            if not turns:
+                return  # folded by the thread that held _fold_lock before us
+            summary = self.summarizer(summary, turns, self.summary_tokens)
+            summary_tokens = count_tokens(summary, self.model)
+            with self._lock:
+                if generation != self._generation:
+                    return
+                del self._unfolded[:len(turns)]
+                self.summary = summary
+                self.summary_token_count = summary_tokens
+                self.backend.save(self.session_id, self.state())
+
+    def state(self) -> dict:
+        with self._lock:
+            turns = [turn.to_dict() for turn in self._unfolded] + [turn.to_dict() for turn in self._turns]
+            return {"summary": self.summary, "turns": turns, "updated": time.time()}
+
+    def context_window(self, max_tokens: int | None = None) -> str:
+        """
+        The conversation so far as prompt text: the summary, then as many of
+        the most recent turns as fit in `max_tokens` (default: the budget).
+        Empty for a new conversation.
+        """
+        max_tokens = self.budget_tokens + self.summary_tokens if max_tokens is None else max_tokens
+        with self._lock:
+            summary = truncate_to_tokens(self.summary, max_tokens, self.model) if self.summary else ""
+            remaining = max_tokens - (count_tokens(summary, self.model) if summary else 0)
+            recent = []
+            for turn in reversed(self._unfolded + list(self._turns)):
+                if turn.tokens > remaining:
+                    break
+                recent.append(turn.render())
+                remaining -= turn.tokens
+
+        parts = []
+        if summary:
+            parts.append(f"Conversation summary:\n{summary}")
+        if recent:
+            parts.append("Recent conversation:\n" + "\n".join(reversed(recent)))
+        return "\n\n".join(parts)
+
+    def messages(self) -> list:
+        """Chat-API style messages: the summary as a system message, then the turns."""
+        with self._lock:
+            messages = [{"role": "system", "content": f"Conversation summary:\n{self.summary}"}] if self.summary else []
+            messages += [{"role": turn.role, "content": turn.text} for turn in self._unfolded + list(self._turns)]
+        return messages
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+            self._unfolded.clear()
+            self._generation += 1
+            self.turn_tokens = 0
+            self.summary = ""
+            self.summary_token_count = 0
+            self.backend.save(self.session_id, self.state())
+
+
+_sessions = OrderedDict()  # session id -> ConversationMemory
+_sessions_lock = threading.Lock()
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[MEMORY_BACKEND]()
+    return _backend
+
+
+def get_memory(session_id: str, model: str | None = None) -> ConversationMemory:
+    """The memory for `session_id`, loaded from the configured backend on
+    first use. At most MEMORY_MAX_SESSIONS stay resident. `model` is the
+    model the conversation talks to; new turns are counted with its
+    tokenizer."""
+    with _sessions_lock:
+        memory = _sessions.get(session_id)
+        if memory is not None and model is not None:
+            memory.model = model
+        if memory is None:
+            memory = ConversationMemory(session_id, backend=get_backend(), model=model)
+            _sessions[session_id] = memory
+            while len(_sessions) > MEMORY_MAX_SESSIONS:
+                _sessions.popitem(last=False)
+        _sessions.move_to_end(session_id)
+        return memory
@@ -0,0 +1,146 @@
+# utils/model_router.py
+
+import threading
+import time
+from collections import deque
+
+WINDOW = 200               # most recent calls kept per model
+MIN_SAMPLES = 5            # calls needed before error rate can open the breaker
+ERROR_RATE_TO_OPEN = 0.5
+CONSECUTIVE_FAILURES_TO_OPEN = 3
+OPEN_SECONDS = 30          # breaker cool-down before a half-open probe
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] if ordered else None
+
+
+class _ModelHealth:
+    __slots__ = ("calls", "consecutive_failures", "opened_at", "probing")
+
+    def __init__(self):
+        self.calls = deque(maxlen=WINDOW)  # (latency seconds, ok)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+
+
+class ModelRouter:
+    """
+    Rolling latency/error statistics and a circuit breaker per (provider, model).
+
+    A breaker opens after CONSECUTIVE_FAILURES_TO_OPEN failures in a row, or
+    when the windowed error rate reaches ERROR_RATE_TO_OPEN. After
+    OPEN_SECONDS it lets a single probe through (half-open); the probe's
+    outcome closes or re-opens it.
+    """
+
+    def __init__(self):
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def _get(self, provider, model) -> _ModelHealth:
+        key = (provider, model)
+        if key not in self._health:
+            self._health[key] = _ModelHealth()
+        return self._health[key]
+
+    def record(self, provider, model, latency: float, ok: bool):
+        with self._lock:
+            health = self._get(provider, model)
+            health.calls.append((latency, ok))
+            health.probing = False
+            if ok:
+                health.consecutive_failures = 0
+                health.opened_at = None
+                return
+            health.consecutive_failures += 1
+            errors = sum(1 for _, call_ok in health.calls if not call_ok)
+            if (health.consecutive_failures >= CONSECUTIVE_FAILURES_TO_OPEN
+                    or (len(health.calls) >= MIN_SAMPLES and errors / len(health.calls) >= ERROR_RATE_TO_OPEN)):
+                health.opened_at = time.monotonic()
+
+    def _state(self, health: _ModelHealth) -> str:
+        if health.opened_at is None:
+            return "closed"
+        if time.monotonic() - health.opened_at >= OPEN_SECONDS:
+            return "half-open"
+        return "open"
+
+    def claim(self, provider, model):
+        """
+        Asks the breaker to let one call through. Returns "closed" for an
+        ordinary call, "probe" when the caller got the single half-open
+        probe, or None when the call should go elsewhere. A probe is settled
+        by `record()`; a probe that ends without an outcome (cancelled) must
+        be handed back with `release_probe()`, or the model stays
+        unavailable.
+        """
+        with self._lock:
+            health = self._get(provider, model)
+            state = self._state(health)
+            if state == "closed":
+                return "closed"
+            if state == "half-open" and not health.probing:
+                health.probing = True
+                return "probe"
+            return None
+
+    def release_probe(self, provider, model):
+        """Gives back a probe claimed with `claim()` so the next caller can probe."""
+        with self._lock:
+            self._get(provider, model).probing = False
+
+    def is_available(self, provider, model, claim_probe: bool = False) -> bool:
+        """True if the breaker lets a call through; `claim_probe` reserves the
+        single half-open probe for the caller (see `claim`)."""
+        if claim_probe:
+            return self.claim(provider, model) is not None
+        with self._lock:
+            health = self._get(provider, model)
+            state = self._state(health)
+            return state == "closed" or (state == "half-open" and not health.probing)
+
+    def latency(self, provider, model, q: float = 50):
+        """The q-th percentile latency in seconds of successful calls, or None."""
+        with self._lock:
+            health = self._health.get((provider, model))
+            return _percentile([lat for lat, ok in health.calls if ok], q) if health else None
+
+    def rank(self, provider, models, preferred=None) -> list:
+        """
+        Orders `models` for routing: healthy models only, fastest p50 first.
+        Models without data rank after measured ones, except `preferred`,
+        which goes first until it has data of its own.
+        """
+        available = [m for m in models if self.is_available(provider, m)]
+
+        def sort_key(model):
+            p50 = self.latency(provider, model)
+            if p50 is not None:
+                return (1, p50)
+            return (0, 0.0) if model == preferred else (2, 0.0)
+
+        return sorted(available, key=sort_key)
+
+    def snapshot(self) -> dict:
+        """Live stats: {provider: {model: {...}}} for display and debugging."""
+        with self._lock:
+            items = list(self._health.items())
+        stats = {}
+        for (provider, model), health in items:
+            calls = list(health.calls)
+            ok_latencies = [lat for lat, ok in calls if ok]
+            p50, p95 = _percentile(ok_latencies, 50), _percentile(ok_latencies, 95)
+            stats.setdefault(provider, {})[model] = {
+                "samples": len(calls),
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "error_rate": round(sum(1 for _, ok in calls if not ok) / len(calls), 3) if calls else 0.0,
+                "circuit": self._state(health),
+            }
+        return stats
+
+
+router = ModelRouter()
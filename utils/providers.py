@@ -0,0 +1,572 @@
+# utils/providers.py
+
+import asyncio
+import base64
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import aclosing
+
+import httpx
+
+from config import PROVIDER_LIMITS
+from utils.admission import get_admission, get_caller
+from utils.logger import record, span
+from utils.model_router import router
+
+
+class ProviderError(RuntimeError):
+    """Raised when a provider rejects a request or returns no usable text."""
+
+
+# Where each provider's key is looked up when `api_key` is not passed.
+API_KEY_ENV = {
+    "OpenAI": "OPENAI_API_KEY",
+    "Gemini": "GEMINI_API_KEY",
+    "HuggingFace": "HUGGINGFACE_TOKEN",
+    "Custom": "CUSTOM_API_KEY",
+}
+
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+GEMINI_STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent"
+HUGGINGFACE_URL = "https://api-inference.huggingface.co/models/{model}"
+CUSTOM_URL = os.getenv("CUSTOM_MODEL_URL", "")  # any OpenAI-compatible /chat/completions endpoint
+
+# Cheap, unauthenticated requests against each provider's API host for
+# `warm_pool`: the status (401/404 included) is irrelevant, only the pooled
+# connection it leaves behind.
+WARM_URLS = {
+    "OpenAI": "https://api.openai.com/v1/models",
+    "Gemini": "https://generativelanguage.googleapis.com/v1beta/models",
+    "HuggingFace": "https://api-inference.huggingface.co/",
+}
+WARM_TIMEOUT = 5.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 2
+
+
+class RateLimiter:
+    """Token bucket: bursts of up to `burst` requests, `per_minute` sustained."""
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.rate = per_minute / 60.0
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            if self._updated is not None:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1  # may go negative: later callers queue behind this reservation
+            delay = -self._tokens / self.rate
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ProviderPool:
+    """
+    Shared HTTP/2 connection pool plus concurrency and rate limits for one
+    provider. Lives on the provider event loop.
+    """
+
+    def __init__(self, name: str, concurrency: int = 8, requests_per_minute: float = 0, timeout: float = 120):
+        self.name = name
+        self.client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(timeout, connect=10),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rate_limiter = RateLimiter(requests_per_minute, burst=concurrency)
+        self.in_flight = 0
+
+    async def post(self, url: str, **kwargs) -> dict:
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                for attempt in range(MAX_RETRIES + 1):
+                    await self.rate_limiter.acquire()
+                    response = await self.client.post(url, **kwargs)
+                    if response.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+                        retry_after = response.headers.get("retry-after", "")
+                        await asyncio.sleep(float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+                        continue
+                    if response.status_code >= 400:
+                        raise ProviderError(f"{self.name} returned {response.status_code}: {response.text[:300]}")
+                    return response.json()
+            finally:
+                self.in_flight -= 1
+
+    async def warm(self, url: str, timeout: float = WARM_TIMEOUT) -> str:
+        """Opens a keep-alive connection to `url`'s host with a HEAD request, so
+        the first real call skips DNS, TCP, TLS and HTTP/2 setup. Returns the
+        HTTP version negotiated; any status code counts as warm."""
+        response = await self.client.head(url, timeout=timeout)
+        return response.http_version
+
+    async def stream_lines(self, url: str, **kwargs):
+        """Yields the lines of a streaming POST response (e.g. server-sent events)."""
+        async with self.semaphore:
+            self.in_flight += 1
+            try:
+                await self.rate_limiter.acquire()
+                async with self.client.stream("POST", url, **kwargs) as response:
+                    if response.status_code >= 400:
+                        body = (await response.aread()).decode("utf-8", "replace")
+                        raise ProviderError(f"{self.name} returned {response.status_code}: {body[:300]}")
+                    async for line in response.aiter_lines():
+                        yield line
+            finally:
+                self.in_flight -= 1
+
+
+# --- Event loop shared by every Streamlit session in the process ---
+
+_loop = None
+_pools = {}
+_loop_lock = threading.Lock()
+_ttft_ms = defaultdict(lambda: deque(maxlen=1000))  # provider -> recent time-to-first-token
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Returns the background event loop that all provider I/O runs on."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="provider-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def get_pool(provider: str) -> ProviderPool:
+    """Returns the pool for `provider`; must be called on the provider loop."""
+    pool = _pools.get(provider)
+    if pool is None:
+        limits = PROVIDER_LIMITS.get(provider, PROVIDER_LIMITS.get("default", {}))
+        pool = _pools[provider] = ProviderPool(provider, **limits)
+    return pool
+
+
+async def warm_pool(provider: str, timeout: float = WARM_TIMEOUT):
+    """Creates `provider`'s pool and opens one connection to its API host.
+    Returns the HTTP version, or None for a provider with no host to warm."""
+    pool = get_pool(provider)
+    url = WARM_URLS.get(provider) or (CUSTOM_URL if provider == "Custom" else None)
+    return await pool.warm(url, timeout) if url else None
+
+
+def run_sync(coro, timeout=None):
+    """Runs a coroutine on the provider loop and blocks until it finishes.
+    After `timeout` seconds the coroutine is cancelled and TimeoutError raised."""
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] if ordered else None
+
+
+def provider_stats() -> dict:
+    """In-flight request counts and streaming time-to-first-token per provider."""
+    stats = {}
+    for name, pool in list(_pools.items()):
+        ttft = list(_ttft_ms[name])
+        stats[name] = {
+            "in_flight": pool.in_flight,
+            "ttft_p50_ms": _percentile(ttft, 50),
+            "ttft_p95_ms": _percentile(ttft, 95),
+            "streams": len(ttft),
+        }
+    return stats
+
+
+# --- Request builders ---
+
+def _resolve_api_key(provider, api_key, secrets):
+    if api_key:
+        return api_key
+    env_name = API_KEY_ENV.get(provider, "")
+    return (secrets or {}).get(env_name) or os.getenv(env_name, "")
+
+
+def _image_part(image):
+    """Returns (mime, base64 data) for raw image bytes, or None for a URL."""
+    if isinstance(image, (bytes, bytearray)):
+        mime = "image/png" if image[:8] == b"\x89PNG\r\n\x1a\n" else "image/jpeg"
+        return mime, base64.b64encode(image).decode("ascii")
+    return None
+
+
+def _openai_payload(prompt, model, temperature, top_p, tools, image):
+    content = prompt
+    if image is not None:
+        inline = _image_part(image)
+        url = f"data:{inline[0]};base64,{inline[1]}" if inline else image
+        content = [{"type": "text", "text": prompt}, {"type": "image_url", "image_url": {"url": url}}]
+    payload = {
+        "model": model,
+        "messages": [{"role": "user", "content": content}],
+        "temperature": temperature,
+        "top_p": top_p,
+    }
+    if tools and all(isinstance(tool, dict) for tool in tools):
+        payload["tools"] = tools
+    return payload
+
+
+async def _call_openai_compatible(pool, url, api_key, payload):
+    data = await pool.post(url, json=payload, headers={"Authorization": f"Bearer {api_key}"})
+    message = data["choices"][0]["message"]
+    if message.get("content"):
+        return message["content"]
+    if message.get("tool_calls"):
+        return str(message["tool_calls"])
+    raise ProviderError(f"{pool.name} returned an empty response")
+
+
+async def _call_gemini(pool, api_key, prompt, model, temperature, top_p, image):
+    parts = [{"text": prompt}]
+    inline = _image_part(image) if image is not None else None
+    if inline:
+        parts.append({"inline_data": {"mime_type": inline[0], "data": inline[1]}})
+    data = await pool.post(
+        GEMINI_URL.format(model=model),
+        params={"key": api_key},
+        json={
+            "contents": [{"role": "user", "parts": parts}],
+            "generationConfig": {"temperature": temperature, "topP": top_p},
+        },
+    )
+    try:
+        return "".join(part.get("text", "") for part in data["candidates"][0]["content"]["parts"])
+    except (KeyError, IndexError):
+        raise ProviderError(f"Gemini returned no candidates: {data.get('promptFeedback', data)}")
+
+
+async def _call_huggingface(pool, api_key, prompt, model, temperature, top_p):
+    data = await pool.post(
+        HUGGINGFACE_URL.format(model=model),
+        headers={"Authorization": f"Bearer {api_key}"},
+        json={
+            "inputs": prompt,
+            "parameters": {"temperature": max(temperature, 0.01), "top_p": top_p, "return_full_text": False},
+        },
+    )
+    if isinstance(data, list) and data and "generated_text" in data[0]:
+        return data[0]["generated_text"]
+    raise ProviderError(f"HuggingFace returned an unexpected payload: {str(data)[:300]}")
+
+
+async def _dispatch(provider, prompt, model, api_key, secrets, temperature, top_p, tools, image):
+    pool = get_pool(provider)
+    api_key = _resolve_api_key(provider, api_key, secrets)
+
+    if provider == "OpenAI":
+        payload = _openai_payload(prompt, model, temperature, top_p, tools, image)
+        return await _call_openai_compatible(pool, OPENAI_URL, api_key, payload)
+    if provider == "Gemini":
+        return await _call_gemini(pool, api_key, prompt, model, temperature, top_p, image)
+    if provider == "HuggingFace":
+        return await _call_huggingface(pool, api_key, prompt, model, temperature, top_p)
+    if provider == "Custom":
+        if not CUSTOM_URL:
+            raise ProviderError("Set CUSTOM_MODEL_URL to use the Custom provider")
+        payload = _openai_payload(prompt, model, temperature, top_p, tools, image)
+        return await _call_openai_compatible(pool, CUSTOM_URL, api_key, payload)
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+async def acall_agent(provider, prompt, model, api_key=None, secrets=None, temperature=0.7, top_p=1.0,
+                      tools=None, stream=False, image=None, memory_enabled=False, chaining_enabled=False):
+    """
+    Sends one prompt to `provider` and returns the full response text
+    (`stream` is ignored here; see `astream_agent`).
+
+    Runs on the provider loop: connections are pooled per provider and
+    requests queue behind config.PROVIDER_LIMITS rather than holding a
+    thread each. Latency and outcome feed the model router.
+    `memory_enabled` and `chaining_enabled` are accepted for compatibility
+    with existing callers; memory and chaining are handled above this layer.
+    """
+    started = time.perf_counter()
+    try:
+        result = await _dispatch(provider, prompt, model, api_key, secrets, temperature, top_p, tools, image)
+    except asyncio.CancelledError:
+        raise  # a cancelled hedge says nothing about the model's health
+    except Exception:
+        router.record(provider, model, time.perf_counter() - started, ok=False)
+        raise
+    router.record(provider, model, time.perf_counter() - started, ok=True)
+    return result
+
+
+async def acall_agent_routed(provider, prompt, model=None, min_tier=None, hedge=False, **kwargs):
+    """
+    `acall_agent` through the model router.
+
+    Uses `model` if its circuit is closed, otherwise the fastest healthy
+    preset meeting `min_tier` (by default `model`'s own tier, so a call is
+    never quietly served by a weaker model). With `hedge=True`, once the
+    primary has run longer than its own p95 a duplicate request goes to the
+    next-best model and whichever finishes first wins; the other is
+    cancelled. If every attempt fails, the next healthy model is tried once
+    before giving up.
+    """
+    text, _ = await _acall_routed(provider, prompt, model, min_tier, hedge, **kwargs)
+    return text
+
+
+async def _acall_routed(provider, prompt, model, min_tier, hedge, **kwargs):
+    """`acall_agent_routed`, returning (text, model that served it)."""
+    from model_selector import MODEL_TIERS, candidate_models  # model_selector pulls in streamlit
+
+    if min_tier is None:
+        min_tier = MODEL_TIERS.get(model, 1)
+    ranked = router.rank(provider, candidate_models(provider, min_tier), preferred=model)
+    claim = router.claim(provider, model) if model else None
+    if claim:
+        ranked = [model] + [m for m in ranked if m != model]
+    if not ranked:
+        raise ProviderError(f"No healthy {provider} model available at tier {min_tier}")
+
+    untried = list(ranked)
+    tasks = {}  # task -> model it calls
+
+    def launch():
+        chosen = untried.pop(0)
+        task = asyncio.ensure_future(acall_agent(provider, prompt, chosen, **kwargs))
+        tasks[task] = chosen
+
+    launch()
+    hedge_after = router.latency(provider, ranked[0], 95) if hedge else None
+    fallbacks_left = 1
+    last_error = None
+    try:
+        if hedge_after is not None and untried:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                launch()
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                served = tasks.pop(task)
+                if task.exception() is None:
+                    return task.result(), served
+                last_error = task.exception()
+            if not tasks and untried and fallbacks_left:
+                fallbacks_left -= 1
+                launch()
+        raise last_error
+    finally:
+        for task in tasks:
+            task.cancel()
+        if claim == "probe":
+            # A cancelled probe (hedge loser, caller timeout) records nothing;
+            # hand the claim back so the breaker can probe again.
+            router.release_probe(provider, model)
+
+
+def _sse_data(line: str):
+    return line[5:].strip() if line.startswith("data:") else None
+
+
+async def astream_agent(provider, prompt, model, api_key=None, secrets=None, temperature=0.7, top_p=1.0,
+                        tools=None, image=None, **_compat):
+    """
+    Async iterator over response text deltas from `provider`.
+
+    OpenAI, Custom and Gemini stream natively over server-sent events;
+    HuggingFace's inference API does not, so its full response arrives as
+    a single chunk.
+    """
+    pool = get_pool(provider)
+    api_key = _resolve_api_key(provider, api_key, secrets)
+
+    if provider in ("OpenAI", "Custom"):
+        url = OPENAI_URL if provider == "OpenAI" else CUSTOM_URL
+        if not url:
+            raise ProviderError("Set CUSTOM_MODEL_URL to use the Custom provider")
+        payload = _openai_payload(prompt, model, temperature, top_p, tools, image)
+        payload["stream"] = True
+        lines = pool.stream_lines(url, json=payload, headers={"Authorization": f"Bearer {api_key}"})
+        async with aclosing(lines):  # release the connection and semaphore on early exit
+            async for line in lines:
+                data = _sse_data(line)
+                if not data:
+                    continue
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+    elif provider == "Gemini":
+        parts = [{"text": prompt}]
+        inline = _image_part(image) if image is not None else None
+        if inline:
+            parts.append({"inline_data": {"mime_type": inline[0], "data": inline[1]}})
+        body = {
+            "contents": [{"role": "user", "parts": parts}],
+            "generationConfig": {"temperature": temperature, "topP": top_p},
+        }
+        url = GEMINI_STREAM_URL.format(model=model)
+        lines = pool.stream_lines(url, params={"alt": "sse", "key": api_key}, json=body)
+        async with aclosing(lines):
+            async for line in lines:
+                data = _sse_data(line)
+                if not data:
+                    continue
+                for candidate in json.loads(data).get("candidates", [])[:1]:
+                    parts = candidate.get("content", {}).get("parts", [])
+                    text = "".join(part.get("text", "") for part in parts)
+                    if text:
+                        yield text
+
+    else:
+        yield await _dispatch(provider, prompt, model, api_key, secrets, temperature, top_p, tools, image)
+
+
+def stream_agent(provider, prompt, model, on_complete=None, **kwargs):
+    """
+    Blocking generator over response text deltas, for `st.write_stream`.
+
+    The request runs on the provider loop and chunks are handed over as they
+    arrive. Time-to-first-token is recorded in `provider_stats()`. Once the
+    stream is exhausted, `on_complete(full_text)` is called, so logging still
+    sees the whole response. Closing the generator early cancels the request.
+
+    Streams are not hedged, but one whose model's circuit is open goes to
+    the router's fallback model (model_selector.get_fallback_model); the
+    "provider.stream" record names both.
+    """
+    requested = model
+    claim = router.claim(provider, model)
+    if claim is None:
+        from model_selector import get_fallback_model  # model_selector pulls in streamlit
+        model = get_fallback_model(provider, model) or model
+        if model != requested:
+            print(f"[Router] {provider} {requested} unavailable, streaming from {model}")
+    chunks = queue.Queue()
+    finished = object()
+    started = time.perf_counter()
+
+    async def pump():
+        deltas = astream_agent(provider, prompt, model, **kwargs)
+        try:
+            async with aclosing(deltas):
+                async for chunk in deltas:
+                    chunks.put(chunk)
+            router.record(provider, model, time.perf_counter() - started, ok=True)
+        except asyncio.CancelledError as e:
+            chunks.put(e)
+        except BaseException as e:
+            router.record(provider, model, time.perf_counter() - started, ok=False)
+            chunks.put(e)
+        finally:
+            chunks.put(finished)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), get_loop())
+    parts = []
+    try:
+        while True:
+            item = chunks.get()
+            if item is finished:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            if not parts:
+                _ttft_ms[provider].append((time.perf_counter() - started) * 1000)
+            parts.append(item)
+            yield item
+        record("provider.stream", (time.perf_counter() - started) * 1000, provider=provider, model=model,
+               requested_model=requested, ttft_ms=round(_ttft_ms[provider][-1], 1) if parts else None)
+        if on_complete:
+            on_complete("".join(parts))
+    finally:
+        future.cancel()
+        if claim == "probe":
+            router.release_probe(provider, model)  # a no-op once the outcome was recorded
+
+
+def call_agent(provider, prompt, model, api_key=None, secrets=None, temperature=0.7, top_p=1.0,
+               tools=None, stream=False, image=None, memory_enabled=False, chaining_enabled=False,
+               min_tier=None, hedge=False, deadline=None):
+    """
+    Blocking wrapper around `acall_agent_routed` for Streamlit pages and
+    tools: `model` is used while its circuit is closed, with the router's
+    fallback otherwise (see `acall_agent_routed` for `min_tier`/`hedge`).
+
+    With `stream=True` this returns a generator of text deltas instead of
+    the full text (see `stream_agent`).
+
+    The model that actually answered is set as `served_model` on the
+    "provider.call" span, and a fallback to another model is logged.
+
+    Every call is admitted by utils/admission first: it may queue behind
+    other users' calls, or raise ServerBusy when the queue is too long.
+
+    A `deadline` (a `time.monotonic()` value) cancels a non-streaming call
+    still running when it passes and raises TimeoutError, so a caller that
+    has given up does not keep the provider connection busy.
+    """
+    if stream:
+        return get_admission().admit_stream(stream_agent(
+            provider, prompt, model, api_key=api_key, secrets=secrets, temperature=temperature,
+            top_p=top_p, tools=tools, image=image,
+        ))
+    kwargs = dict(
+        api_key=api_key, secrets=secrets, temperature=temperature, top_p=top_p, tools=tools,
+        image=image, memory_enabled=memory_enabled, chaining_enabled=chaining_enabled,
+    )
+    with get_admission().admit(), span("provider.call", provider=provider, model=model) as call_span:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        text, served = run_sync(_acall_routed(provider, prompt, model, min_tier, hedge, **kwargs), timeout)
+        call_span.set(served_model=served)
+    if served != model:
+        print(f"[Router] {provider} {model} unavailable, served by {served}")
+    return text
+
+
+async def acall_agents_batch(requests: list[dict], return_exceptions: bool = True, caller=None) -> list:
+    """Runs many `acall_agent` requests (dicts of its arguments) concurrently,
+    subject to each provider's limits. Each request is admitted by
+    utils/admission like a `call_agent` call, on behalf of `caller` (a
+    (user, role) pair; default the current caller), so a batch cannot
+    bypass the global limit. Requests beyond the free slots wait their
+    fair turn rather than being shed, however large the batch. Results come
+    back in request order; failures are returned as exceptions unless
+    `return_exceptions` is False."""
+    user, role = caller or get_caller()
+    admission = get_admission()
+
+    async def admitted(request):
+        async with admission.admit_async(user, role, shed=False):
+            return await acall_agent(**request)
+
+    return await asyncio.gather(*(admitted(request) for request in requests),
+                                return_exceptions=return_exceptions)
+
+
+def call_agents_batch(requests: list[dict], return_exceptions: bool = True) -> list:
+    """Blocking wrapper around `acall_agents_batch`, admitted as the calling context's user."""
+    return run_sync(acall_agents_batch(requests, return_exceptions, get_caller()))
@@ -0,0 +1,94 @@
+# utils/reports.py
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from config import ANALYTICS_PATH
+from tools.export_logs import LOG_SCHEMA, WATERMARK_FILE
+
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+CATEGORICAL_COLUMNS = ["user", "role", "model"]
+
+
+def dataset_version(root: str = ANALYTICS_PATH) -> float:
+    """Changes whenever an export writes new data; use it as a cache key."""
+    path = os.path.join(root, WATERMARK_FILE)
+    return os.path.getmtime(path) if os.path.exists(path) else 0.0
+
+
+def load_logs(root: str = ANALYTICS_PATH, start=None, end=None, columns=None) -> pd.DataFrame:
+    """
+    Reads exported ai_logs from the Parquet dataset.
+
+    Args:
+        start, end: Optional inclusive date bounds ("YYYY-MM-DD" or date);
+            partitions outside them are never opened.
+        columns: Optional subset of columns to read.
+
+    Returns:
+        pd.DataFrame: one row per log, with user/role/model as categoricals.
+    """
+    wanted = columns or [name for name in LOG_SCHEMA.names if name != "date"]
+    if not os.path.isdir(root) or not any(name.startswith("date=") for name in os.listdir(root)):
+        return pd.DataFrame({name: pd.Series(dtype=LOG_SCHEMA.field(name).type.to_pandas_dtype())
+                             for name in wanted})
+
+    dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING, exclude_invalid_files=True)
+    date_filter = None
+    if start is not None:
+        date_filter = ds.field("date") >= str(start)
+    if end is not None:
+        upper = ds.field("date") <= str(end)
+        date_filter = upper if date_filter is None else date_filter & upper
+
+    read_columns = list(dict.fromkeys(wanted + ["doc_id"]))
+    table = dataset.to_table(columns=read_columns, filter=date_filter)
+    df = table.to_pandas()
+
+    # A re-export can leave the same document in two files.
+    df = df.drop_duplicates(subset="doc_id")
+    for column in CATEGORICAL_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("category")
+    return df[wanted].reset_index(drop=True)
+
+
+def usage_by(df: pd.DataFrame, key) -> pd.DataFrame:
+    """Requests, distinct users and response volume per `key` ("model", "role", "user" or a list)."""
+    grouped = df.groupby(key, observed=True)
+    usage = pd.DataFrame({
+        "requests": grouped.size(),
+        "users": grouped["user"].nunique(),
+        "total_response_length": grouped["response_length"].sum(),
+        "mean_response_length": grouped["response_length"].mean(),
+    })
+    return usage.sort_values("requests", ascending=False)
+
+
+def response_length_quantiles(df: pd.DataFrame, by="model", quantiles=(0.5, 0.9, 0.99)) -> pd.DataFrame:
+    """Response-length quantiles per group; one column per quantile."""
+    result = df.groupby(by, observed=True)["response_length"].quantile(list(quantiles)).unstack()
+    result.columns = [f"p{int(q * 100)}" for q in quantiles]
+    return result
+
+
+def response_length_histogram(df: pd.DataFrame, bins: int = 20) -> pd.DataFrame:
+    """Counts of responses per length bucket."""
+    counts, edges = np.histogram(df["response_length"].to_numpy(), bins=bins)
+    return pd.DataFrame({"start": edges[:-1], "end": edges[1:], "count": counts})
+
+
+def activity(df: pd.DataFrame, freq: str = "D", by=None) -> pd.DataFrame:
+    """
+    Requests per time bucket (`freq` is a pandas offset alias such as "h",
+    "D" or "W"), optionally split into one column per value of `by`.
+    """
+    series = df.set_index("timestamp")
+    if by is None:
+        return series.resample(freq).size().to_frame("requests")
+    return (series.groupby([pd.Grouper(freq=freq), by], observed=True).size()
+            .unstack(fill_value=0))
@@ -0,0 +1,185 @@
+# utils/response_cache.py
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_ROLES, RESPONSE_CACHE_TTL
+from tools.embedding import get_embedding
+from utils.providers import call_agent
+
+
+class _Entry:
+    __slots__ = ("partition", "vector", "response", "expires_at", "latency")
+
+    def __init__(self, partition, vector, response, expires_at, latency):
+        self.partition = partition
+        self.vector = vector
+        self.response = response
+        self.expires_at = expires_at
+        self.latency = latency
+
+
+class ResponseCache:
+    """
+    Model response cache with exact and nearest-neighbour lookups.
+
+    Entries are partitioned by (provider, model, system preset, temperature),
+    so a hit never crosses models or roles. A lookup first tries the exact
+    prompt, then the most similar cached prompt in the partition by cosine
+    similarity of their embeddings. Entries expire after `ttl` seconds and
+    the least recently used are evicted beyond `max_entries`.
+
+    Prompts are only embedded for semantic lookups. An entry stored without
+    an embedding (exact-only roles, or a failed embedding call) serves exact
+    hits only; an embedding error during lookup counts as a miss.
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 embed=get_embedding):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embed = embed
+        self._entries = OrderedDict()  # exact key -> _Entry
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "embed_errors": 0, "saved_seconds": 0.0}
+
+    @staticmethod
+    def partition(provider, model, system_prompt, temperature) -> str:
+        return json.dumps([provider, model, system_prompt, round(float(temperature), 3)])
+
+    @staticmethod
+    def exact_key(partition: str, prompt: str) -> str:
+        return hashlib.sha256(f"{partition}\0{prompt.strip()}".encode("utf-8")).hexdigest()
+
+    def _vector(self, prompt: str) -> np.ndarray:
+        vector = np.asarray(self.embed(prompt), dtype="float32")
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _hit(self, entry: _Entry, kind: str):
+        self.stats[kind] += 1
+        self.stats["saved_seconds"] += entry.latency
+        return entry.response
+
+    def lookup(self, partition: str, prompt: str, threshold: float | None):
+        """
+        Returns (response, vector). `response` is None on a miss; `vector` is
+        the prompt embedding computed for the semantic lookup, if any, to be
+        passed back to `store`. With `threshold` None only exact hits count
+        and the prompt is not embedded.
+        """
+        now = time.time()
+        key = self.exact_key(partition, prompt)
+        with self._lock:
+            for stale in [k for k, e in self._entries.items() if e.expires_at <= now]:
+                del self._entries[stale]
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return self._hit(entry, "exact_hits"), entry.vector
+            if threshold is None:
+                self.stats["misses"] += 1
+                return None, None
+            candidates = [(k, e) for k, e in self._entries.items()
+                          if e.partition == partition and e.vector is not None]
+
+        try:
+            vector = self._vector(prompt)
+        except Exception as e:
+            print(f"[ResponseCache] Embedding failed, treating as a miss: {type(e).__name__}: {e}")
+            with self._lock:
+                self.stats["embed_errors"] += 1
+                self.stats["misses"] += 1
+            return None, None
+        if candidates:
+            similarities = np.stack([e.vector for _, e in candidates]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                best_key, entry = candidates[best]
+                with self._lock:
+                    if best_key in self._entries:
+                        self._entries.move_to_end(best_key)
+                    return self._hit(entry, "semantic_hits"), vector
+        with self._lock:
+            self.stats["misses"] += 1
+        return None, vector
+
+    def store(self, partition: str, prompt: str, response: str, latency: float, vector=None):
+        """Caches `response`. `vector` is the embedding `lookup` returned; without
+        one the entry serves exact hits only, so storing never calls the embedder."""
+        key = self.exact_key(partition, prompt)
+        with self._lock:
+            self._entries[key] = _Entry(partition, vector, response, time.time() + self.ttl, latency)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def snapshot_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats, entries=len(self._entries))
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+
+_cache = ResponseCache()
+
+
+def response_cache_stats() -> dict:
+    """Hit counts, hit rate and model latency saved by the response cache."""
+    return _cache.snapshot_stats()
+
+
+def _reuse_policy(role, temperature, tools, image):
+    """The role's cache settings, or None when reusing a response isn't safe."""
+    policy = RESPONSE_CACHE_ROLES.get(role)
+    if not policy or tools or image is not None:
+        return None
+    if temperature > policy.get("max_temperature", 0.0):
+        return None
+    return policy
+
+
+def call_agent_cached(role, system_prompt, prompt, provider, model, temperature=0.7, top_p=1.0,
+                      tools=None, stream=False, image=None, cache=None, **call_kwargs):
+    """
+    `call_agent` for a preset role, served from the response cache when the
+    role opts in (config.RESPONSE_CACHE_ROLES) and the request is safe to
+    reuse: no tools, no image, temperature within the role's limit.
+
+    With `stream=True` a generator is returned either way; a hit yields the
+    cached response as a single chunk.
+    """
+    cache = cache or _cache
+    full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+    call = dict(provider=provider, prompt=full_prompt, model=model, temperature=temperature, top_p=top_p,
+                tools=tools, image=image, **call_kwargs)
+
+    policy = _reuse_policy(role, temperature, tools, image)
+    if policy is None:
+        return call_agent(stream=stream, **call)
+
+    partition = cache.partition(provider, model, system_prompt, temperature)
+    response, vector = cache.lookup(partition, prompt, policy.get("similarity"))
+    if response is not None:
+        return iter([response]) if stream else response
+
+    started = time.perf_counter()
+    if not stream:
+        response = call_agent(**call)
+        cache.store(partition, prompt, response, time.perf_counter() - started, vector)
+        return response
+
+    def stream_and_store():
+        parts = []
+        for chunk in call_agent(stream=True, **call):
+            parts.append(chunk)
+            yield chunk
+        cache.store(partition, prompt, "".join(parts), time.perf_counter() - started, vector)
+
+    return stream_and_store()
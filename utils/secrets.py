@@ -1,38 +1,205 @@
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from config import (SECRET_FETCH_WORKERS, SECRET_MANIFEST, SECRET_MISSING_PATH, SECRET_MISSING_RECHECK,
+                    SECRET_RETRY_SECONDS, SECRET_TTL)
+from utils.logger import span
+
 try:
     from google.cloud import secretmanager
+    from google.api_core import exceptions as gcp_exceptions
+    MISSING_ERRORS = (gcp_exceptions.NotFound,)
 except ImportError:
     secretmanager = None
+    MISSING_ERRORS = ()
 
 load_dotenv()
 
-def load_secrets(keys=None):
+
+class SecretLoader:
     """
-    Load secrets from Google Secret Manager or .env fallback.
-    If `keys` is provided, only those keys are loaded.
+    Fetches secrets from Google Secret Manager with one reused client.
+
+    Keys are fetched concurrently, and values are cached in process for
+    `ttl` seconds. After that the cached value is still returned, and a
+    background refresh replaces it. Keys that Secret Manager reports as
+    missing are read from the environment (including .env) instead, and
+    remembered in `missing_path`, so restarts skip their RPC until
+    `missing_recheck` seconds have passed.
+
+    Any other Secret Manager error is treated as transient: a refresh keeps
+    the cached value and retries after `retry_seconds`, doubling per
+    failure up to `ttl`. A first fetch has nothing cached, so it uses the
+    environment until a retry succeeds.
+
+    `client_factory` returns the Secret Manager client; tests can pass one
+    returning a fake with `access_secret_version(name=...)`.
     """
-    secrets = {}
-    project_id = os.getenv("GCP_PROJECT_ID")
 
-    if secretmanager and project_id:
-        client = secretmanager.SecretManagerServiceClient()
-        for key in (keys or os.environ.keys()):
+    def __init__(self, project_id=None, client_factory=None, ttl=SECRET_TTL, workers=SECRET_FETCH_WORKERS,
+                 missing_path=SECRET_MISSING_PATH, missing_recheck=SECRET_MISSING_RECHECK,
+                 missing_errors=MISSING_ERRORS, retry_seconds=SECRET_RETRY_SECONDS):
+        self.project_id = project_id if project_id is not None else os.getenv("GCP_PROJECT_ID")
+        if client_factory is None and secretmanager is not None:
+            client_factory = secretmanager.SecretManagerServiceClient
+        self.client_factory = client_factory
+        self.ttl = ttl
+        self.missing_path = missing_path
+        self.missing_recheck = missing_recheck
+        self.missing_errors = missing_errors
+        self.retry_seconds = retry_seconds
+        self._client = None
+        self._values = {}       # key -> (refresh due at, value)
+        self._failures = {}     # key -> consecutive failed fetches
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="secrets")
+        self._missing = self._load_missing()
+
+    @property
+    def remote(self) -> bool:
+        return bool(self.project_id and self.client_factory)
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self.client_factory()
+            return self._client
+
+    # --- negative cache of keys Secret Manager doesn't have ---
+
+    def _load_missing(self) -> dict:
+        try:
+            with open(self.missing_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _mark_missing(self, key):
+        with self._lock:
+            self._missing[key] = time.time()
+            missing = dict(self._missing)
+        try:
+            os.makedirs(os.path.dirname(self.missing_path) or ".", exist_ok=True)
+            tmp_path = self.missing_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(missing, f)
+            os.replace(tmp_path, self.missing_path)
+        except OSError:
+            pass
+
+    def _known_missing(self, key) -> bool:
+        marked = self._missing.get(key)
+        return marked is not None and time.time() - marked < self.missing_recheck
+
+    # --- fetching ---
+
+    def _fetch(self, key):
+        """
+        One key as (value, ok). The value comes from Secret Manager, or from
+        the environment when Secret Manager has no such key. `ok` is False
+        when Secret Manager could not be reached; the value is then the
+        environment's, for callers with nothing better.
+        """
+        if self.remote and not self._known_missing(key):
+            name = f"projects/{self.project_id}/secrets/{key}/versions/latest"
             try:
-                name = f"projects/{project_id}/secrets/{key}/versions/latest"
-                response = client.access_secret_version(name=name)
-                secrets[key] = response.payload.data.decode("UTF-8")
-            except Exception:
-                secrets[key] = os.getenv(key)
-    else:
-        for key in (keys or os.environ.keys()):
-            secrets[key] = os.getenv(key)
+                with span("secrets.fetch", key=key):
+                    response = self._get_client().access_secret_version(name=name)
+                value = response.payload.data.decode("UTF-8")
+                with self._lock:
+                    self._missing.pop(key, None)
+                return value, True
+            except self.missing_errors:
+                self._mark_missing(key)
+            except Exception as e:
+                print(f"[Secrets] {key}: Secret Manager unavailable ({type(e).__name__}: {e})")
+                return os.getenv(key), False
+        return os.getenv(key), True
 
-    return secrets
+    def _store(self, key, value, ok=True):
+        """Caches `value`; after a failed fetch the next attempt comes sooner, with backoff."""
+        with self._lock:
+            if ok:
+                self._failures.pop(key, None)
+                delay = self.ttl
+            else:
+                failures = self._failures[key] = self._failures.get(key, 0) + 1
+                delay = min(self.ttl, self.retry_seconds * 2 ** (failures - 1))
+            self._values[key] = (time.monotonic() + delay, value)
+            self._refreshing.discard(key)
+
+    def _refresh(self, key):
+        try:
+            value, ok = self._fetch(key)
+            if not ok:
+                with self._lock:
+                    value = self._values.get(key, (None, value))[1]  # keep serving what we had
+            self._store(key, value, ok)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_many(self, keys) -> dict:
+        """Values for `keys`; uncached keys are fetched concurrently."""
+        now = time.monotonic()
+        result, to_fetch = {}, []
+        with self._lock:
+            for key in keys:
+                cached = self._values.get(key)
+                if cached is None:
+                    to_fetch.append(key)
+                    continue
+                result[key] = cached[1]
+                if now >= cached[0] and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    self._executor.submit(self._refresh, key)
+
+        for key, (value, ok) in zip(to_fetch, self._executor.map(self._fetch, to_fetch)):
+            self._store(key, value, ok)
+            result[key] = value
+        return {key: result[key] for key in keys}
+
+    def get(self, key):
+        return self.get_many([key])[key]
+
+    def invalidate(self, key=None):
+        """Drops cached values (all, or one key) so the next read refetches."""
+        with self._lock:
+            if key is None:
+                self._values.clear()
+            else:
+                self._values.pop(key, None)
+
+
+_loader = None
+_loader_lock = threading.Lock()
+
+
+def get_secret_loader() -> SecretLoader:
+    global _loader
+    with _loader_lock:
+        if _loader is None:
+            _loader = SecretLoader()
+        return _loader
+
+
+def load_secrets(keys=None):
+    """
+    Load secrets from Google Secret Manager or .env fallback.
+    If `keys` is provided, only those keys are loaded; otherwise the keys
+    declared in config.SECRET_MANIFEST.
+    """
+    keys = list(keys or SECRET_MANIFEST)
+    with span("secrets.load", keys=len(keys)):
+        return get_secret_loader().get_many(keys)
 
 
 def explain_secrets(secrets):
     print("🔐 Loaded Secrets:")
     for k in secrets:
-        print(f" - {k}: {'✅' if secrets[k] else '⚠️ MISSING'}")
\ No newline at end of file
+        print(f" - {k}: {'✅' if secrets[k] else '⚠️ MISSING'}")
@@ -0,0 +1,230 @@
+# utils/startup.py
+
+import asyncio
+import importlib
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from config import (SHARDS_ENABLED, STARTUP_FIRST_RESPONSE_TARGET_MS, STARTUP_PRELOAD_MODULES, STARTUP_PROVIDERS,
+                    STARTUP_READY_TARGET_MS, STARTUP_TASKS, STARTUP_WORKERS)
+from utils.logger import record
+
+# Taken when this module is first imported: by tools/serve.py before anything
+# else, or by the first page when the app is started with `streamlit run`.
+PROCESS_STARTED = time.perf_counter()
+
+_ready = threading.Event()
+_report = {"tasks": {}, "imports": {}, "ready_ms": None, "first_response_ms": None}
+_lock = threading.Lock()
+
+
+def _since_start_ms() -> float:
+    return (time.perf_counter() - PROCESS_STARTED) * 1000
+
+
+def timed_import(name: str):
+    """Imports `name`, recording how long it took if it was not loaded yet."""
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    ms = (time.perf_counter() - started) * 1000
+    with _lock:
+        _report["imports"].setdefault(name, round(ms, 1))
+    return module
+
+
+# --- prewarm tasks: each creates a process-wide singleton the first request would otherwise pay for ---
+
+def _warm_secrets():
+    from utils.secrets import load_secrets
+    load_secrets()
+
+
+def _warm_firebase():
+    from utils.auth import init_firebase
+    init_firebase()
+
+
+def _warm_firestore():
+    from firebase_admin import firestore
+    firestore.client()
+
+
+def _warm_modules():
+    for name in STARTUP_PRELOAD_MODULES:
+        timed_import(name)
+
+
+def _warm_retriever():
+    if SHARDS_ENABLED:
+        from tools.shards import get_sharded_retriever
+        get_sharded_retriever()  # starts the workers and loads every shard
+        return None
+    from tools.retrieval import get_retriever
+    retriever = get_retriever()
+    if not os.path.exists(retriever.index_path):
+        return "no index"
+    retriever.snapshot()
+
+
+def _warm_providers():
+    from utils.providers import run_sync, warm_pool
+
+    async def connect():
+        return await asyncio.gather(*(warm_pool(provider) for provider in STARTUP_PROVIDERS),
+                                    return_exceptions=True)
+
+    # Each pool keeps the connection (TLS and HTTP/2 already negotiated) for
+    # the first model call; an unreachable host only costs that call the setup.
+    results = run_sync(connect())
+    failed = [f"{provider} ({type(result).__name__})" for provider, result in zip(STARTUP_PROVIDERS, results)
+              if isinstance(result, Exception)]
+    if failed:
+        raise RuntimeError(f"could not connect to {', '.join(failed)}")
+
+
+def _warm_tokenizer():
+    from utils.tokens import _codec
+    # Loads (and on first run downloads) the tiktoken encoding. Without it
+    # context packing silently estimates tokens from characters, so say so.
+    if _codec(None) is None:
+        raise RuntimeError("tiktoken encoding unavailable; token counts are character estimates")
+
+
+def _warm_code_pool():
+    from tools.code_interpreter import CODE_EXECUTION_ENABLED, get_code_pool
+    if not CODE_EXECUTION_ENABLED:
+        return "disabled"
+    get_code_pool()
+
+
+def _warm_log_writer():
+    from utils.log_writer import get_log_writer
+    get_log_writer()
+
+
+# name -> (function, names it must run after)
+TASKS = {
+    "secrets": (_warm_secrets, ()),
+    "firebase": (_warm_firebase, ("secrets",)),
+    "firestore": (_warm_firestore, ("firebase",)),
+    "modules": (_warm_modules, ()),
+    "retriever": (_warm_retriever, ("modules",)),
+    "providers": (_warm_providers, ("secrets", "modules")),
+    "tokenizer": (_warm_tokenizer, ()),
+    "code_pool": (_warm_code_pool, ()),
+    "log_writer": (_warm_log_writer, ("firebase",)),
+}
+
+
+def _run_task(name):
+    started = time.perf_counter()
+    status, error = "ok", None
+    try:
+        note = TASKS[name][0]()
+        if note:
+            status = f"skipped ({note})"
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+    ms = (time.perf_counter() - started) * 1000
+    record(f"startup.{name}", ms, status=status)
+    result = {"ms": round(ms, 1), "status": status}
+    if error:
+        result["error"] = error
+    return result
+
+
+def _set_task(name, result):
+    with _lock:
+        _report["tasks"][name] = result
+
+
+def prewarm(tasks=None, workers: int = STARTUP_WORKERS, deadline_ms: float = STARTUP_READY_TARGET_MS) -> dict:
+    """
+    Readiness hook: creates the shared resources named in `tasks` (default
+    config.STARTUP_TASKS) before the server takes traffic, running
+    independent tasks concurrently. A failed task does not stop start-up;
+    that resource is created lazily on first use as before.
+
+    Returns `startup_report()` at most `deadline_ms` after process start, so
+    a hung dependency (Secret Manager, Firestore) cannot keep the port
+    closed: tasks still running then finish in the background and fill in
+    their report entry, and tasks waiting on them are skipped.
+    """
+    selected = [name for name in (tasks or STARTUP_TASKS) if name in TASKS]
+    # Dependencies that were not selected are treated as already done.
+    pending = {name: {dep for dep in TASKS[name][1] if dep in selected} for name in selected}
+    done = set()
+    deadline = PROCESS_STARTED + deadline_ms / 1000
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prewarm")
+    running = {}
+    try:
+        while pending or running:
+            for name in [name for name, deps in pending.items() if deps <= done]:
+                del pending[name]
+                running[pool.submit(_run_task, name)] = name
+            finished, _ = wait(running, timeout=max(0.0, deadline - time.perf_counter()),
+                               return_when=FIRST_COMPLETED)
+            if not finished:
+                break
+            for future in finished:
+                name = running.pop(future)
+                _set_task(name, future.result())
+                done.add(name)
+    finally:
+        pool.shutdown(wait=False)
+
+    for future, name in running.items():
+        _set_task(name, {"ms": round(_since_start_ms(), 1), "status": "timed out (finishing in background)"})
+        future.add_done_callback(lambda future, name=name: _set_task(name, future.result()))
+    for name in pending:
+        _set_task(name, {"ms": 0.0, "status": "skipped (deadline)"})
+
+    with _lock:
+        _report["ready_ms"] = round(_since_start_ms(), 1)
+    record("startup.ready", _report["ready_ms"])
+    _ready.set()
+    return startup_report()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def wait_ready(timeout: float | None = None) -> bool:
+    return _ready.wait(timeout)
+
+
+def mark_first_response():
+    """Call once a page has rendered; the first call per process records the
+    time since process start and warns above the target."""
+    with _lock:
+        if _report["first_response_ms"] is not None:
+            return
+        _report["first_response_ms"] = ms = round(_since_start_ms(), 1)
+    record("startup.first_response", ms)
+    if ms > STARTUP_FIRST_RESPONSE_TARGET_MS:
+        print(f"[Startup] ⚠️ First response after {ms:.0f} ms (target {STARTUP_FIRST_RESPONSE_TARGET_MS} ms)")
+
+
+def startup_report() -> dict:
+    """Per-task prewarm timings and status, import times, and ms from
+    process start to ready and to the first rendered page."""
+    with _lock:
+        return {"tasks": dict(_report["tasks"]), "imports": dict(_report["imports"]),
+                "ready_ms": _report["ready_ms"], "first_response_ms": _report["first_response_ms"],
+                "ready_target_ms": STARTUP_READY_TARGET_MS,
+                "first_response_target_ms": STARTUP_FIRST_RESPONSE_TARGET_MS}
+
+
+def print_report(report: dict):
+    for name, task in sorted(report["tasks"].items(), key=lambda item: -item[1]["ms"]):
+        icon = "✅" if task["status"] == "ok" else "⏭️" if task["status"].startswith("skipped") else "⚠️"
+        detail = task.get("error") or ("" if task["status"] == "ok" else task["status"])
+        print(f"[Startup] {icon} {name:<11}{task['ms']:>9.1f} ms  {detail}")
+    for name, ms in sorted(report["imports"].items(), key=lambda item: -item[1]):
+        print(f"[Startup]    import {name:<32}{ms:>9.1f} ms")
+    ready = report["ready_ms"]
+    over = ready is not None and ready > report["ready_target_ms"]
+    print(f"[Startup] {'⚠️' if over else '🚀'} Ready after {ready:.0f} ms (target {report['ready_target_ms']} ms)")
@@ -0,0 +1,135 @@
+# utils/step_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+
+# Tools whose input is whitespace- and case-sensitive (source code).
+EXACT_INPUT_TOOLS = {"code"}
+
+
+def normalize_input(tool: str, text) -> str:
+    """Whitespace- and case-insensitive form of a step input; code is only
+    stripped, since indentation and case change its meaning."""
+    if tool in EXACT_INPUT_TOOLS:
+        return str(text).strip()
+    return " ".join(str(text).split()).lower()
+
+
+def step_key(tool: str, input_text, config=()) -> str:
+    """Cache key for one step: the tool, its normalized input and whatever
+    configuration changes its output (e.g. the index version)."""
+    payload = json.dumps([tool, normalize_input(tool, input_text), list(config)], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StepCache:
+    """
+    Cross-request cache for chain step results.
+
+    Entries expire after the TTL configured for their tool; tools without a
+    TTL are never cached. The in-process tier is an LRU bounded to
+    `max_entries`. With `path` set, entries are also written through to a
+    SQLite file so they survive restarts and are shared between workers.
+    Values must be JSON-serializable.
+    """
+
+    def __init__(self, ttls: dict, max_entries: int = 1024, path: str | None = None):
+        self.ttls = dict(ttls)
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()  # key -> (expires_at, value, tool)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0, "evictions": 0})
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = self._conn()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS steps (key TEXT PRIMARY KEY, tool TEXT, expires_at REAL, value TEXT)"
+            )
+            conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def caches(self, tool: str) -> bool:
+        return bool(self.ttls.get(tool))
+
+    def _store(self, tool: str, key: str, expires_at: float, value):
+        with self._lock:
+            self._entries[key] = (expires_at, value, tool)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                _, (_, _, evicted_tool) = self._entries.popitem(last=False)
+                self._stats[evicted_tool]["evictions"] += 1
+
+    def get(self, tool: str, key: str):
+        """Returns (hit, value) for `key`."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._stats[tool]["hits"] += 1
+                return True, entry[1]
+            if entry:
+                del self._entries[key]
+
+        if self.path:
+            row = self._conn().execute(
+                "SELECT expires_at, value FROM steps WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row:
+                value = json.loads(row[1])
+                self._store(tool, key, row[0], value)
+                with self._lock:
+                    self._stats[tool]["hits"] += 1
+                return True, value
+
+        with self._lock:
+            self._stats[tool]["misses"] += 1
+        return False, None
+
+    def put(self, tool: str, key: str, value):
+        ttl = self.ttls.get(tool)
+        if not ttl:
+            return
+        expires_at = time.time() + ttl
+        self._store(tool, key, expires_at, value)
+        if self.path:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO steps (key, tool, expires_at, value) VALUES (?, ?, ?, ?)",
+                (key, tool, expires_at, json.dumps(value)),
+            )
+            conn.execute("DELETE FROM steps WHERE expires_at <= ?", (time.time(),))
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.path:
+            conn = self._conn()
+            conn.execute("DELETE FROM steps")
+            conn.commit()
+
+    def stats(self) -> dict:
+        """Per-tool hits, misses, evictions and hit rate."""
+        with self._lock:
+            stats = {tool: dict(counts) for tool, counts in self._stats.items()}
+        for counts in stats.values():
+            lookups = counts["hits"] + counts["misses"]
+            counts["hit_rate"] = counts["hits"] / lookups if lookups else 0.0
+        return stats
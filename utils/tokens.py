@@ -0,0 +1,71 @@
+# utils/tokens.py
+
+import math
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+CHARS_PER_TOKEN = 4  # estimate used when no tokenizer is available
+
+
+class _Codec:
+    __slots__ = ("encode", "decode")
+
+    def __init__(self, encode, decode):
+        self.encode = encode
+        self.decode = decode
+
+
+def _tiktoken_codec(model):
+    try:
+        encoding = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return _Codec(lambda text: encoding.encode(text, disallowed_special=()), encoding.decode)
+
+
+@lru_cache(maxsize=32)
+def _codec(model):
+    """The tokenizer for `model`: its Hugging Face tokenizer for hub ids
+    ("org/name"), tiktoken otherwise; None when neither is available."""
+    if model and "/" in model and Tokenizer is not None:
+        try:
+            tokenizer = Tokenizer.from_pretrained(model)
+            return _Codec(lambda text: tokenizer.encode(text, add_special_tokens=False).ids, tokenizer.decode)
+        except Exception as e:
+            print(f"[Tokens] No tokenizer for {model}, falling back: {e}")
+    if tiktoken is not None:
+        try:
+            return _tiktoken_codec(model)
+        except Exception as e:  # encodings are downloaded on first use; offline that fails
+            print(f"[Tokens] tiktoken unavailable, estimating token counts: {e}")
+    return None
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """Tokens in `text` for `model`: exact when its tokenizer is available, else a character-based estimate."""
+    if not text:
+        return 0
+    codec = _codec(model)
+    if codec is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(codec.encode(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str | None = None) -> str:
+    """`text` cut to at most `max_tokens` tokens."""
+    if max_tokens <= 0:
+        return ""
+    codec = _codec(model)
+    if codec is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = codec.encode(text)
+    return text if len(tokens) <= max_tokens else codec.decode(tokens[:max_tokens])